@@ -0,0 +1,524 @@
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import lead_store
+
+
+# Columns computed from stored lead fields when an aggregation needs them
+DERIVED_COLUMNS = {
+    'weighted_value': lambda leads: leads['total_deal_value_annual'] * leads['probability'] / 100,
+    'month': lambda leads: leads['first_contact_date'].dt.to_period('M'),
+    'close_month': lambda leads: leads['expected_close_date'].dt.to_period('M'),
+}
+
+# Per-group pipeline figures shared by the analytics pages, as
+# (output column, input column, aggregation)
+PIPELINE_SUMMARY = (
+    ('lead_count', 'institution_name', 'count'),
+    ('total_value', 'total_deal_value_annual', 'sum'),
+    ('avg_value', 'total_deal_value_annual', 'mean'),
+    ('weighted_value', 'weighted_value', 'sum'),
+    ('avg_probability', 'probability', 'mean'),
+    ('avg_monthly_price', 'monthly_price', 'mean'),
+)
+
+# Stored columns the pipeline summary can group by or aggregate
+SUMMARY_COLUMNS = (
+    'institution_name', 'territory', 'category', 'stage', 'lead_source',
+    'first_contact_date', 'expected_close_date',
+    'total_deal_value_annual', 'probability', 'monthly_price'
+)
+
+
+# Risk flags, one bit each in the order of RISK_FLAGS
+RISK_FLAGS = ("Aging", "Low Probability", "Large Deal")
+AGING, LOW_PROBABILITY, LARGE_DEAL = 1, 2, 4
+
+# "Risk Factors" label for every combination of flags, indexed by bitmask
+RISK_LABELS = np.array([
+    ' | '.join(flag for bit, flag in enumerate(RISK_FLAGS) if mask & (1 << bit))
+    for mask in range(1 << len(RISK_FLAGS))
+], dtype=object)
+
+# Default risk thresholds: days since last contact, probability in percent,
+# and deal value as a multiple of the average deal
+AGING_DAYS = 30
+MIN_PROBABILITY = 40
+LARGE_DEAL_RATIO = 1.5
+
+# Outliers drawn on a box plot are sampled down to at most this many
+MAX_BOX_OUTLIERS = 200
+
+# Stages counted as open opportunities and as decided deals in territory KPIs
+ACTIVE_STAGES = ('Qualified', 'Demo', 'Proposal', 'Negotiation')
+CLOSED_STAGES = ('Closed Won', 'Closed Lost')
+
+
+def _quarter_start(day):
+    return day.replace(month=((day.month - 1) // 3) * 3 + 1, day=1)
+
+
+def resolve_period(period, today=None, custom_range=None, calendar_quarters=False):
+    """Resolve a period label to inclusive (start, end) timestamps
+
+    Either bound may be None for an open-ended period. "Last Quarter" is the
+    trailing 90 days unless calendar_quarters is set, in which case it is the
+    previous calendar quarter.
+    """
+    today = pd.Timestamp(today or datetime.now().date()).normalize()
+
+    if period == "Custom Range":
+        return pd.Timestamp(custom_range[0]), pd.Timestamp(custom_range[-1])
+    if period == "Last 30 Days":
+        return today - pd.Timedelta(days=30), today
+    if period == "Last Quarter":
+        if calendar_quarters:
+            last_quarter_end = _quarter_start(today) - pd.Timedelta(days=1)
+            return _quarter_start(last_quarter_end), last_quarter_end
+        return today - pd.Timedelta(days=90), today
+    if period == "Current Quarter":
+        return _quarter_start(today), today
+    if period == "Last 6 Months":
+        return today - pd.Timedelta(days=180), today
+    if period == "Year to Date":
+        return today.replace(month=1, day=1), today
+
+    # Forecast horizons cover everything expected to close before their end
+    if period == "Next Quarter":
+        return None, today + pd.Timedelta(days=90)
+    if period == "Next 6 Months":
+        return None, today + pd.Timedelta(days=180)
+    if period == "Next Year":
+        return None, today + pd.Timedelta(days=365)
+
+    # All Time
+    return None, None
+
+
+def risk_flags(leads, aging_days=AGING_DAYS, min_probability=MIN_PROBABILITY,
+               large_deal_ratio=LARGE_DEAL_RATIO, average_deal=None, today=None):
+    """Return a bitmask of risk flags for every lead
+
+    A deal is aging if it was last contacted more than aging_days ago, and
+    large if it is worth more than large_deal_ratio times average_deal
+    (by default the mean over leads).
+    """
+    today = pd.Timestamp(today or datetime.now().date()).normalize()
+    values = leads['total_deal_value_annual'].to_numpy(dtype=float, na_value=np.nan)
+    if average_deal is None:
+        average_deal = np.nanmean(values) if np.any(~np.isnan(values)) else np.nan
+    last_contact = leads['last_contact_date'].to_numpy(dtype='datetime64[ns]')
+    probability = leads['probability'].to_numpy()
+
+    # Comparisons against NaT or NaN are False, so missing values raise no flag
+    cutoff = (today - pd.Timedelta(days=aging_days)).to_datetime64()
+    flags = np.where(last_contact < cutoff, AGING, 0).astype(np.uint8)
+    flags |= np.where(probability < min_probability, LOW_PROBABILITY, 0).astype(np.uint8)
+    flags |= np.where(values > average_deal * large_deal_ratio, LARGE_DEAL, 0).astype(np.uint8)
+    return flags
+
+
+def risk_counts(leads, flags, by):
+    """Count at-risk leads per group, in total and for each flag"""
+    counts = pd.DataFrame(
+        {flag: (flags & (1 << bit)) > 0 for bit, flag in enumerate(RISK_FLAGS)},
+        index=leads.index
+    ).assign(**{'At Risk': flags > 0, by: leads[by]})
+    return counts.groupby(by, observed=True).sum().sort_values('At Risk', ascending=False)
+
+
+def territory_kpis(leads, targets=None):
+    """Compute every territory's KPIs in one grouped pass
+
+    Stage tests and the sales cycle are evaluated once over the whole frame
+    as flag columns, so each KPI is a plain sum or mean per group. targets
+    maps territory to {'target_institutions', 'potential_students'}; when
+    given, the result covers exactly those territories, with coverage in
+    percent.
+    """
+    stage = leads['stage']
+    won = (stage == 'Closed Won').to_numpy(dtype=bool, na_value=False)
+    cycle = leads['actual_close_date'] - leads['first_contact_date']
+    flags = pd.DataFrame({
+        'territory': leads['territory'],
+        'institution_name': leads['institution_name'],
+        'students': leads['current_student_count'],
+        'value': leads['total_deal_value_annual'],
+        'won': won,
+        'closed': stage.isin(CLOSED_STAGES).to_numpy(dtype=bool),
+        'active': stage.isin(ACTIVE_STAGES).to_numpy(dtype=bool),
+        'cycle_days': (cycle / pd.Timedelta(days=1)).where(won),
+    }, index=leads.index)
+
+    totals = flags.groupby('territory', observed=True).agg(
+        total_value=('value', 'sum'),
+        leads=('won', 'size'),
+        won=('won', 'sum'),
+        closed=('closed', 'sum'),
+        active=('active', 'sum'),
+        cycle_days=('cycle_days', 'mean'),
+        institutions=('institution_name', 'nunique'),
+        students=('students', 'sum'),
+    )
+
+    closed = totals['closed'].where(totals['closed'] > 0)
+    kpis = pd.DataFrame({
+        'Total Pipeline': totals['total_value'],
+        'Lead Conversion Rate': totals['won'] / totals['leads'] * 100,
+        'Avg Sales Cycle': np.floor(totals['cycle_days']).fillna(0),
+        'Active Opportunities': totals['active'],
+        'Win Rate': (totals['won'] / closed * 100).fillna(0),
+        'Current Institutions': totals['institutions'],
+        'Current Students': totals['students'],
+    })
+    if targets is None:
+        return kpis
+
+    kpis = kpis.set_axis(kpis.index.astype(object)).reindex(list(targets), fill_value=0)
+    kpis['Target Institutions'] = [target['target_institutions'] for target in targets.values()]
+    kpis['Target Students'] = [target['potential_students'] for target in targets.values()]
+    kpis['Institution Coverage'] = kpis['Current Institutions'] / kpis['Target Institutions'] * 100
+    kpis['Student Coverage'] = kpis['Current Students'] / kpis['Target Students'] * 100
+    return kpis
+
+
+def histogram(values, bins=20):
+    """Bin values for a histogram, returning (counts, bin edges)
+
+    Missing values are left out. Only the bins reach the chart, so its size
+    does not grow with the number of values.
+    """
+    values = _finite(values)
+    if not values.size:
+        return np.zeros(0, dtype=np.int64), np.zeros(0)
+    return np.histogram(values, bins=bins)
+
+
+def box_summary(values, max_outliers=MAX_BOX_OUTLIERS, seed=0):
+    """Quartiles, whiskers and a sample of outliers for a box plot, or None
+
+    Quartiles are linearly interpolated and whiskers reach the furthest
+    values within 1.5 IQR of the box, as plotly computes them from raw
+    data. Outliers beyond max_outliers are sampled with a fixed seed so the
+    chart is stable between reruns.
+    """
+    values = _finite(values)
+    if not values.size:
+        return None
+    q1, median, q3 = np.percentile(values, [25, 50, 75])
+    iqr = q3 - q1
+    inside = values[(values >= q1 - 1.5 * iqr) & (values <= q3 + 1.5 * iqr)]
+    lower, upper = inside.min(), inside.max()
+    outliers = values[(values < lower) | (values > upper)]
+    outlier_count = len(outliers)
+    if outlier_count > max_outliers:
+        outliers = np.random.default_rng(seed).choice(outliers, max_outliers, replace=False)
+    return {
+        'count': len(values),
+        'mean': float(values.mean()),
+        'q1': float(q1),
+        'median': float(median),
+        'q3': float(q3),
+        'lower': float(lower),
+        'upper': float(upper),
+        'outliers': outliers,
+        'outlier_count': outlier_count,
+    }
+
+
+def _finite(values):
+    if isinstance(values, pd.Series):
+        values = values.to_numpy(dtype=float, na_value=np.nan)
+    values = np.asarray(values, dtype=float)
+    return values[np.isfinite(values)]
+
+
+def aggregate(leads, by, aggregations=PIPELINE_SUMMARY):
+    """Group leads by one or more columns and apply named aggregations
+
+    by and the aggregation inputs may name DERIVED_COLUMNS, which are only
+    computed when used.
+    """
+    by = [by] if isinstance(by, str) else list(by)
+    used = set(by) | {column for _, column, _ in aggregations}
+    derived = {
+        column: build(leads) for column, build in DERIVED_COLUMNS.items() if column in used
+    }
+    if derived:
+        leads = leads.assign(**derived)
+    return leads.groupby(by, observed=True).agg(**{
+        name: (column, function) for name, column, function in aggregations
+    })
+
+
+def rollup_summary(rollup, by):
+    """PIPELINE_SUMMARY figures from monthly rollup rows, grouped by rollup columns
+
+    Every summary figure is a sum or a ratio of sums, so grouping the rollup
+    gives the same result as aggregate() over the leads it was built from.
+    """
+    by = [by] if isinstance(by, str) else list(by)
+    sums = rollup.groupby(by, observed=True)[list(lead_store.ROLLUP_FIELDS)].sum()
+    return pd.DataFrame({
+        'lead_count': sums['count'].astype(np.int64),
+        'total_value': sums['value'],
+        'avg_value': sums['value'] / sums['valued'].where(sums['valued'] > 0),
+        'weighted_value': sums['weighted'],
+        'avg_probability': sums['probability'] / sums['count'],
+        'avg_monthly_price': sums['monthly_price'] / sums['priced'].where(sums['priced'] > 0),
+    })
+
+
+def cube_summary(cube, by):
+    """Count and value columns of PIPELINE_SUMMARY from a lead cube, grouped by its axes
+
+    The cube keeps no probability or price sums, so avg_probability and
+    avg_monthly_price are left out.
+    """
+    by = [by] if isinstance(by, str) else list(by)
+    sums = cube.roll_up(by).frame()
+    return pd.DataFrame({
+        'lead_count': sums['count'].astype(np.int64),
+        'total_value': sums['value'],
+        'avg_value': sums['value'] / sums['valued'].where(sums['valued'] > 0),
+        'weighted_value': sums['weighted'],
+    })
+
+
+class AggregateCache:
+    """Process-wide LRU cache of aggregation results
+
+    Keys start with the dataset version, so a write makes every earlier
+    entry unreachable; those entries are dropped as soon as a newer version
+    is seen. The cache holds at most max_entries results and max_bytes of
+    result data, evicting the least recently used first.
+    """
+
+    def __init__(self, max_entries=256, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._version = None
+        self._lock = threading.Lock()
+
+    def get(self, key, compute):
+        """Return the cached result for key, computing and storing it on a miss"""
+        version = key[0]
+        with self._lock:
+            if version != self._version:
+                if self._version is None or version > self._version:
+                    self._entries.clear()
+                    self._bytes = 0
+                    self._version = version
+            elif key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            self.misses += 1
+
+        result = compute()
+        size = _result_bytes(result)
+        with self._lock:
+            # Results of an older version than the current one are not kept
+            if version != self._version or size > self.max_bytes:
+                return result
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (result, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+        return result
+
+
+def _result_bytes(result):
+    if isinstance(result, pd.DataFrame):
+        return int(result.memory_usage(deep=True).sum())
+    if isinstance(result, pd.Series):
+        return int(result.memory_usage(deep=True))
+    if isinstance(result, tuple):
+        return sum(_result_bytes(item) for item in result)
+    if isinstance(result, dict):
+        return sum(_result_bytes(item) for item in result.values())
+    return int(getattr(result, 'nbytes', 64))
+
+
+def stage_intervals(lead_ids, first_contact, current_stage, events):
+    """Turn stage-change events into the time each lead spent in each stage
+
+    lead_ids, first_contact and current_stage describe every lead. events
+    holds lead_id, timestamp, stage_from and stage_to, sorted by lead_id and
+    then timestamp, as lead_store.load_stage_events returns them. A lead
+    enters its first stage on its first contact date. Each event then closes
+    the lead's current interval and opens the next one.
+
+    Completed intervals are returned grouped by stage, so summaries only
+    slice them; each lead's open interval is kept per lead, since its length
+    depends on when it is measured.
+    """
+    order = np.argsort(lead_ids, kind='stable')
+    lead_ids = np.asarray(lead_ids)[order]
+    first_contact = np.asarray(first_contact, dtype='datetime64[ns]')[order]
+    current_codes = _stage_codes(current_stage)[order]
+    n_leads, n_stages = len(lead_ids), len(lead_store.STAGES)
+
+    # Drop events whose lead no longer exists
+    positions, known = _locate_sorted(lead_ids, events['lead_id'].to_numpy())
+    positions = positions[known]
+    event_times = events['timestamp'].to_numpy(dtype='datetime64[ns]')[known]
+    from_codes = _stage_codes(events['stage_from'])[known]
+    to_codes = _stage_codes(events['stage_to'])[known]
+
+    # A lead's first stage is where its first event started from
+    counts = np.bincount(positions, minlength=n_leads)
+    first_event = np.cumsum(counts) - counts
+    initial_codes = current_codes.copy()
+    has_events = counts > 0
+    initial_codes[has_events] = from_codes[first_event[has_events]]
+
+    # Lay out each lead's entry interval followed by one interval per event
+    entry_slots = np.arange(n_leads) + first_event
+    event_slots = np.arange(len(positions)) + positions + 1
+    size = n_leads + len(positions)
+
+    lead_pos = np.empty(size, dtype=np.int64)
+    lead_pos[entry_slots] = np.arange(n_leads)
+    lead_pos[event_slots] = positions
+    stage = np.empty(size, dtype=np.int8)
+    stage[entry_slots] = initial_codes
+    stage[event_slots] = to_codes
+    start = np.empty(size, dtype='datetime64[ns]')
+    start[entry_slots] = first_contact
+    start[event_slots] = event_times
+
+    # An interval ends where the same lead's next one starts; the last one
+    # of each lead is still open
+    last_slots = np.append(entry_slots[1:], size) - 1 if n_leads else entry_slots
+    closed = np.ones(size, dtype=bool)
+    closed[last_slots] = False
+    days = np.full(size, np.nan)
+    days[:-1][closed[:-1]] = (start[1:] - start[:-1])[closed[:-1]] / np.timedelta64(1, 'D')
+
+    # Closed stages are absorbing, so only open stages accrue time
+    won = lead_store.STAGES.index("Closed Won")
+    lost = lead_store.STAGES.index("Closed Lost")
+    completed = closed & (stage >= 0) & (stage < won) & ~np.isnan(days)
+    by_stage = np.argsort(stage[completed], kind='stable')
+
+    # Per-lead funnel progress; intervals are contiguous per lead
+    furthest = np.empty(0, dtype=np.int8)
+    ever_lost = np.empty(0, dtype=bool)
+    if n_leads:
+        furthest = np.maximum.reduceat(np.where(stage == lost, -1, stage), entry_slots)
+        ever_lost = np.maximum.reduceat(stage == lost, entry_slots)
+
+    # One from-stage by to-stage cell number per event, -1 if either is unknown
+    transition = np.where(
+        (from_codes >= 0) & (to_codes >= 0), from_codes * n_stages + to_codes, -1
+    ).astype(np.int16)
+
+    return {
+        'lead_ids': lead_ids,
+        'current': stage[last_slots],
+        'current_since': start[last_slots],
+        'furthest': furthest,
+        'ever_lost': ever_lost,
+        'stage_bounds': np.searchsorted(stage[completed][by_stage], np.arange(n_stages + 1)),
+        'completed_days': np.maximum(days[completed][by_stage], 0),
+        'completed_leads': lead_pos[completed][by_stage],
+        'transition': transition,
+        'event_leads': positions,
+    }
+
+
+def stage_flow(intervals, lead_ids=None, now=None):
+    """Summarize time in stage, funnel conversion and velocity per stage
+
+    lead_ids restricts the summary to a subset of leads. Returns a frame
+    indexed by stage and a from-stage by to-stage matrix of transition
+    counts.
+    """
+    now = np.datetime64(pd.Timestamp(now or datetime.now()), 'ns')
+    n_leads, n_stages = len(intervals['lead_ids']), len(lead_store.STAGES)
+    won = lead_store.STAGES.index("Closed Won")
+    lost = lead_store.STAGES.index("Closed Lost")
+
+    lead_mask = None
+    transition = intervals['transition']
+    if lead_ids is not None:
+        positions, found = _locate_sorted(intervals['lead_ids'], np.asarray(lead_ids))
+        lead_mask = np.zeros(n_leads, dtype=bool)
+        lead_mask[positions[found]] = True
+        transition = transition[lead_mask[intervals['event_leads']]]
+
+    # Completed intervals are already grouped by stage
+    spans = np.zeros(n_stages, dtype=np.int64)
+    total_days = np.zeros(n_stages)
+    median_days = np.full(n_stages, np.nan)
+    bounds = intervals['stage_bounds']
+    for code in range(won):
+        days = intervals['completed_days'][bounds[code]:bounds[code + 1]]
+        if lead_mask is not None:
+            days = days[lead_mask[intervals['completed_leads'][bounds[code]:bounds[code + 1]]]]
+        if len(days):
+            spans[code] = len(days)
+            total_days[code] = days.sum()
+            median_days[code] = np.median(days)
+
+    # Open intervals count towards time in stage up to now
+    current, since = intervals['current'], intervals['current_since']
+    furthest, ever_lost = intervals['furthest'], intervals['ever_lost']
+    if lead_mask is not None:
+        current, since = current[lead_mask], since[lead_mask]
+        furthest, ever_lost = furthest[lead_mask], ever_lost[lead_mask]
+    open_days = np.maximum((now - since) / np.timedelta64(1, 'D'), 0)
+    timed = (current >= 0) & (current < won) & ~np.isnan(open_days)
+    spans += np.bincount(current[timed], minlength=n_stages)
+    total_days += np.bincount(current[timed], weights=open_days[timed], minlength=n_stages)
+
+    # Funnel: a lead has reached every stage up to the furthest one it got to
+    reached = np.cumsum(np.bincount(furthest[furthest >= 0], minlength=n_stages)[::-1])[::-1]
+    reached[lost] = np.count_nonzero(ever_lost)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        conversion = np.append(reached[1:won + 1] / reached[:won], [np.nan] * (n_stages - won)) * 100
+        mean_days = total_days / spans
+
+    flow = pd.DataFrame({
+        'Leads Reached': reached,
+        'Currently In Stage': np.bincount(current[current >= 0], minlength=n_stages),
+        'Conversion to Next (%)': conversion,
+        'Mean Days in Stage': mean_days,
+        'Median Days to Advance': median_days,
+    }, index=pd.Index(lead_store.STAGES, name='stage'))
+
+    transitions = np.bincount(
+        transition[transition >= 0], minlength=n_stages * n_stages
+    ).reshape(n_stages, n_stages)
+    transitions = pd.DataFrame(
+        transitions,
+        index=pd.Index(lead_store.STAGES, name='from'),
+        columns=pd.Index(lead_store.STAGES, name='to')
+    )
+    return flow, transitions
+
+
+def _locate_sorted(sorted_ids, ids):
+    """Return positions of ids in a sorted id array and which were found"""
+    positions = np.searchsorted(sorted_ids, ids)
+    if not len(sorted_ids):
+        return positions, np.zeros(len(ids), dtype=bool)
+    positions = np.minimum(positions, len(sorted_ids) - 1)
+    return positions, sorted_ids[positions] == ids
+
+
+def _stage_codes(stages):
+    """Map stage names to their position in lead_store.STAGES, -1 if unknown"""
+    return pd.Categorical(stages, categories=lead_store.STAGES).codes.astype(np.int64)
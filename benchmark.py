@@ -0,0 +1,262 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+import lead_store
+import lead_synth
+
+# App script the pages are run from
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+
+# Sidebar entry of each benchmarked page function
+PAGES = {
+    'view_lead_dashboard': "View Lead Dashboard",
+    'show_lead_analytics': "Lead Analytics",
+    'analyze_pipeline': "Pipeline Analysis",
+    'analyze_revenue_forecast': "Revenue Forecasting",
+    'analyze_territories': "Territory Analytics",
+    'calculate_pricing': "Pricing Calculator",
+}
+
+# Lead counts benchmarked by default, and warm reruns timed per page
+DEFAULT_SCALES = [1_000, 10_000, 100_000, 1_000_000]
+DEFAULT_REPEATS = 3
+
+# Seconds a single page run may take before AppTest gives up
+DEFAULT_TIMEOUT = 900
+
+# Figures compared between reports, with the relative change worth flagging
+COMPARED_FIGURES = ('cold_seconds', 'warm_seconds', 'peak_memory_bytes', 'payload_bytes')
+CHANGE_THRESHOLD = 0.10
+
+
+def dataset_path(data_dir, scale, seed, today):
+    """Synthetic lead database of one scale, reused for a day so runs see the same leads"""
+    return os.path.join(data_dir, f"leads-{scale}-seed{seed}-{today:%Y%m%d}.db")
+
+
+def prepare_dataset(data_dir, scale, seed, today):
+    """Generate a dataset unless it already exists; return its path and generation time"""
+    path = dataset_path(data_dir, scale, seed, today)
+    if os.path.exists(path):
+        return path, None
+    os.makedirs(data_dir, exist_ok=True)
+    started = time.perf_counter()
+    partial = path + ".partial"
+    if os.path.exists(partial):
+        os.remove(partial)
+    for _ in lead_synth.write_leads(partial, scale, seed, today):
+        pass
+    os.replace(partial, path)
+    return path, time.perf_counter() - started
+
+
+def payload_bytes(app):
+    """Serialized size of every element a run rendered, as sent to the browser"""
+    total = 0
+    for root in (app.main, app.sidebar):
+        for node in root:
+            proto = getattr(node, 'proto', None)
+            if proto is not None and hasattr(proto, 'ByteSize'):
+                total += proto.ByteSize()
+    return total
+
+
+def _fresh_caches():
+    """Drop every cached store, index and aggregate so the next run starts cold"""
+    st.cache_resource.clear()
+    gc.collect()
+
+
+def _open_page(page, timeout):
+    """An app that has run once and has the page selected for its next run"""
+    app = AppTest.from_file(APP_PATH, default_timeout=timeout)
+    app.run()
+    app.sidebar.selectbox[0].set_value(PAGES[page])
+    return app
+
+
+def _timed_run(app):
+    started = time.perf_counter()
+    app.run()
+    return time.perf_counter() - started
+
+
+def benchmark_page(page, repeats=DEFAULT_REPEATS, timeout=DEFAULT_TIMEOUT):
+    """Time one page cold and warm, and measure its peak memory and payload
+
+    The cold run starts with empty caches, so it includes loading the store
+    and building whatever the page needs. Warm runs rerun the page with the
+    same widget state. Peak memory comes from a separate cold run under
+    tracemalloc, which would otherwise slow the timed runs down.
+    """
+    _fresh_caches()
+    app = _open_page(page, timeout)
+    cold = _timed_run(app)
+    exceptions = [exception.value for exception in app.exception]
+    payload = payload_bytes(app)
+    warm = [_timed_run(app) for _ in range(repeats)]
+    del app
+
+    _fresh_caches()
+    app = _open_page(page, timeout)
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        app.run()
+        peak = tracemalloc.get_traced_memory()[1] - baseline
+    finally:
+        tracemalloc.stop()
+    del app
+
+    return {
+        'page': page,
+        'label': PAGES[page],
+        'cold_seconds': cold,
+        'warm_seconds': statistics.median(warm) if warm else None,
+        'warm_min_seconds': min(warm) if warm else None,
+        'peak_memory_bytes': peak,
+        'payload_bytes': payload,
+        'exceptions': exceptions,
+    }
+
+
+def _commit():
+    """Current git commit of the repo, marked dirty if it has local changes"""
+    def git(*args):
+        return subprocess.run(
+            ["git", *args], cwd=os.path.dirname(APP_PATH), capture_output=True, text=True, check=True
+        ).stdout.strip()
+    try:
+        commit = git("rev-parse", "HEAD")
+        return commit + ("-dirty" if git("status", "--porcelain", "--untracked-files=no") else "")
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(scales=DEFAULT_SCALES, pages=None, seed=0, data_dir="benchmark_data",
+                   repeats=DEFAULT_REPEATS, timeout=DEFAULT_TIMEOUT, on_result=None):
+    """Benchmark pages at each scale and return the report
+
+    Each scale runs against its own synthetic lead database. on_result is
+    called with every page result as it is measured.
+    """
+    today = pd.Timestamp(datetime.now().date())
+    report = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'commit': _commit(),
+        'seed': seed,
+        'repeats': repeats,
+        'data_end': today.date().isoformat(),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'streamlit': st.__version__,
+        },
+        'datasets': {},
+        'results': [],
+    }
+    db_path = lead_store.DB_PATH
+    try:
+        for scale in scales:
+            path, generated = prepare_dataset(data_dir, scale, seed, today)
+            report['datasets'][str(scale)] = {'path': path, 'generation_seconds': generated}
+            # The app opens lead_store.DB_PATH, which was read when it was first imported
+            lead_store.DB_PATH = path
+            for page in pages or PAGES:
+                result = {'scale': scale, **benchmark_page(page, repeats, timeout)}
+                report['results'].append(result)
+                if on_result is not None:
+                    on_result(result)
+    finally:
+        lead_store.DB_PATH = db_path
+        _fresh_caches()
+    return report
+
+
+def compare_reports(baseline, current, threshold=CHANGE_THRESHOLD):
+    """Rows of (page, scale, figure, baseline, current, relative change) for shared results
+
+    Only changes larger than threshold are returned.
+    """
+    before = {(result['page'], result['scale']): result for result in baseline['results']}
+    rows = []
+    for result in current['results']:
+        previous = before.get((result['page'], result['scale']))
+        if previous is None:
+            continue
+        for figure in COMPARED_FIGURES:
+            old, new = previous.get(figure), result.get(figure)
+            if not old or new is None:
+                continue
+            change = new / old - 1
+            if abs(change) > threshold:
+                rows.append((result['page'], result['scale'], figure, old, new, change))
+    return rows
+
+
+def _print_result(result):
+    status = f"  {len(result['exceptions'])} exception(s)" if result['exceptions'] else ""
+    print(
+        f"{result['page']:<26} {result['scale']:>9,}  cold {result['cold_seconds']:8.2f}s"
+        f"  warm {result['warm_seconds'] or 0:8.2f}s  peak {result['peak_memory_bytes'] / 2**20:8.1f} MiB"
+        f"  payload {result['payload_bytes'] / 1024:8.1f} KiB{status}",
+        flush=True
+    )
+
+
+def main(argv=None):
+    """Command-line entry point: run the page benchmarks or compare two reports"""
+    parser = argparse.ArgumentParser(description="Acolyte page benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Benchmark pages against synthetic leads")
+    run_parser.add_argument("--scales", type=int, nargs="+", default=DEFAULT_SCALES)
+    run_parser.add_argument("--pages", nargs="+", choices=list(PAGES), help="Defaults to every page")
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--repeats", type=int, default=DEFAULT_REPEATS)
+    run_parser.add_argument("--timeout", type=int, default=DEFAULT_TIMEOUT)
+    run_parser.add_argument("--data-dir", default="benchmark_data", help="Where generated datasets are kept")
+    run_parser.add_argument("--output", default="benchmark.json", help="JSON report to write")
+
+    compare_parser = commands.add_parser("compare", help="Show what changed between two reports")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=CHANGE_THRESHOLD)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        report = run_benchmarks(
+            args.scales, args.pages, args.seed, args.data_dir, args.repeats, args.timeout, _print_result
+        )
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+        print(f"Report written to {args.output}")
+
+    elif args.command == "compare":
+        with open(args.baseline) as baseline, open(args.current) as current:
+            rows = compare_reports(json.load(baseline), json.load(current), args.threshold)
+        if not rows:
+            print(f"No figure changed by more than {args.threshold:.0%}.")
+        for page, scale, figure, old, new, change in rows:
+            print(f"{page:<26} {scale:>9,}  {figure:<18} {old:>14,.3f} -> {new:>14,.3f}  ({change:+.0%})")
+
+
+if __name__ == "__main__":
+    main()
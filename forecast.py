@@ -0,0 +1,320 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import analytics
+
+# Trials simulated by default, and trials per independently seeded block.
+# Run time is linear in open deals x trials, at roughly 100M cells a second
+# per CPU: 50k deals take about 5 s at 10k trials and 50 s at 100k.
+DEFAULT_TRIALS = 100_000
+TRIAL_BLOCK = 5000
+
+# Deal x trial cells per worker that an interactive run may sample, about
+# five seconds of work; interactive_trials sizes runs to stay within it
+INTERACTIVE_CELLS = 500_000_000
+
+# Deal x trial cells sampled at a time, which bounds the memory of one step
+CHUNK_CELLS = 4_000_000
+
+# Simulations smaller than this many cells run in-process even when workers
+# are offered, as starting a pool would take longer than the work
+PARALLEL_MIN_CELLS = 200_000_000
+
+# Chance that a won deal closes 0, 1, 2... months after its expected close month
+CLOSE_SLIP = (0.6, 0.25, 0.15)
+
+# Percentiles of simulated revenue reported per month and territory
+PERCENTILES = (10, 50, 90)
+
+# Monthly series forecast for every territory and category, as
+# name -> (monthly rollup, rollup figure, stages or None for all)
+SERIES_MEASURES = {
+    'leads': ('month', 'count', None),
+    'pipeline': ('month', 'value', None),
+    'bookings': ('stage_month', 'value', ('Closed Won',)),
+}
+
+# Months per season, and the most recent months held out to pick a method
+SEASON = 12
+BACKTEST_MONTHS = 3
+
+# Smoothing weights tried for the level and, in Holt's method, the trend
+LEVEL_WEIGHTS = (0.1, 0.2, 0.3, 0.5, 0.7, 0.9)
+TREND_WEIGHTS = (0.05, 0.1, 0.2)
+
+# Outcomes are drawn as 16-bit integers; a deal closes when its draw falls
+# below its probability scaled to this range
+_DRAW_SCALE = 65535
+
+
+def simulation_plan(deals, slip=CLOSE_SLIP, conversion_factor=1.0, value_factor=1.0, start=None):
+    """Arrays describing the open deals of a simulation, sorted by close month
+
+    Deals expected to close before the start month, or with no expected
+    close date, are treated as closing in the start month. Closed deals and
+    deals that cannot close are left out.
+    """
+    start = pd.Period(start or datetime.now(), freq='M')
+    values = deals['total_deal_value_annual'].fillna(0).to_numpy(dtype=np.float64) * value_factor
+    probabilities = np.clip(
+        deals['probability'].fillna(0).to_numpy(dtype=np.float64) / 100 * conversion_factor, 0, 1
+    )
+    close_dates = deals['expected_close_date']
+    offsets = (
+        (close_dates.dt.year - start.year) * 12 + close_dates.dt.month - start.month
+    ).fillna(0).to_numpy(dtype=np.int64)
+    offsets = np.maximum(offsets, 0)
+
+    keep = (probabilities > 0) & (values != 0) & ~deals['stage'].isin(analytics.CLOSED_STAGES).to_numpy()
+    order = np.argsort(offsets[keep], kind='stable')
+    offsets = offsets[keep][order]
+    territory_codes, territories = pd.factorize(deals['territory'].fillna('Unknown').to_numpy()[keep][order])
+    months = pd.period_range(start, periods=int(offsets.max(initial=0)) + len(slip), freq='M')
+
+    # Closing by slip k means drawing below probability times the chance of
+    # a slip of at most k months
+    cumulative = np.cumsum(slip) / np.sum(slip)
+    cumulative[-1] = 1.0
+    thresholds = np.rint(
+        probabilities[keep][order][None, :] * cumulative[:, None] * _DRAW_SCALE
+    ).astype(np.uint16)
+
+    values = values[keep][order]
+    by_territory = np.zeros((len(territories), len(values)), dtype=np.float32)
+    by_territory[territory_codes, np.arange(len(values))] = values
+    return {
+        'months': months,
+        'territories': pd.Index(territories),
+        'offsets': offsets,
+        'values': values.astype(np.float32),
+        'thresholds': thresholds,
+        'by_territory': by_territory,
+    }
+
+
+def _simulate_block(plan, trials, seed):
+    """Revenue of every close month and territory in each of a block of trials
+
+    Draws one deals x trials matrix a chunk of deals at a time. A deal's
+    draw decides both whether it closes and, among closing draws, how many
+    months it slips, so each cell costs one random number.
+    """
+    rng = np.random.default_rng(seed)
+    offsets, values, thresholds = plan['offsets'], plan['values'], plan['thresholds']
+    slips = len(thresholds)
+    by_month = np.zeros((len(plan['months']), trials))
+    by_territory = np.zeros((len(plan['territories']), trials))
+
+    step = max(1, CHUNK_CELLS // trials)
+    for start in range(0, len(values), step):
+        stop = min(start + step, len(values))
+        draws = rng.integers(0, _DRAW_SCALE, (stop - start, trials), dtype=np.uint16)
+        # Deals are sorted by month, so each month is one run of rows
+        runs = np.flatnonzero(np.diff(offsets[start:stop], prepend=-1, append=-1)) + start
+        for slip in range(slips):
+            closed = (draws < thresholds[slip, start:stop, None]).astype(np.float32)
+            # Revenue closed with a slip of exactly k months is what closed by
+            # slip k less what closed by slip k - 1, so each cumulative mask
+            # adds to its own month and takes back from the next one
+            for run_start, run_stop in zip(runs[:-1], runs[1:]):
+                revenue = values[run_start:run_stop] @ closed[run_start - start:run_stop - start]
+                month = offsets[run_start] + slip
+                by_month[month] += revenue
+                if slip + 1 < slips:
+                    by_month[month + 1] -= revenue
+        by_territory += plan['by_territory'][:, start:stop] @ closed
+    return by_month, by_territory
+
+
+def interactive_trials(open_deals, workers=1, choices=None):
+    """Trials, up to DEFAULT_TRIALS, that simulate this many open deals in seconds
+
+    Keeps open_deals x trials within INTERACTIVE_CELLS per worker, but never
+    goes below one TRIAL_BLOCK. With choices, returns the largest choice
+    within that, or the smallest choice if none is.
+    """
+    budget = INTERACTIVE_CELLS * max(1, workers or 1) // max(1, open_deals)
+    trials = max(TRIAL_BLOCK, min(DEFAULT_TRIALS, budget))
+    if choices:
+        fitting = [choice for choice in choices if choice <= trials]
+        return max(fitting) if fitting else min(choices)
+    return trials
+
+
+def simulate_revenue(deals, trials=DEFAULT_TRIALS, slip=CLOSE_SLIP, conversion_factor=1.0,
+                     value_factor=1.0, start=None, seed=0, workers=None):
+    """Monte Carlo revenue from open deals, as percentiles per close month and territory
+
+    Each trial closes every deal with its probability, scaled by
+    conversion_factor, in its expected close month or a later one drawn
+    from slip. Trials are simulated in seeded blocks, spread across a pool
+    of worker processes for large runs; the result does not depend on the
+    number of workers.
+
+    Returns a dict with the deal and trial counts, 'total' percentiles of
+    all revenue, and 'by_month' and 'by_territory' frames with a column per
+    percentile plus the mean.
+    """
+    plan = simulation_plan(deals, slip, conversion_factor, value_factor, start)
+    blocks = [min(TRIAL_BLOCK, trials - first) for first in range(0, trials, TRIAL_BLOCK)]
+    seeds = np.random.SeedSequence(seed).spawn(len(blocks))
+
+    cells = len(plan['values']) * trials
+    if workers and workers > 1 and len(blocks) > 1 and cells >= PARALLEL_MIN_CELLS:
+        # Workers are spawned rather than forked, so they do not inherit the
+        # threads of a running app
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(min(workers, len(blocks)), mp_context=context) as pool:
+            results = list(pool.map(_simulate_block, [plan] * len(blocks), blocks, seeds))
+    else:
+        results = [_simulate_block(plan, size, block_seed) for size, block_seed in zip(blocks, seeds)]
+
+    by_month = np.concatenate([months for months, _ in results], axis=1)
+    by_territory = np.concatenate([territories for _, territories in results], axis=1)
+    return {
+        'deals': len(plan['values']),
+        'trials': trials,
+        'total': dict(zip(_labels(), np.percentile(by_month.sum(axis=0), PERCENTILES))),
+        'by_month': _summarize(by_month, plan['months']),
+        'by_territory': _summarize(by_territory, plan['territories']),
+    }
+
+
+def _labels():
+    return [f"P{percentile}" for percentile in PERCENTILES]
+
+
+def _summarize(outcomes, index):
+    """Percentile and mean columns of per-trial outcomes, one row per index entry"""
+    summary = pd.DataFrame(
+        np.percentile(outcomes, PERCENTILES, axis=1).T.reshape(len(index), len(PERCENTILES)),
+        index=index,
+        columns=_labels(),
+    )
+    summary['Mean'] = outcomes.mean(axis=1) if outcomes.shape[1] else 0.0
+    return summary
+
+
+def monthly_series(rollups, by=('territory', 'category'), end=None):
+    """Every SERIES_MEASURES measure by month, one row per measure and group
+
+    rollups maps rollup names to the store's monthly rollup rows. Columns
+    are the complete months before end (default: this month), from the
+    first month with any activity; months without any are zero.
+    """
+    end = pd.Period(end or datetime.now(), freq='M')
+    by = list(by)
+    frames = []
+    for measure, (name, figure, stages) in SERIES_MEASURES.items():
+        rows = rollups[name]
+        keep = rows[name] < end
+        if stages is not None:
+            keep &= rows['stage'].isin(stages)
+        rows = rows[keep]
+        totals = rows.groupby(by + [name], observed=True)[figure].sum().rename_axis(by + ['month'])
+        frames.append(pd.concat({measure: totals}, names=['measure']))
+
+    totals = pd.concat(frames).astype(np.float64)
+    if totals.empty:
+        return pd.DataFrame(index=pd.MultiIndex.from_tuples([], names=['measure'] + by), dtype=np.float64)
+    series = totals.unstack('month', fill_value=0.0)
+    first = series.columns.min()
+    return series.reindex(columns=pd.period_range(first, end - 1, freq='M'), fill_value=0.0)
+
+
+def _candidate_forecasts(history, horizon):
+    """Forecasts of every candidate method for every series, shape (series, methods, horizon)
+
+    All series are run through each recursion at once; smoothing weights
+    are a second axis, so one pass over the months fits the whole grid.
+    """
+    series, months = history.shape
+    steps = np.arange(1, horizon + 1)
+    forecasts = []
+
+    # Naive: the last month repeated
+    forecasts.append(np.repeat(history[:, -1:], horizon, axis=1)[:, None, :])
+
+    # Seasonal naive: the same month a season earlier; undefined without a full season
+    if months >= SEASON:
+        forecasts.append(history[:, months - SEASON + (steps - 1) % SEASON][:, None, :])
+    else:
+        forecasts.append(np.full((series, 1, horizon), np.nan))
+
+    # Simple exponential smoothing, one column per level weight
+    alpha = np.array(LEVEL_WEIGHTS)
+    level = np.repeat(history[:, :1], len(alpha), axis=1)
+    for month in range(1, months):
+        level = alpha * history[:, month:month + 1] + (1 - alpha) * level
+    forecasts.append(np.repeat(level[:, :, None], horizon, axis=2))
+
+    # Holt's linear trend, one column per (level, trend) weight pair
+    alpha, beta = (grid.ravel() for grid in np.meshgrid(LEVEL_WEIGHTS, TREND_WEIGHTS))
+    level = np.repeat(history[:, :1], len(alpha), axis=1)
+    trend = np.zeros_like(level)
+    if months > 1:
+        trend += history[:, 1:2] - history[:, :1]
+    for month in range(1, months):
+        previous = level
+        level = alpha * history[:, month:month + 1] + (1 - alpha) * (level + trend)
+        trend = beta * (level - previous) + (1 - beta) * trend
+    forecasts.append(level[:, :, None] + trend[:, :, None] * steps)
+
+    # Rollups cannot go negative
+    return np.maximum(np.concatenate(forecasts, axis=1), 0)
+
+
+def _method_labels():
+    """Name of each candidate method, in _candidate_forecasts order"""
+    alpha, beta = (grid.ravel() for grid in np.meshgrid(LEVEL_WEIGHTS, TREND_WEIGHTS))
+    return (
+        ["Naive", "Seasonal naive"]
+        + [f"Exponential smoothing (α={weight})" for weight in LEVEL_WEIGHTS]
+        + [f"Holt (α={level}, β={trend})" for level, trend in zip(alpha, beta)]
+    )
+
+
+def forecast_series(series, horizon):
+    """Forecast every row of a months-as-columns frame for the next horizon months
+
+    Each row gets the candidate method with the lowest mean absolute error
+    over the last BACKTEST_MONTHS months when fitted on the months before
+    them; rows too short to backtest use the naive forecast. Returns a dict
+    with 'forecast' (rows x future months), and per row the 'method' chosen
+    and its backtest 'error'.
+    """
+    history = series.to_numpy(dtype=np.float64)
+    months = series.columns
+    future = pd.period_range(months[-1] + 1, periods=horizon, freq='M') if len(months) else pd.PeriodIndex(
+        [], freq='M'
+    )
+    labels = np.array(_method_labels(), dtype=object)
+    if not len(series) or not len(months):
+        empty = pd.Series(index=series.index, dtype=object)
+        return {
+            'forecast': pd.DataFrame(index=series.index, columns=future, dtype=np.float64),
+            'method': empty,
+            'error': empty.astype(np.float64),
+        }
+
+    if history.shape[1] > BACKTEST_MONTHS + 1:
+        held_out = history[:, -BACKTEST_MONTHS:]
+        backtest = _candidate_forecasts(history[:, :-BACKTEST_MONTHS], BACKTEST_MONTHS)
+        errors = np.abs(backtest - held_out[:, None, :]).mean(axis=2)
+        errors = np.where(np.isnan(errors), np.inf, errors)
+        chosen = errors.argmin(axis=1)
+        error = errors[np.arange(len(chosen)), chosen]
+    else:
+        chosen = np.zeros(len(history), dtype=np.int64)
+        error = np.full(len(history), np.nan)
+
+    forecasts = _candidate_forecasts(history, horizon)[np.arange(len(chosen)), chosen]
+    return {
+        'forecast': pd.DataFrame(forecasts, index=series.index, columns=future),
+        'method': pd.Series(labels[chosen], index=series.index),
+        'error': pd.Series(error, index=series.index),
+    }
@@ -0,0 +1,378 @@
+import logging
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+import lead_store
+
+# Axes of the cube: the categorical lead fields, then the first contact month
+CUBE_DIMENSIONS = ('territory', 'stage', 'category', 'lead_source')
+MONTH = 'month'
+
+# Measures of every cell: leads, leads with a deal value, value, weighted value and deals won
+CUBE_MEASURES = ('count', 'valued', 'value', 'weighted', 'won')
+
+# Lead columns a cube is built from
+CUBE_COLUMNS = CUBE_DIMENSIONS + ('first_contact_date', 'total_deal_value_annual', 'probability')
+
+# Periods whose partly covered months have been recounted, kept per version
+PERIOD_CACHE_SIZE = 32
+
+# Lead ids of a month with no leads
+_NO_IDS = np.zeros(0, dtype=np.int64)
+
+# Relative drift between the delta-updated cube and a rebuild worth a warning
+DRIFT_TOLERANCE = 1e-9
+
+logger = logging.getLogger(__name__)
+
+
+def _axes(months):
+    """(name, labels) of each cube axis over the given first contact months"""
+    return [
+        (dimension, [None] + list(lead_store.LEAD_SCHEMA[dimension].categories))
+        for dimension in CUBE_DIMENSIONS
+    ] + [(MONTH, [pd.NaT] + list(months))]
+
+
+def _months_of(leads):
+    """Every month from a frame's first to its last first contact month"""
+    dates = leads['first_contact_date'].dropna()
+    if not len(dates):
+        return pd.PeriodIndex([], freq='M')
+    return pd.period_range(dates.min(), dates.max(), freq='M')
+
+
+def _ordinals(leads):
+    """Period ordinal of each lead's first contact month, NaN where it has none"""
+    dates = leads['first_contact_date']
+    return ((dates.dt.year - 1970) * 12 + dates.dt.month - 1).to_numpy(dtype=np.float64)
+
+
+def _members(leads):
+    """Ids of the leads first contacted in each month, keyed by month ordinal"""
+    ordinals = _ordinals(leads)
+    dated = ~np.isnan(ordinals)
+    ordinals = ordinals[dated].astype(np.int64)
+    order = np.argsort(ordinals, kind='stable')
+    ids = leads.index.to_numpy(dtype=np.int64)[dated][order]
+    months, starts = np.unique(ordinals[order], return_index=True)
+    return dict(zip(months.tolist(), np.split(ids, starts[1:])))
+
+
+def _cells(leads, axes):
+    """Flat cell of each lead in a cube with these axes, and its measure figures
+
+    Leads first contacted outside the month axis are left out.
+    """
+    months = pd.PeriodIndex(axes[-1][1][1:], freq='M')
+    ordinals = _ordinals(leads)
+    first = months[0].ordinal if len(months) else 0
+    slots = np.where(np.isnan(ordinals), -1, ordinals - first).astype(np.int64) + 1
+    inside = (slots >= 0) & (slots <= len(months))
+    coordinates = [
+        leads[dimension].cat.codes.to_numpy()[inside].astype(np.int64) + 1 for dimension in CUBE_DIMENSIONS
+    ] + [slots[inside]]
+    cells = np.ravel_multi_index(coordinates, [len(labels) for _, labels in axes])
+    return cells, _figures(leads[inside])
+
+
+def _widen(cube, months):
+    """The cube with its month axis widened to cover the given months"""
+    months = cube.months.union(months)
+    if len(months) == len(cube.months):
+        return cube
+    months = pd.period_range(months.min(), months.max(), freq='M')
+    values = np.zeros(cube.values.shape[:-2] + (len(months) + 1, len(CUBE_MEASURES)))
+    slots = [0] + [months.get_loc(month) + 1 for month in cube.months]
+    values[..., slots, :] = cube.values
+    return Cube(values, _axes(months))
+
+
+def drift(cube, rebuilt):
+    """Largest relative difference between the cells of two cubes of the same leads"""
+    a = _widen(cube, rebuilt.months).values
+    b = _widen(rebuilt, cube.months).values
+    return float(np.max(np.abs(a - b) / np.maximum(np.abs(b), 1), initial=0))
+
+
+def _figures(leads):
+    """Per-lead contribution to each measure, one column per CUBE_MEASURES entry"""
+    value = leads['total_deal_value_annual']
+    return np.column_stack([
+        np.ones(len(leads)),
+        value.notna().to_numpy(dtype=np.float64),
+        value.fillna(0).to_numpy(dtype=np.float64),
+        (value * leads['probability'] / 100).fillna(0).to_numpy(dtype=np.float64),
+        (leads['stage'] == "Closed Won").to_numpy(dtype=np.float64),
+    ])
+
+
+class Cube:
+    """Dense array of lead measures with one axis per dimension
+
+    Category axes are indexed by category code plus one, with slot 0 for a
+    missing value; the month axis has slot 0 for leads with no first
+    contact date. Cubes are never modified: slice, dice and roll_up return
+    new, smaller cubes, so answering a filter only touches the cells it
+    selects.
+    """
+
+    def __init__(self, values, axes):
+        # axes: (name, labels) per leading axis of values; the last axis is the measures
+        self.values = values
+        self.axes = tuple(axes)
+        self._positions = {}
+
+    @classmethod
+    def build(cls, leads, months=None):
+        """Count a frame of leads into a cube, over given months or all of theirs"""
+        axes = _axes(_months_of(leads) if months is None else months)
+        shape = [len(labels) for _, labels in axes]
+        cells, figures = _cells(leads, axes)
+        values = np.column_stack([
+            np.bincount(cells, weights=figures[:, measure], minlength=int(np.prod(shape)))
+            for measure in range(len(CUBE_MEASURES))
+        ]).reshape(shape + [len(CUBE_MEASURES)])
+        return cls(values, axes)
+
+    @property
+    def months(self):
+        """First contact months along the month axis, without the missing slot"""
+        labels = dict(self.axes).get(MONTH, [pd.NaT])
+        return pd.PeriodIndex(labels[1:], freq='M')
+
+    def _axis(self, name):
+        for axis, (axis_name, _) in enumerate(self.axes):
+            if axis_name == name:
+                return axis
+        raise KeyError(f"The cube has no {name} axis")
+
+    def _select(self, name, labels):
+        """Positions along an axis of the given labels; labels not on it are skipped"""
+        positions = self._positions.get(name)
+        if positions is None:
+            positions = {label: position for position, label in enumerate(self.axes[self._axis(name)][1])}
+            self._positions[name] = positions
+        return [positions[label] for label in labels if label in positions]
+
+    def dice(self, **selections):
+        """Keep only the given labels along each named axis; axes not named, or given None, keep everything"""
+        values = self.values
+        axes = []
+        for axis, (name, labels) in enumerate(self.axes):
+            chosen = selections.get(name)
+            if chosen is None:
+                axes.append((name, labels))
+            else:
+                positions = self._select(name, chosen)
+                # One take per diced axis copies whole blocks, unlike a joint fancy index
+                values = values.take(positions, axis=axis)
+                axes.append((name, [labels[position] for position in positions]))
+        return Cube(values, axes)
+
+    def slice(self, name, label):
+        """The cells with one label along an axis, without that axis"""
+        axis = self._axis(name)
+        positions = self._select(name, [label])
+        if positions:
+            values = np.take(self.values, positions[0], axis=axis)
+        else:
+            values = np.zeros(self.values.shape[:axis] + self.values.shape[axis + 1:])
+        return Cube(values, self.axes[:axis] + self.axes[axis + 1:])
+
+    def roll_up(self, by=()):
+        """Sum the cells over every axis not in by, keeping the by axes in that order"""
+        keep = [self._axis(name) for name in by]
+        summed = tuple(axis for axis in range(len(self.axes)) if axis not in keep)
+        values = self.values.sum(axis=summed)
+        # sum keeps the remaining axes in cube order; put them in the order asked for
+        remaining = sorted(keep)
+        values = np.transpose(values, [remaining.index(axis) for axis in keep] + [len(keep)])
+        return Cube(values, [self.axes[axis] for axis in keep])
+
+    def totals(self):
+        """Every measure summed over the whole cube"""
+        total = self.values.reshape(-1, len(CUBE_MEASURES)).sum(axis=0)
+        return dict(zip(CUBE_MEASURES, total.tolist()))
+
+    def frame(self):
+        """One row per cell with any leads, indexed by the axis labels
+
+        Cells with a missing label are left out, as a pandas groupby would.
+        """
+        known = [[position for position, label in enumerate(labels) if not pd.isna(label)] for _, labels in self.axes]
+        values = self.values[np.ix_(*known, np.arange(len(CUBE_MEASURES)))].reshape(-1, len(CUBE_MEASURES))
+        kept = [[labels[position] for position in positions] for (_, labels), positions in zip(self.axes, known)]
+        names = [name for name, _ in self.axes]
+        if len(self.axes) == 1:
+            index = pd.Index(kept[0], name=names[0])
+        else:
+            index = pd.MultiIndex.from_product(kept, names=names)
+        occupied = values[:, 0] > 0
+        return pd.DataFrame(values[occupied], index=index[occupied], columns=list(CUBE_MEASURES))
+
+
+class LeadCube:
+    """Cube of the store's leads, kept in step with a LeadStore
+
+    Writes are applied as deltas: the changed leads' cells lose their old
+    rows' measures and gain their new rows'. When the store's change log no
+    longer reaches back to the cube's version, the cube is rebuilt on a
+    background thread and the previous one keeps answering until it is done.
+    Deltas add and subtract floats, so like the store's monthly rollups the
+    cube is also rebuilt every ROLLUP_CHECK_INTERVAL. A rebuild of the same
+    leads the deltas were applied to is compared with the delta-updated
+    cube, and the largest relative difference is kept in drift and logged.
+    """
+
+    def __init__(self):
+        self.version = None
+        self._lock = threading.Lock()
+        self._cube = None
+        self._leads = None
+        # Month ordinal -> ids of the leads first contacted that month
+        self._members = {}
+        self._building = None
+        self._built = time.monotonic()
+        # Drift found by the last rebuild that could be compared, if any
+        self.drift = None
+        # (version, start, end) -> cube of that period
+        self._periods = {}
+
+    def sync(self, store):
+        """Bring the cube up to date with a LeadStore"""
+        version = store.version
+        due = time.monotonic() - self._built > lead_store.ROLLUP_CHECK_INTERVAL
+        if version == self.version and not due:
+            return
+        with self._lock:
+            if self._cube is None:
+                self._leads = store.project(CUBE_COLUMNS)
+                self._cube = Cube.build(self._leads)
+                self._members = _members(self._leads)
+                self.version = version
+                return
+            changed = store.changes_since(self.version)
+            if changed is not None:
+                leads = store.project(CUBE_COLUMNS)
+                self._cube, self._members = self._apply(self._cube, self._members, self._leads, leads, changed)
+                self._leads, self.version = leads, version
+            if (changed is None or due) and self._building is None:
+                self._building = threading.Thread(target=self._rebuild, args=(store,), daemon=True)
+                self._building.start()
+
+    def _rebuild(self, store):
+        with self._lock:
+            current, current_leads = self._cube, self._leads
+        # Read the version first: the snapshot may include later writes,
+        # and re-applying those as deltas on the next sync is harmless
+        version = store.version
+        leads = store.project(CUBE_COLUMNS)
+        cube = Cube.build(leads)
+        members = _members(leads)
+        # The store hands out the same projection until its next write, so
+        # the same frame means the deltas were applied to exactly these leads
+        found = drift(current, cube) if leads is current_leads else None
+        with self._lock:
+            self._cube, self._leads, self._members, self.version = cube, leads, members, version
+            self._building = None
+            self._built = time.monotonic()
+            if found is not None:
+                self.drift = found
+        if found is not None:
+            log = logger.warning if found > DRIFT_TOLERANCE else logger.info
+            log("Lead cube rebuilt at version %s; drift from its deltas was %.3g", version, found)
+
+    @staticmethod
+    def _apply(cube, members, old_leads, new_leads, changed):
+        """Copies of cube and members with changed leads moved from their old rows to their new ones"""
+        old = old_leads.take([p for p in lead_store.locate(old_leads, changed) if p >= 0])
+        new = new_leads.take([p for p in lead_store.locate(new_leads, changed) if p >= 0])
+        cube = _widen(cube, _months_of(new))
+        values = cube.values.copy()
+        flat = values.reshape(-1, len(CUBE_MEASURES))
+        cells, figures = _cells(old, cube.axes)
+        np.subtract.at(flat, cells, figures)
+        cells, figures = _cells(new, cube.axes)
+        np.add.at(flat, cells, figures)
+
+        # Only the months the changed leads left or joined are copied
+        members = dict(members)
+        left, joined = _members(old), _members(new)
+        for month in left.keys() | joined.keys():
+            ids = members.get(month, _NO_IDS)
+            ids = np.concatenate([ids[~np.isin(ids, left.get(month, _NO_IDS))], joined.get(month, _NO_IDS)])
+            if len(ids):
+                members[month] = ids
+            else:
+                members.pop(month, None)
+        return Cube(values, cube.axes), members
+
+    def current(self):
+        """The latest cube; may trail the store while a rebuild runs"""
+        return self._cube
+
+    def period(self, start=None, end=None):
+        """Cube of the leads first contacted within [start, end]
+
+        Whole months are diced out of the cube and a month the period covers
+        only part of is recounted from that month's leads alone. Either way
+        the answer is kept for the version, so later filters only dice the
+        period's cube. An unbounded period also counts leads with no first
+        contact date and has no month axis.
+        """
+        key = (start, end)
+        with self._lock:
+            cube, leads, members, version = self._cube, self._leads, self._members, self.version
+            cached = self._periods.get((version,) + key)
+        if cached is not None:
+            return cached
+        if start is None and end is None:
+            result = cube.roll_up(CUBE_DIMENSIONS)
+        else:
+            result = self._between(cube, leads, members, start, end)
+        with self._lock:
+            if len(self._periods) >= PERIOD_CACHE_SIZE or any(k[0] != version for k in self._periods):
+                self._periods = {}
+            self._periods[(version,) + key] = result
+        return result
+
+    @staticmethod
+    def _between(cube, leads, members, start, end):
+        """Cube of a bounded period, recounting the months it covers only part of"""
+        start = pd.Timestamp(start) if start is not None else None
+        end = pd.Timestamp(end) if end is not None else None
+        first = pd.Period(start, freq='M') if start is not None else None
+        last = pd.Period(end, freq='M') if end is not None else None
+        ordinals = cube.months.asi8
+        keep = np.ones(len(ordinals), dtype=bool)
+        if first is not None:
+            keep &= ordinals >= first.ordinal
+        if last is not None:
+            keep &= ordinals <= last.ordinal
+        months = list(cube.months[keep])
+        result = cube.dice(**{MONTH: months})
+        partial = []
+        if first is not None and first.start_time < start and first in months:
+            partial.append(first)
+        if last is not None and last.end_time > end and last in months and last not in partial:
+            partial.append(last)
+        if partial:
+            values = result.values.copy()
+            for month in partial:
+                positions = lead_store.locate(leads, members.get(month.ordinal, _NO_IDS))
+                rows = leads.take(positions[positions >= 0])
+                dates = rows['first_contact_date']
+                within = dates.notna()
+                if start is not None:
+                    within &= dates >= start
+                if end is not None:
+                    within &= dates <= end
+                recount = Cube.build(rows[within.to_numpy()], pd.PeriodIndex([month], freq='M'))
+                # The diced month axis has no missing slot; the recount's does
+                values[..., months.index(month), :] = recount.values[..., 1, :]
+            result = Cube(values, result.axes)
+        return result
@@ -0,0 +1,313 @@
+import argparse
+import time
+from datetime import datetime
+
+import pandas as pd
+
+import lead_store
+import pricing
+
+# Rows read, validated and written per batch
+DEFAULT_CHUNK_SIZE = 5000
+
+# Rejected rows kept for the import report; the rest are only counted
+MAX_REJECTED_ROWS = 1000
+
+# Export formats with their MIME type and file extension
+EXPORT_FORMATS = {
+    "CSV": ("text/csv", ".csv"),
+    "Parquet": ("application/vnd.apache.parquet", ".parquet"),
+}
+
+# Fields a lead cannot be imported without
+REQUIRED_FIELDS = ['institution_name', 'territory', 'category', 'stage']
+
+
+def read_chunks(source, file_name, chunksize=DEFAULT_CHUNK_SIZE):
+    """Yield a CSV or Excel file as frames of raw string values"""
+    if file_name.lower().endswith(('.xlsx', '.xlsm')):
+        yield from _read_excel_chunks(source, chunksize)
+    else:
+        yield from pd.read_csv(source, chunksize=chunksize, dtype=str, skipinitialspace=True)
+
+
+def _read_excel_chunks(source, chunksize):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ImportError("Importing Excel files requires openpyxl")
+
+    workbook = load_workbook(source, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(name).strip() if name is not None else '' for name in next(rows, [])]
+        batch, offset = [], 0
+        for row in rows:
+            batch.append(row)
+            if len(batch) == chunksize:
+                yield pd.DataFrame(batch, columns=header, index=range(offset, offset + len(batch)))
+                offset += len(batch)
+                batch = []
+        if batch:
+            yield pd.DataFrame(batch, columns=header, index=range(offset, offset + len(batch)))
+    finally:
+        workbook.close()
+
+
+def validate_leads(chunk, today=None):
+    """Split a raw chunk into typed, priced leads and rejected rows
+
+    Rejected rows keep their original values plus a rejection_reason column.
+    Any lead_id column in the file is ignored; ids are assigned on insert.
+    """
+    today = pd.Timestamp(today or datetime.now().date()).normalize()
+    raw = chunk.reindex(columns=lead_store.LEAD_COLUMNS)
+
+    reasons = pd.Series('', index=chunk.index, dtype=object)
+
+    def reject(mask, reason):
+        reasons[mask & (reasons == '')] = reason
+
+    for column in REQUIRED_FIELDS:
+        reject(raw[column].isna(), f"missing {column}")
+
+    typed = {}
+    for column, dtype in lead_store.LEAD_SCHEMA.items():
+        if dtype == 'int64':
+            # Keep missing counts as NaN here so they are not mistaken for zero
+            values = pd.to_numeric(raw[column], errors='coerce')
+        else:
+            values = lead_store.cast_column(raw[column], dtype)
+        reject(raw[column].notna() & values.isna(), f"invalid {column}")
+        typed[column] = values
+
+    for column in ['current_student_count', 'max_student_capacity']:
+        reject(typed[column] < 0, f"negative {column}")
+    reject((typed['probability'] < 0) | (typed['probability'] > 100), "probability outside 0-100")
+
+    accepted = reasons == ''
+    rejected = chunk[~accepted].assign(rejection_reason=reasons[~accepted])
+
+    leads = raw[accepted].assign(**{
+        column: values[accepted] for column, values in typed.items()
+    })
+
+    # Fill the fields the entry form would have set
+    first_contact = leads['first_contact_date'].fillna(today)
+    leads = leads.assign(
+        first_contact_date=first_contact,
+        last_contact_date=leads['last_contact_date'].fillna(first_contact),
+        stage_change_date=leads['stage_change_date'].fillna(first_contact),
+        payment_preference=leads['payment_preference'].fillna("Monthly"),
+        interested_modules=leads['interested_modules'].fillna("[]"),
+    )
+
+    # Price the whole chunk in one pass
+    monthly_prices, annual_values = pricing.deal_values(
+        leads['current_student_count'].fillna(0), leads['payment_preference']
+    )
+    leads = leads.assign(
+        student_price_monthly=monthly_prices,
+        monthly_price=monthly_prices,
+        total_deal_value_annual=annual_values,
+    )
+    return lead_store.apply_schema(leads), rejected
+
+
+def iter_import(source, file_name, chunksize=DEFAULT_CHUNK_SIZE, db_path=None, on_batch=None):
+    """Stream a lead file into the store chunk by chunk
+
+    Each accepted batch is written in one transaction and then passed to
+    on_batch, indexed by its new lead ids. Yields a running report after
+    every chunk.
+    """
+    started = time.perf_counter()
+    report = {'imported': 0, 'rejected': 0, 'rows_per_second': 0.0, 'rejected_rows': []}
+
+    for chunk in read_chunks(source, file_name, chunksize):
+        leads, rejected = validate_leads(chunk)
+        if len(leads):
+            lead_ids = lead_store.insert_leads(leads, db_path)
+            leads = leads.set_axis(lead_ids).assign(**{lead_store.LEAD_ID: lead_ids})
+            if on_batch is not None:
+                on_batch(leads)
+
+        report['imported'] += len(leads)
+        report['rejected'] += len(rejected)
+        kept = sum(len(rows) for rows in report['rejected_rows'])
+        if kept < MAX_REJECTED_ROWS and len(rejected):
+            report['rejected_rows'].append(rejected.head(MAX_REJECTED_ROWS - kept))
+
+        elapsed = time.perf_counter() - started
+        report['elapsed'] = elapsed
+        report['rows_per_second'] = (report['imported'] + report['rejected']) / elapsed if elapsed else 0.0
+        yield report
+
+
+def import_leads(source, file_name, chunksize=DEFAULT_CHUNK_SIZE, db_path=None, on_batch=None):
+    """Import a whole lead file and return the final report"""
+    report = {'imported': 0, 'rejected': 0, 'rows_per_second': 0.0, 'rejected_rows': []}
+    for report in iter_import(source, file_name, chunksize, db_path, on_batch):
+        pass
+    return report
+
+
+def frame_chunks(leads, chunksize=DEFAULT_CHUNK_SIZE):
+    """Yield successive row slices of a frame"""
+    for start in range(0, max(len(leads), 1), chunksize):
+        yield leads.iloc[start:start + chunksize]
+
+
+def iter_export(chunks, columns=None, file_format="CSV"):
+    """Encode frames of leads as a stream of CSV or Parquet byte chunks
+
+    Only one chunk is converted at a time, so a caller writing the chunks
+    out as they come, like the export command, never holds the whole file.
+    """
+    if file_format == "Parquet":
+        yield from _iter_parquet(chunks, columns)
+        return
+
+    header = True
+    for chunk in chunks:
+        if columns:
+            chunk = chunk[columns]
+        yield chunk.to_csv(index=False, header=header).encode()
+        header = False
+
+
+class _ChunkSink:
+    """Write-only file object that hands back what was written since the last drain"""
+
+    closed = False
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _iter_parquet(chunks, columns):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    sink = _ChunkSink()
+    writer = None
+    for chunk in chunks:
+        if columns:
+            chunk = chunk[columns]
+        if writer is None:
+            # Free-text columns are declared as strings up front so an
+            # all-empty first chunk cannot fix them to a null type
+            schema = pa.Schema.from_pandas(chunk, preserve_index=False)
+            for i, name in enumerate(schema.names):
+                if chunk[name].dtype == object or pa.types.is_null(schema.field(i).type):
+                    schema = schema.set(i, pa.field(name, pa.string()))
+            writer = pq.ParquetWriter(sink, schema)
+        writer.write_table(pa.Table.from_pandas(chunk, schema=writer.schema, preserve_index=False))
+        yield sink.drain()
+    if writer is not None:
+        writer.close()
+        yield sink.drain()
+
+
+def filter_leads(leads, territories=None, stages=None, categories=None, start=None, end=None):
+    """Apply the dashboard's territory/stage/category/first-contact filters"""
+    mask = pd.Series(True, index=leads.index)
+    if territories:
+        mask &= leads['territory'].isin(territories)
+    if stages:
+        mask &= leads['stage'].isin(stages)
+    if categories:
+        mask &= leads['category'].isin(categories)
+    if start is not None:
+        mask &= leads['first_contact_date'] >= pd.Timestamp(start)
+    if end is not None:
+        mask &= leads['first_contact_date'] <= pd.Timestamp(end)
+    return leads[mask]
+
+
+def sort_positions(values, descending=False):
+    """Row positions that put a column in order, with missing values last"""
+    ordered = values.reset_index(drop=True).sort_values(
+        ascending=not descending, na_position='last', kind='stable'
+    )
+    return ordered.index.to_numpy()
+
+
+def main(argv=None):
+    """Command-line entry point; a running app picks up imported leads on restart"""
+    parser = argparse.ArgumentParser(description="Acolyte lead import/export")
+    parser.add_argument("--db", help="Lead database path (defaults to ACOLYTE_LEADS_DB)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = commands.add_parser("import", help="Import leads from a CSV or Excel file")
+    import_parser.add_argument("path")
+    import_parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNK_SIZE)
+    import_parser.add_argument("--rejected", help="Write rejected rows to this CSV file")
+
+    export_parser = commands.add_parser("export", help="Export leads to a CSV or Parquet file")
+    export_parser.add_argument("path")
+    export_parser.add_argument("--columns", help="Comma-separated columns to write")
+    export_parser.add_argument("--territory", action="append", help="Repeat for several")
+    export_parser.add_argument("--stage", action="append", help="Repeat for several")
+    export_parser.add_argument("--category", action="append", help="Repeat for several")
+    export_parser.add_argument("--since", help="Earliest first contact date (YYYY-MM-DD)")
+    export_parser.add_argument("--until", help="Latest first contact date (YYYY-MM-DD)")
+    export_parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNK_SIZE)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "import":
+        report = None
+        for report in iter_import(args.path, args.path, args.chunksize, args.db):
+            print(
+                f"\r{report['imported']:,} imported, {report['rejected']:,} rejected "
+                f"({report['rows_per_second']:,.0f} rows/s)",
+                end="", flush=True
+            )
+        print()
+        if report is None:
+            print("The file contains no rows.")
+        elif args.rejected and report['rejected_rows']:
+            pd.concat(report['rejected_rows']).to_csv(args.rejected, index_label='row')
+            print(f"Rejected rows written to {args.rejected}")
+
+    elif args.command == "export":
+        columns = args.columns.split(",") if args.columns else None
+        filter_columns = ['territory', 'stage', 'category', 'first_contact_date']
+        columns = columns or [lead_store.LEAD_ID] + lead_store.LEAD_COLUMNS
+        read_columns = list(dict.fromkeys(columns + filter_columns))
+        chunks = (
+            filter_leads(
+                chunk, args.territory, args.stage, args.category, args.since, args.until
+            )
+            for chunk in lead_store.iter_leads(read_columns, args.chunksize, args.db)
+        )
+        file_format = "Parquet" if args.path.lower().endswith(".parquet") else "CSV"
+        with open(args.path, "wb") as output:
+            for data in iter_export(chunks, columns, file_format):
+                output.write(data)
+        print(f"Leads written to {args.path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,445 @@
+import math
+import re
+import string
+import threading
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+# Lead fields the type-ahead search looks in
+NAME_FIELDS = ('institution_name', 'city', 'primary_contact_name')
+
+# Free-text lead fields covered by the full-text search
+TEXT_FIELDS = (
+    'notes', 'pain_points', 'competitors_involved',
+    'decision_makers', 'feature_requirements', 'next_steps'
+)
+
+# Re-indexed leads kept beside the main index before it is rebuilt, as a
+# minimum and as a fraction of all leads
+MIN_DELTA = 1000
+DELTA_FRACTION = 0.01
+
+# Leads tokenized at a time while building an index
+BUILD_CHUNK_SIZE = 50000
+
+# BM25 term frequency saturation and document length normalization
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Phrase candidates checked against the lead text at a time
+PHRASE_BATCH = 1000
+
+# Characters of context on either side of a match in a snippet
+SNIPPET_WIDTH = 60
+
+# Sorts after every word that starts with a given prefix
+_PREFIX_END = '\U0010ffff'
+
+# Words are split on whitespace and punctuation
+_SEPARATORS = str.maketrans({mark: ' ' for mark in string.punctuation})
+
+# Regular expression classes for a character words are split on, and any other
+_SEPARATOR_CLASS = '[\\s' + re.escape(string.punctuation) + ']'
+_WORD_CLASS = '[^\\s' + re.escape(string.punctuation) + ']'
+
+# Marks the end of one value when a whole column is split in one go
+_ROW_END = '\x01'
+
+# A quoted phrase or a bare word of a full-text query
+_QUERY_PART = re.compile(r'"([^"]*)"|(\S+)')
+
+
+def words(text):
+    """Lower-cased words of a piece of text"""
+    return str(text).lower().translate(_SEPARATORS).split()
+
+
+def field_words(leads, fields):
+    """Return (lead ids, words) with one entry per word of the given fields
+
+    Each column is joined into one string and split once, with a marker
+    between values to tell which lead a word came from; that is several
+    times faster than splitting value by value.
+    """
+    lead_ids, found = [], []
+    for field in fields:
+        values = leads[field].astype(object).where(leads[field].notna(), '').astype(str)
+        text = _ROW_END.join(values.tolist()).lower().translate(_SEPARATORS)
+        tokens = np.array(text.replace(_ROW_END, f' {_ROW_END} ').split(), dtype=object)
+        row_end = tokens == _ROW_END
+        rows = np.cumsum(row_end)[~row_end]
+        lead_ids.append(leads.index.to_numpy(dtype=np.int64)[rows])
+        found.append(tokens[~row_end])
+    if not found:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=object)
+    return np.concatenate(lead_ids), np.concatenate(found)
+
+
+def word_postings(leads, fields, chunksize=BUILD_CHUNK_SIZE):
+    """Build an inverted index of the words in some fields
+
+    Returns the sorted vocabulary, offsets into the postings for each word,
+    and the lead ids and occurrence counts of every (word, lead) pair.
+    Leads are tokenized a chunk at a time and only word codes are kept, so
+    the words of all leads never exist at once.
+    """
+    vocab = {}
+    id_span = int(leads.index.max()) + 1 if len(leads) else 1
+    empty = np.zeros(0, dtype=np.int64)
+    codes, lead_ids, counts = [empty], [empty], [empty]
+    for start in range(0, len(leads), chunksize):
+        chunk_ids, tokens = field_words(leads.iloc[start:start + chunksize], fields)
+        local, uniques = pd.factorize(tokens)
+        known = np.fromiter(
+            (vocab.setdefault(word, len(vocab)) for word in uniques), dtype=np.int64, count=len(uniques)
+        )
+        pairs, pair_counts = np.unique(known[local] * id_span + chunk_ids, return_counts=True)
+        codes.append(pairs // id_span)
+        lead_ids.append(pairs % id_span)
+        counts.append(pair_counts)
+
+    # Renumber words in sorted order so prefixes map to ranges
+    words_by_code = np.array(list(vocab), dtype=object)
+    order = np.argsort(words_by_code.astype(str))
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    codes = rank[np.concatenate(codes)]
+    by_word = np.argsort(codes, kind='stable')
+    offsets = np.concatenate(([0], np.cumsum(np.bincount(codes, minlength=len(order)))))
+    id_type = np.int32 if id_span <= np.iinfo(np.int32).max else np.int64
+    return (
+        words_by_code[order],
+        offsets,
+        np.concatenate(lead_ids)[by_word].astype(id_type),
+        np.minimum(np.concatenate(counts)[by_word], np.iinfo(np.uint16).max).astype(np.uint16),
+    )
+
+
+def parse_query(query):
+    """Split a full-text query into OR-ed groups of AND-ed terms
+
+    A term is a tuple of words: one for a bare word, several for a quoted
+    phrase. 'moodle OR "price sensitive" budget' parses to
+    [[('moodle',)], [('price', 'sensitive'), ('budget',)]].
+    """
+    groups, group = [], []
+    for phrase, word in _QUERY_PART.findall(query):
+        if word == 'OR':
+            if group:
+                groups.append(group)
+            group = []
+        elif word != 'AND':
+            term = tuple(words(phrase or word))
+            if term:
+                group.append(term)
+    if group:
+        groups.append(group)
+    return groups
+
+
+def _phrase_pattern(phrase):
+    """Regular expression matching the words of a phrase in raw text"""
+    return re.compile(
+        f'(?<!{_WORD_CLASS})' + f'{_SEPARATOR_CLASS}+'.join(map(re.escape, phrase)) + f'(?!{_WORD_CLASS})',
+        re.IGNORECASE,
+    )
+
+
+def top_ids(scores, limit=None):
+    """Ids of the positive entries of an array indexed by lead id, best first
+
+    Ties go to the lower id. With a limit, only the entries that can make
+    the cut are sorted.
+    """
+    lead_ids = np.flatnonzero(scores)
+    values = scores[lead_ids]
+    if limit is not None and limit < len(values):
+        kth = np.partition(values, len(values) - limit)[len(values) - limit]
+        lead_ids, values = lead_ids[values >= kth], values[values >= kth]
+    ranked = lead_ids[np.argsort(-values, kind='stable')]
+    return ranked[:limit] if limit is not None else ranked
+
+
+def snippet(text, pattern, width=SNIPPET_WIDTH):
+    """Return the text around the first match of pattern with matches in bold, or None"""
+    text = str(text)
+    match = pattern.search(text)
+    if match is None:
+        return None
+    start = max(match.start() - width, 0)
+    end = min(match.end() + width, len(text))
+    context = pattern.sub(lambda found: f"**{found.group(0)}**", text[start:end])
+    return ("…" if start > 0 else "") + " ".join(context.split()) + ("…" if end < len(text) else "")
+
+
+class WordIndex:
+    """Inverted index over the words of some lead fields, kept in step with a LeadStore
+
+    The vocabulary is sorted, so every word starting with a prefix sits in
+    one contiguous range found by two binary searches. Leads written since
+    the last build are re-indexed into a small delta that overrides their
+    old entries, and the index is rebuilt once the delta grows past a
+    fraction of all leads.
+    """
+
+    def __init__(self, fields):
+        self.fields = tuple(fields)
+        self.version = None
+        self._lock = threading.Lock()
+        self._leads = None
+        self._vocab = np.zeros(0, dtype=object)
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._postings = np.zeros(0, dtype=np.int64)
+        self._counts = np.zeros(0, dtype=np.uint16)
+        # lead_id -> Counter of words, for leads re-indexed since the last build
+        self._delta = {}
+
+    def sync(self, store):
+        """Bring the index up to date with a LeadStore"""
+        version = store.version
+        if version == self.version:
+            return
+        with self._lock:
+            if version == self.version:
+                return
+            changed = None if self.version is None else store.changes_since(self.version)
+            leads = store.snapshot()
+            limit = max(MIN_DELTA, int(len(leads) * DELTA_FRACTION))
+            if changed is None or len(self._delta) + len(changed) > limit:
+                self._build(leads)
+            else:
+                self._update(leads, changed)
+            self._leads = leads
+            self.version = version
+
+    def _build(self, leads):
+        self._vocab, self._offsets, self._postings, self._counts = word_postings(leads, self.fields)
+        self._delta = {}
+
+    def _update(self, leads, changed):
+        positions = leads.index.get_indexer(changed)
+        rows = leads.take(positions[positions >= 0])
+        delta = {lead_id: Counter() for lead_id in rows.index}
+        for lead_id, token in zip(*field_words(rows, self.fields)):
+            delta[lead_id][token] += 1
+        self._delta = {**self._delta, **delta}
+
+    def _state(self):
+        """Consistent references to the index arrays, for use outside the lock"""
+        with self._lock:
+            return self._vocab, self._offsets, self._postings, self._counts, self._delta
+
+    @staticmethod
+    def _size(postings, delta):
+        """Length of arrays indexed by lead id that can hold every indexed lead"""
+        return max(int(postings.max(initial=-1)), max(delta, default=-1)) + 1
+
+    @staticmethod
+    def _word_range(vocab, word, prefix=False):
+        """Vocabulary positions [lo, hi) of a word, or of every word it prefixes"""
+        lo = np.searchsorted(vocab, word, side='left')
+        if prefix:
+            return lo, np.searchsorted(vocab, word + _PREFIX_END, side='left')
+        return lo, lo + 1 if lo < len(vocab) and vocab[lo] == word else lo
+
+
+class PrefixIndex(WordIndex):
+    """Type-ahead index matching leads by the beginnings of their words"""
+
+    def __init__(self, fields=NAME_FIELDS):
+        super().__init__(fields)
+
+    def search(self, query, limit=None):
+        """Return ids of leads with a word starting with each query word, best first
+
+        Leads ranked first match the most query words in full rather than
+        only as a prefix; ties go to the lower id.
+        """
+        terms = list(dict.fromkeys(words(query)))
+        if not terms:
+            return np.zeros(0, dtype=np.int64)
+        vocab, offsets, postings, _, delta = self._state()
+
+        # Scores are kept in arrays indexed by lead id, so matching a common
+        # prefix is a scatter into them rather than a sort of its postings
+        delta_ids = np.fromiter(delta, dtype=np.int64, count=len(delta))
+        size = self._size(postings, delta)
+        total = None
+        for term in terms:
+            scores = np.zeros(size, dtype=np.int16)
+            lo, hi = self._word_range(vocab, term, prefix=True)
+            scores[postings[offsets[lo]:offsets[hi]]] = 1
+            lo, hi = self._word_range(vocab, term)
+            scores[postings[offsets[lo]:offsets[hi]]] = 2
+            if delta:
+                # Re-indexed leads are answered from the delta only
+                scores[delta_ids] = [
+                    2 if term in counts else 1 if any(word.startswith(term) for word in counts) else 0
+                    for counts in delta.values()
+                ]
+            total = scores if total is None else np.where((total > 0) & (scores > 0), total + scores, 0)
+
+        return top_ids(total, limit)
+
+
+class TextIndex(WordIndex):
+    """Full-text index over the free-text lead fields, ranked with BM25
+
+    Queries AND their words and accept OR between alternatives. Quoted
+    phrases are matched by checking the text of the best-scoring leads that
+    contain all of the phrase's words, only as far down the ranking as is
+    needed to fill the requested number of results.
+    """
+
+    def __init__(self, fields=TEXT_FIELDS):
+        super().__init__(fields)
+        self._lengths = np.zeros(0, dtype=np.int32)
+        self._average_length = 1.0
+
+    def _build(self, leads):
+        super()._build(leads)
+        self._lengths = np.bincount(
+            self._postings, weights=self._counts, minlength=self._size(self._postings, {})
+        ).astype(np.int32)
+        self._measure()
+
+    def _update(self, leads, changed):
+        super()._update(leads, changed)
+        delta_ids = np.fromiter(self._delta, dtype=np.int64, count=len(self._delta))
+        lengths = np.zeros(self._size(self._postings, self._delta), dtype=np.int32)
+        lengths[:len(self._lengths)] = self._lengths
+        lengths[delta_ids] = [sum(counts.values()) for counts in self._delta.values()]
+        self._lengths = lengths
+        self._measure()
+
+    def _measure(self):
+        indexed = np.count_nonzero(self._lengths)
+        self._average_length = self._lengths.sum() / indexed if indexed else 1.0
+
+    def _state(self):
+        with self._lock:
+            return (self._vocab, self._offsets, self._postings, self._counts, self._delta,
+                    self._lengths, self._average_length, self._leads)
+
+    def search(self, query, limit=None, within=None):
+        """Return ids of leads matching a query, best first; ties go to the lower id
+
+        within optionally restricts the results to an array of lead ids.
+        """
+        groups = parse_query(query)
+        if not groups:
+            return np.zeros(0, dtype=np.int64)
+        vocab, offsets, postings, counts, delta, lengths, average_length, leads = self._state()
+        size = len(lengths)
+        allowed = None
+        if within is not None:
+            within = np.asarray(within, dtype=np.int64)
+            allowed = np.zeros(size, dtype=bool)
+            allowed[within[(within >= 0) & (within < size)]] = True
+        indexed = np.count_nonzero(lengths)
+        stale = None
+        if delta:
+            stale = np.zeros(size, dtype=bool)
+            stale[np.fromiter(delta, dtype=np.int64, count=len(delta))] = True
+
+        def occurrences(word):
+            # Lead ids and counts of a word, with re-indexed leads taken from the delta
+            lo, hi = self._word_range(vocab, word)
+            lead_ids, found = postings[offsets[lo]:offsets[hi]], counts[offsets[lo]:offsets[hi]]
+            if stale is not None:
+                keep = ~stale[lead_ids]
+                changed = [(lead_id, words[word]) for lead_id, words in delta.items() if word in words]
+                lead_ids = np.concatenate((lead_ids[keep], np.array([c[0] for c in changed], dtype=np.int64)))
+                found = np.concatenate((found[keep], np.array([c[1] for c in changed], dtype=np.int64)))
+            return lead_ids, found
+
+        # Each group is scored sparsely over the postings of its words; only
+        # leads holding every word of the group come out of it
+        best = np.zeros(size)
+        pending = []
+        for group in groups:
+            group_words = list(dict.fromkeys(word for term in group for word in term))
+            total = np.zeros(size)
+            hits = np.zeros(size, dtype=np.int16)
+            for word in group_words:
+                lead_ids, tf = occurrences(word)
+                idf = math.log(1 + (indexed - len(lead_ids) + 0.5) / (len(lead_ids) + 0.5))
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[lead_ids] / average_length)
+                total[lead_ids] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+                hits[lead_ids] += 1
+            matched = hits == len(group_words)
+            lead_ids = np.flatnonzero(matched if allowed is None else matched & allowed)
+            phrases = [term for term in group if len(term) > 1]
+            if phrases:
+                pending.append((lead_ids, total[lead_ids], phrases))
+            else:
+                best[lead_ids] = np.maximum(best[lead_ids], total[lead_ids])
+
+        if pending:
+            self._check_phrases(leads, best, pending, limit)
+
+        return top_ids(best, limit)
+
+    def _check_phrases(self, leads, best, pending, limit):
+        """Add the phrase-group matches that hold up against the lead text to best
+
+        Candidates are checked best first, a batch at a time, and checking
+        stops once the top results can no longer change: there are enough
+        confirmed matches and none left unchecked could outscore them.
+        """
+        lead_ids = np.concatenate([ids for ids, _, _ in pending])
+        scores = np.concatenate([group_scores for _, group_scores, _ in pending])
+        groups = np.repeat(np.arange(len(pending)), [len(ids) for ids, _, _ in pending])
+        remaining = np.arange(len(scores))
+        batch_size = len(remaining) if limit is None else max(PHRASE_BATCH, 4 * limit)
+
+        while len(remaining):
+            if len(remaining) > batch_size:
+                split = np.argpartition(-scores[remaining], batch_size)
+                batch, remaining = remaining[split[:batch_size]], remaining[split[batch_size:]]
+            else:
+                batch, remaining = remaining, remaining[:0]
+            for group in np.unique(groups[batch]):
+                in_group = batch[groups[batch] == group]
+                found = in_group[self._contains(leads, lead_ids[in_group], pending[group][2])]
+                best[lead_ids[found]] = np.maximum(best[lead_ids[found]], scores[found])
+            if limit is not None and len(remaining):
+                confirmed = best[best > 0]
+                if len(confirmed) >= limit:
+                    kth = np.partition(confirmed, len(confirmed) - limit)[len(confirmed) - limit]
+                    if kth > scores[remaining].max():
+                        break
+
+    def _contains(self, leads, lead_ids, phrases):
+        """Which leads have every phrase, word for word, within one field"""
+        rows = leads.loc[lead_ids, list(self.fields)]
+        found = np.ones(len(lead_ids), dtype=bool)
+        for phrase in phrases:
+            pattern = _phrase_pattern(phrase)
+            in_any = np.zeros(len(lead_ids), dtype=bool)
+            for field in self.fields:
+                text = rows[field].astype(object).where(rows[field].notna(), '')
+                in_any |= text.str.contains(pattern, na=False).to_numpy(dtype=bool)
+            found &= in_any
+        return found
+
+    def snippets(self, lead_ids, query):
+        """Return (field, snippet) for each lead: its first field matching the query"""
+        query_words = {word for group in parse_query(query) for term in group for word in term}
+        if not query_words:
+            return [(None, None) for _ in lead_ids]
+        alternatives = '|'.join(map(re.escape, sorted(query_words, key=len, reverse=True)))
+        pattern = re.compile(rf'(?<![^\W_])(?:{alternatives})(?![^\W_])', re.IGNORECASE)
+        rows = self._state()[-1].loc[list(lead_ids), list(self.fields)]
+        results = []
+        for _, row in rows.iterrows():
+            for field in self.fields:
+                text = snippet(row[field], pattern) if pd.notna(row[field]) else None
+                if text is not None:
+                    results.append((field, text))
+                    break
+            else:
+                results.append((None, None))
+        return results
@@ -0,0 +1,740 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import closing
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+# Location of the on-disk lead database
+DB_PATH = os.environ.get("ACOLYTE_LEADS_DB", "acolyte_leads.db")
+
+# Immutable primary key assigned when a lead is first written
+LEAD_ID = 'lead_id'
+
+# Column order of the leads table, after the lead_id key
+LEAD_COLUMNS = [
+    # Basic Institution Information
+    'institution_name',
+    'institution_type',  # Medical College/Dental College/Other
+    'ownership',  # Private/Government/Society
+    'establishment_year',
+    'accreditation_status',  # NMC Approved, etc.
+
+    # Contact Information
+    'primary_contact_name',
+    'primary_contact_role',
+    'primary_contact_email',
+    'primary_contact_phone',
+    'secondary_contact_name',
+    'secondary_contact_role',
+
+    # Location Information
+    'territory',
+    'city',
+    'address',
+
+    # Institution Details
+    'category',  # Premium/Mid-tier/Budget
+    'current_student_count',
+    'max_student_capacity',
+    'current_lms_provider',
+    'contract_renewal_date',
+
+    # Lead Details
+    'lead_source',  # Conference/Referral/Direct/Digital
+    'lead_owner',   # Sales rep name
+    'first_contact_date',
+    'last_contact_date',
+    'next_follow_up_date',
+    'stage',        # New/Contacted/Qualified/Demo/Proposal/Negotiation/Closed
+    'stage_change_date',
+    'probability',  # Success probability percentage
+
+    # Product Interest
+    'interested_modules',  # Student/Faculty/Institution
+    'feature_requirements',
+    'technical_requirements',
+
+    # Financial Information
+    'proposed_pricing_tier',
+    'student_price_monthly',
+    'total_deal_value_annual',
+    'payment_preference',  # Monthly/Quarterly/Annual
+    'budget_confirmed',    # Yes/No
+
+    # Timeline
+    'demo_scheduled_date',
+    'proposal_sent_date',
+    'expected_close_date',
+    'actual_close_date',
+
+    # Notes and Activities
+    'last_activity',
+    'next_steps',
+    'decision_makers',
+    'competitors_involved',
+    'pain_points',
+    'notes',
+
+    # Price
+    'monthly_price',
+]
+
+
+# Column order of the append-only activities table
+ACTIVITY_COLUMNS = [
+    'lead_id',
+    'timestamp',
+    'activity_type',  # Call/Email/Meeting/Demo/Proposal/Other/Lead Updated
+    'notes',
+    'stage_from',
+    'stage_to',
+    'probability_from',
+    'probability_to',
+]
+
+
+# Allowed values of the categorical lead fields
+OWNERSHIP_TYPES = ["Private", "Government", "Society"]
+TERRITORIES = ["Bangalore Urban", "Bangalore Rural & Mysore",
+               "Mangalore & Coastal", "North Karnataka"]
+CATEGORIES = ["Premium Private", "Mid-tier Private", "Budget Private", "Government"]
+LEAD_SOURCES = ["Conference", "Referral", "Direct Outreach", "Digital Marketing", "Other"]
+STAGES = ["New", "Contacted", "Qualified", "Demo", "Proposal", "Negotiation",
+          "Closed Won", "Closed Lost"]
+PAYMENT_PREFERENCES = ["Monthly", "Quarterly", "Annual"]
+
+# Declared dtypes of the typed lead columns; the rest are free text
+LEAD_SCHEMA = {
+    'ownership': pd.CategoricalDtype(OWNERSHIP_TYPES),
+    'territory': pd.CategoricalDtype(TERRITORIES),
+    'category': pd.CategoricalDtype(CATEGORIES),
+    'lead_source': pd.CategoricalDtype(LEAD_SOURCES),
+    'stage': pd.CategoricalDtype(STAGES, ordered=True),
+    'payment_preference': pd.CategoricalDtype(PAYMENT_PREFERENCES),
+
+    'contract_renewal_date': 'datetime64[ns]',
+    'first_contact_date': 'datetime64[ns]',
+    'last_contact_date': 'datetime64[ns]',
+    'next_follow_up_date': 'datetime64[ns]',
+    'stage_change_date': 'datetime64[ns]',
+    'demo_scheduled_date': 'datetime64[ns]',
+    'proposal_sent_date': 'datetime64[ns]',
+    'expected_close_date': 'datetime64[ns]',
+    'actual_close_date': 'datetime64[ns]',
+
+    'establishment_year': 'int64',
+    'current_student_count': 'int64',
+    'max_student_capacity': 'int64',
+    'probability': 'int64',
+
+    'student_price_monthly': 'float64',
+    'total_deal_value_annual': 'float64',
+    'monthly_price': 'float64',
+}
+
+
+def cast_column(values, dtype):
+    """Cast a column of raw values to a declared lead dtype"""
+    if dtype == 'datetime64[ns]':
+        return pd.to_datetime(values, errors='coerce', format='ISO8601').astype(dtype)
+    if dtype == 'int64':
+        return pd.to_numeric(values, errors='coerce').fillna(0).astype(dtype)
+    if dtype == 'float64':
+        return pd.to_numeric(values, errors='coerce').astype(dtype)
+    return values.astype(dtype)
+
+
+def apply_schema(leads):
+    """Return leads with every declared column cast to its schema dtype"""
+    casts = {
+        column: cast_column(leads[column], dtype)
+        for column, dtype in LEAD_SCHEMA.items()
+        if column in leads.columns and leads[column].dtype != dtype
+    }
+    if not casts:
+        return leads
+    leads = leads.copy(deep=False)
+    for column, values in casts.items():
+        leads[column] = values
+    return leads
+
+
+def coerce_record(record):
+    """Convert a record's values to the scalar types of the lead schema"""
+    coerced = {}
+    for column, value in record.items():
+        dtype = LEAD_SCHEMA.get(column)
+        if dtype is None:
+            coerced[column] = _to_sql_value(value)
+        elif dtype == 'datetime64[ns]':
+            coerced[column] = pd.Timestamp(value) if value not in (None, '') else pd.NaT
+        elif dtype == 'int64':
+            coerced[column] = int(value) if pd.notna(value) else 0
+        elif dtype == 'float64':
+            coerced[column] = float(value) if pd.notna(value) else float('nan')
+        else:
+            coerced[column] = value if value in dtype.categories else None
+    return coerced
+
+
+def _quote(column):
+    return f'"{column}"'
+
+
+def _to_sql_value(value):
+    """Convert a form or pandas value into something sqlite3 can store"""
+    if value is None or value is pd.NaT:
+        return None
+    if isinstance(value, datetime):
+        if value.time() == datetime.min.time():
+            return value.date().isoformat()
+        return value.isoformat(sep=' ')
+    if isinstance(value, date):
+        return value.isoformat()
+    if hasattr(value, 'item'):  # numpy scalars
+        return value.item()
+    return value
+
+
+def connect(db_path=None):
+    """Open a connection to the lead database, creating the tables if needed"""
+    conn = sqlite3.connect(db_path or DB_PATH)
+    existing = [row[1] for row in conn.execute("PRAGMA table_info(leads)")]
+    if existing and LEAD_ID not in existing:
+        _migrate_lead_ids(conn)
+    conn.execute(f"CREATE TABLE IF NOT EXISTS leads ({_table_columns()})")
+    conn.execute(
+        f"CREATE TABLE IF NOT EXISTS activities "
+        f"(activity_id INTEGER PRIMARY KEY, {', '.join(_quote(c) for c in ACTIVITY_COLUMNS)})"
+    )
+    # A lead's timeline is one range scan of this index
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS activities_by_lead "
+        "ON activities (lead_id, timestamp, activity_id)"
+    )
+    return conn
+
+
+def _table_columns():
+    # An INTEGER PRIMARY KEY aliases the rowid, so ids are never renumbered
+    return ', '.join([f"{LEAD_ID} INTEGER PRIMARY KEY"] + [_quote(c) for c in LEAD_COLUMNS])
+
+
+def _migrate_lead_ids(conn):
+    """Rebuild a table created before lead_id existed, keeping its row ids as lead ids"""
+    columns = ', '.join(_quote(c) for c in LEAD_COLUMNS)
+    with conn:
+        conn.execute("ALTER TABLE leads RENAME TO leads_unkeyed")
+        conn.execute(f"CREATE TABLE leads ({_table_columns()})")
+        conn.execute(
+            f"INSERT INTO leads ({LEAD_ID}, {columns}) "
+            f"SELECT rowid, {columns} FROM leads_unkeyed"
+        )
+        conn.execute("DROP TABLE leads_unkeyed")
+
+
+def _index_by_id(leads):
+    """Index a frame read from disk by its lead_id column"""
+    lead_ids = leads[LEAD_ID].astype('int64')
+    leads[LEAD_ID] = lead_ids
+    leads.index = pd.Index(lead_ids.to_numpy())
+    return apply_schema(leads)
+
+
+def load_leads(columns=None, db_path=None):
+    """Load leads from disk, reading only the requested columns"""
+    columns = [LEAD_ID] + [c for c in (columns or LEAD_COLUMNS) if c != LEAD_ID]
+    with closing(connect(db_path)) as conn:
+        leads = pd.read_sql_query(
+            f"SELECT {', '.join(_quote(c) for c in columns)} FROM leads ORDER BY {LEAD_ID}",
+            conn
+        )
+    return _index_by_id(leads)
+
+
+def iter_leads(columns=None, chunksize=10000, db_path=None):
+    """Yield typed leads from disk in chunks without loading the whole table"""
+    columns = [LEAD_ID] + [c for c in (columns or LEAD_COLUMNS) if c != LEAD_ID]
+    with closing(connect(db_path)) as conn:
+        chunks = pd.read_sql_query(
+            f"SELECT {', '.join(_quote(c) for c in columns)} FROM leads ORDER BY {LEAD_ID}",
+            conn,
+            chunksize=chunksize
+        )
+        for chunk in chunks:
+            yield _index_by_id(chunk)
+
+
+def insert_lead(record, db_path=None):
+    """Persist a new lead and return its lead_id"""
+    columns = [c for c in record if c in LEAD_COLUMNS]
+    with closing(connect(db_path)) as conn, conn:
+        cursor = conn.execute(
+            f"INSERT INTO leads ({', '.join(_quote(c) for c in columns)}) "
+            f"VALUES ({', '.join('?' for _ in columns)})",
+            [_to_sql_value(record[c]) for c in columns]
+        )
+        return cursor.lastrowid
+
+
+def update_lead(lead_id, changes, db_path=None):
+    """Write changed fields of an existing lead through to disk"""
+    columns = [c for c in changes if c in LEAD_COLUMNS]
+    if not columns:
+        return
+    with closing(connect(db_path)) as conn, conn:
+        conn.execute(
+            f"UPDATE leads SET {', '.join(f'{_quote(c)} = ?' for c in columns)} "
+            f"WHERE {LEAD_ID} = ?",
+            [_to_sql_value(changes[c]) for c in columns] + [int(lead_id)]
+        )
+
+
+def log_activity(activity, db_path=None):
+    """Append an entry to a lead's activity log and return its id
+
+    Activities are never updated or deleted, so a lead's history is kept in
+    full without rewriting any earlier entry.
+    """
+    columns = [c for c in ACTIVITY_COLUMNS if c in activity]
+    with closing(connect(db_path)) as conn, conn:
+        cursor = conn.execute(
+            f"INSERT INTO activities ({', '.join(_quote(c) for c in columns)}) "
+            f"VALUES ({', '.join('?' for _ in columns)})",
+            [_to_sql_value(activity[c]) for c in columns]
+        )
+        return cursor.lastrowid
+
+
+def count_activities(lead_id, db_path=None):
+    """Return the number of activities logged for a lead"""
+    with closing(connect(db_path)) as conn:
+        return conn.execute(
+            "SELECT COUNT(*) FROM activities WHERE lead_id = ?", [int(lead_id)]
+        ).fetchone()[0]
+
+
+def last_activity_id(db_path=None):
+    """Return the id of the newest activity, or 0 if none has been logged
+
+    Activities are only ever appended, so a new id means a new entry.
+    """
+    with closing(connect(db_path)) as conn:
+        return conn.execute("SELECT MAX(activity_id) FROM activities").fetchone()[0] or 0
+
+
+def load_activities(lead_id, limit=None, offset=0, db_path=None):
+    """Load one page of a lead's activities, newest first"""
+    with closing(connect(db_path)) as conn:
+        activities = pd.read_sql_query(
+            f"SELECT {', '.join(_quote(c) for c in ACTIVITY_COLUMNS)} FROM activities "
+            f"WHERE lead_id = ? ORDER BY timestamp DESC, activity_id DESC "
+            f"LIMIT ? OFFSET ?",
+            conn,
+            params=[int(lead_id), -1 if limit is None else int(limit), int(offset)]
+        )
+    activities['timestamp'] = pd.to_datetime(activities['timestamp'], format='ISO8601')
+    return activities
+
+
+def load_stage_events(db_path=None):
+    """Load every logged stage change, sorted by lead and then time
+
+    The sort is the order of the activities_by_lead index, so SQLite reads
+    the events in index order rather than sorting them.
+    """
+    with closing(connect(db_path)) as conn:
+        events = pd.read_sql_query(
+            "SELECT lead_id, timestamp, stage_from, stage_to FROM activities "
+            "WHERE stage_from IS NOT NULL AND stage_to IS NOT NULL AND stage_from <> stage_to "
+            "ORDER BY lead_id, timestamp, activity_id",
+            conn
+        )
+    stage_dtype = LEAD_SCHEMA['stage']
+    return events.assign(
+        lead_id=events['lead_id'].astype('int64'),
+        timestamp=pd.to_datetime(events['timestamp'], format='ISO8601').astype('datetime64[ns]'),
+        stage_from=events['stage_from'].astype(stage_dtype),
+        stage_to=events['stage_to'].astype(stage_dtype),
+    )
+
+
+def insert_leads(leads, db_path=None):
+    """Persist a batch of leads in one transaction and return their lead ids"""
+    columns = [c for c in leads.columns if c in LEAD_COLUMNS]
+    values = leads[columns].astype(object)
+    for column in columns:
+        if LEAD_SCHEMA.get(column) == 'datetime64[ns]':
+            values[column] = leads[column].dt.strftime('%Y-%m-%d').astype(object)
+    values = values.where(values.notna(), None)
+
+    with closing(connect(db_path)) as conn, conn:
+        conn.execute("BEGIN IMMEDIATE")
+        first_id = conn.execute(f"SELECT COALESCE(MAX({LEAD_ID}), 0) + 1 FROM leads").fetchone()[0]
+        conn.executemany(
+            f"INSERT INTO leads ({', '.join(_quote(c) for c in columns)}) "
+            f"VALUES ({', '.join('?' for _ in columns)})",
+            values.itertuples(index=False, name=None)
+        )
+    return np.arange(first_id, first_id + len(leads))
+
+
+def insert_activities(activities, db_path=None):
+    """Append a batch of activities in one transaction"""
+    columns = [c for c in ACTIVITY_COLUMNS if c in activities.columns]
+    values = activities[columns].astype(object)
+    if 'timestamp' in columns:
+        values['timestamp'] = activities['timestamp'].dt.strftime('%Y-%m-%d %H:%M:%S').astype(object)
+    values = values.where(values.notna(), None)
+
+    with closing(connect(db_path)) as conn, conn:
+        conn.executemany(
+            f"INSERT INTO activities ({', '.join(_quote(c) for c in columns)}) "
+            f"VALUES ({', '.join('?' for _ in columns)})",
+            values.itertuples(index=False, name=None)
+        )
+
+
+def apply_overlay(leads, overlay):
+    """Return leads with an overlay of row edits and new rows applied
+
+    The overlay maps lead_id to changed values. Only the touched columns are
+    copied; every other column, and the id index, is shared with the
+    original frame.
+    """
+    if not overlay:
+        return leads
+
+    lead_ids = list(overlay)
+    positions = locate(leads, lead_ids)
+    edits = {
+        position: overlay[lead_id]
+        for lead_id, position in zip(lead_ids, positions) if position >= 0
+    }
+    new_rows = {
+        lead_id: overlay[lead_id]
+        for lead_id, position in zip(lead_ids, positions) if position < 0
+    }
+
+    patched = leads.copy(deep=False)
+    for column in {column for values in edits.values() for column in values}:
+        if column not in patched.columns or column == LEAD_ID:
+            continue
+        updated = {position: values[column] for position, values in edits.items() if column in values}
+        column_values = leads[column].copy()
+        column_values.iloc[list(updated)] = list(updated.values())
+        patched[column] = column_values
+
+    if new_rows:
+        patched = pd.concat([patched, records_frame(new_rows, patched.columns)])
+    return patched
+
+
+def locate(leads, lead_ids):
+    """Return the row positions of lead ids in a frame, -1 where absent
+
+    Lookups go through the hash table pandas keeps on the id index, so each
+    costs the same however many leads there are.
+    """
+    return leads.index.get_indexer(lead_ids)
+
+
+def records_frame(records, columns):
+    """Build a typed frame from a lead_id -> record mapping"""
+    leads = pd.DataFrame.from_dict(records, orient='index')
+    leads[LEAD_ID] = leads.index
+    return apply_schema(leads.reindex(columns=columns))
+
+
+# Seconds between full rebuilds that correct the monthly rollups for float drift
+ROLLUP_CHECK_INTERVAL = 600
+
+# Writes remembered for changes_since; consumers further behind rebuild
+CHANGE_LOG_SIZE = 1000
+
+# Monthly rollups kept current on every write, as name -> the date column
+# whose month they are keyed by, and the dimensions and figures of each row
+ROLLUP_DATES = {
+    'month': 'first_contact_date',
+    'close_month': 'expected_close_date',
+    'stage_month': 'stage_change_date',
+}
+ROLLUP_DIMENSIONS = ('territory', 'stage', 'category', 'lead_source')
+ROLLUP_FIELDS = ('count', 'valued', 'value', 'weighted', 'probability', 'priced', 'monthly_price')
+# Lead columns a rollup row is counted from, besides its date column
+ROLLUP_COLUMNS = ROLLUP_DIMENSIONS + ('total_deal_value_annual', 'probability', 'monthly_price')
+
+
+class MonthlyRollup:
+    """Running figures per month of a date column and territory x stage x category x source
+
+    Each figure is a sum over leads, so a change is applied by removing the
+    old rows' contribution and adding the new rows'. Each row is keyed by
+    one integer packing the month and the category codes, so a batch is
+    applied with one np.unique and a bincount per figure. A write replaces
+    the row dict rather than editing it, so readers never see one
+    half-applied.
+    """
+
+    def __init__(self, name, date_column, leads=None):
+        self.name = name
+        self.date_column = date_column
+        # Category codes are shifted up by one so missing values get code 0
+        self._radixes = [len(LEAD_SCHEMA[dimension].categories) + 1 for dimension in ROLLUP_DIMENSIONS]
+        self._rows = {}
+        self._frame = (None, None)
+        if leads is not None:
+            self.add(leads)
+
+    def add(self, leads, sign=1):
+        """Add the contribution of a frame of leads, or remove it with sign=-1"""
+        dates = leads[self.date_column]
+        months = ((dates.dt.year - 1970) * 12 + dates.dt.month - 1).to_numpy(dtype=np.float64)
+        dated = ~np.isnan(months)
+        if not dated.any():
+            return
+        keys = months[dated].astype(np.int64)
+        for dimension, radix in zip(ROLLUP_DIMENSIONS, self._radixes):
+            keys = keys * radix + leads[dimension].cat.codes.to_numpy()[dated] + 1
+
+        figures = _rollup_figures(leads[dated])
+        unique, inverse = np.unique(keys, return_inverse=True)
+        sums = np.column_stack([
+            np.bincount(inverse, weights=figures[:, field], minlength=len(unique))
+            for field in range(len(ROLLUP_FIELDS))
+        ])
+        rows = dict(self._rows)
+        for key, row in zip(unique.tolist(), sums):
+            total = rows.get(key, 0) + sign * row
+            if total[0] == 0:
+                rows.pop(key, None)
+            else:
+                rows[key] = total
+        self._rows = rows
+
+    def frame(self):
+        """The rollup as a frame: the month, the dimensions, then ROLLUP_FIELDS"""
+        rows = self._rows
+        built_from, frame = self._frame
+        if built_from is rows:
+            return frame
+        keys = np.fromiter(rows, dtype=np.int64, count=len(rows))
+        figures = np.array(list(rows.values())).reshape(len(rows), len(ROLLUP_FIELDS))
+        dimensions = {}
+        for dimension, radix in reversed(list(zip(ROLLUP_DIMENSIONS, self._radixes))):
+            keys, codes = np.divmod(keys, radix)
+            dimensions[dimension] = pd.Categorical.from_codes(codes - 1, dtype=LEAD_SCHEMA[dimension])
+        frame = pd.DataFrame({
+            self.name: pd.PeriodIndex.from_ordinals(keys, freq='M'),
+            **{dimension: dimensions[dimension] for dimension in ROLLUP_DIMENSIONS},
+            **dict(zip(ROLLUP_FIELDS, figures.T)),
+        })
+        self._frame = (rows, frame)
+        return frame
+
+
+def _rollup_figures(leads):
+    """Per-lead contributions to each rollup figure, one column per ROLLUP_FIELDS entry"""
+    value = leads['total_deal_value_annual']
+    price = leads['monthly_price']
+    return np.column_stack([
+        np.ones(len(leads)),
+        value.notna().to_numpy(dtype=np.float64),
+        value.fillna(0).to_numpy(dtype=np.float64),
+        (value * leads['probability'] / 100).fillna(0).to_numpy(dtype=np.float64),
+        leads['probability'].fillna(0).to_numpy(dtype=np.float64),
+        price.notna().to_numpy(dtype=np.float64),
+        price.fillna(0).to_numpy(dtype=np.float64),
+    ])
+
+
+def build_rollups(leads):
+    """A MonthlyRollup of a frame of leads for every ROLLUP_DATES entry"""
+    return {name: MonthlyRollup(name, column, leads) for name, column in ROLLUP_DATES.items()}
+
+
+class LeadStore:
+    """Process-wide lead dataset shared by every browser session
+
+    The base frame is treated as immutable: readers get it without copying
+    and writers publish a new frame rather than editing it in place. New
+    leads and bulk-imported batches are buffered and only concatenated onto
+    the base frame when a reader next asks for it, so a run of inserts costs
+    a single concat instead of one full-table copy per lead.
+    """
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path
+        self.base = load_leads(db_path=db_path)
+        self.version = 0
+        self._lock = threading.Lock()
+        # Structures derived from one base frame, rebuilt when it is replaced
+        self._derived = (None, {})
+        # lead_id -> record for leads appended since the last compaction
+        self._appended = {}
+        # Bulk-imported frames appended since the last compaction
+        self._batches = []
+        # Monthly rollups, kept current on every write
+        self.rollups = build_rollups(self.base)
+        self._rollups_checked = time.monotonic()
+        # (version, lead ids) of recent writes, for incrementally updated indexes
+        self._changes = deque(maxlen=CHANGE_LOG_SIZE)
+
+    def snapshot(self):
+        """Return the current shared lead frame, including appended leads"""
+        if self._appended or self._batches:
+            with self._lock:
+                self._compact()
+        return self.base
+
+    def get(self, lead_id):
+        """Return one lead by id, or None if there is no such lead"""
+        leads = self.snapshot()
+        position = locate(leads, [lead_id])[0]
+        return leads.iloc[position] if position >= 0 else None
+
+    def rollup(self, name):
+        """Return the rows of one of the ROLLUP_DATES monthly rollups"""
+        self._check_rollups()
+        return self.rollups[name].frame()
+
+    def _check_rollups(self):
+        """Rebuild the rollups from the leads once ROLLUP_CHECK_INTERVAL has passed"""
+        if time.monotonic() - self._rollups_checked > ROLLUP_CHECK_INTERVAL:
+            with self._lock:
+                self._compact()
+                self.rollups = build_rollups(self.base)
+                self._rollups_checked = time.monotonic()
+
+    def changes_since(self, version):
+        """Return the ids of leads written after version, or None if unknown
+
+        None means the change log no longer reaches back to version, so the
+        caller has to rebuild from a snapshot.
+        """
+        changes = [lead_ids for changed, lead_ids in list(self._changes) if changed > version]
+        if version >= self.version:
+            return np.zeros(0, dtype=np.int64)
+        if len(changes) < self.version - version:
+            return None
+        return np.unique(np.concatenate(changes))
+
+    def project(self, columns):
+        """Return a column projection of the shared frame"""
+        return self._project(self.snapshot(), columns)
+
+    def between(self, column, start=None, end=None, columns=None):
+        """Return leads whose date column falls within [start, end]
+
+        Uses a sorted index of the column, so a period filter is two binary
+        searches and a take rather than a full-column comparison.
+        """
+        leads = self.snapshot()
+        if start is None and end is None:
+            return self._project(leads, columns)
+        dates, order = self._derive(leads, ('date_index', column), _sorted_dates(column))
+        lo = 0
+        if start is not None:
+            lo = np.searchsorted(dates, pd.Timestamp(start).to_datetime64(), side='left')
+        hi = np.count_nonzero(~np.isnat(dates))
+        if end is not None:
+            hi = np.searchsorted(dates[:hi], pd.Timestamp(end).to_datetime64(), side='right')
+        positions = np.sort(order[lo:hi])
+        return self._project(leads, columns).take(positions)
+
+    def _project(self, leads, columns):
+        if not columns:
+            return leads
+        return self._derive(leads, ('project', tuple(columns)), lambda l: l[list(columns)])
+
+    def _derive(self, leads, key, build):
+        """Memoize a structure derived from a particular base frame"""
+        frame, derived = self._derived
+        if frame is not leads:
+            derived = {}
+            self._derived = (leads, derived)
+        if key not in derived:
+            derived[key] = build(leads)
+        return derived[key]
+
+    def try_publish(self, overlay):
+        """Fold a session overlay into the shared frame
+
+        Returns False without blocking if another session is publishing, in
+        which case the caller keeps its overlay and retries on its next run.
+        """
+        if not self._lock.acquire(blocking=False):
+            return False
+        try:
+            if self._batches:
+                self._compact()
+            edits, replaced, added = {}, {}, {}
+            positions = locate(self.base, list(overlay))
+            for (lead_id, values), position in zip(overlay.items(), positions):
+                if lead_id in self._appended:
+                    replaced[lead_id] = self._appended[lead_id]
+                    self._appended[lead_id] = {**self._appended[lead_id], **values}
+                    added[lead_id] = self._appended[lead_id]
+                elif position >= 0:
+                    edits[lead_id] = values
+                else:
+                    self._appended[lead_id] = dict(values)
+                    added[lead_id] = self._appended[lead_id]
+
+            # Swap the old rows' contribution to the totals for the new rows'
+            if replaced:
+                self._count(records_frame(replaced, self.base.columns), sign=-1)
+            if added:
+                self._count(records_frame(added, self.base.columns))
+            if edits:
+                edited = [position for position in positions if position >= 0]
+                self._count(self.base.take(edited), sign=-1)
+                # Edits keep the base index object, so its hash table survives
+                self.base = apply_overlay(self.base, edits)
+                self._count(self.base.take(edited))
+            # Logged before the version moves, so readers of a version see its changes
+            self._changes.append((self.version + 1, np.fromiter(overlay, dtype=np.int64, count=len(overlay))))
+            self.version += 1
+            return True
+        finally:
+            self._lock.release()
+
+    def append(self, leads):
+        """Queue a typed batch of already-persisted leads, indexed by lead_id"""
+        with self._lock:
+            self._batches.append(leads)
+            self._count(leads)
+            self._changes.append((self.version + 1, leads.index.to_numpy(dtype=np.int64)))
+            self.version += 1
+
+    def _count(self, leads, sign=1):
+        """Apply a frame's contribution to the rollups; caller holds the lock"""
+        for rollup in self.rollups.values():
+            rollup.add(leads, sign)
+
+    def _compact(self):
+        """Concatenate buffered leads onto the base frame; caller holds the lock"""
+        if not self._appended and not self._batches:
+            return
+        frames = [self.base] + [
+            apply_schema(batch.reindex(columns=self.base.columns)) for batch in self._batches
+        ]
+        if self._appended:
+            frames.append(records_frame(self._appended, self.base.columns))
+        self.base = pd.concat(frames)
+        self._appended = {}
+        self._batches = []
+
+
+def _sorted_dates(column):
+    """Build (sorted dates, row positions) for a date column; NaT sorts last"""
+    def build(leads):
+        values = leads[column].to_numpy()
+        order = np.argsort(values, kind='stable')
+        return values[order], order
+    return build
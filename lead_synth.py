@@ -0,0 +1,301 @@
+import argparse
+import json
+import os
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import lead_store
+import pricing
+
+# Leads generated from one seed; a lead depends only on the seed and its
+# block, so any write batch size gives the same dataset
+SYNTH_BLOCK = 10_000
+
+# Days of first contact history, weighted toward recent months
+HISTORY_DAYS = 3 * 365
+RECENCY_SKEW = 1.4
+
+# Share of leads in each territory, category, lead source, stage and payment
+# preference, in the order of the lead_store lists
+TERRITORY_MIX = (0.40, 0.25, 0.20, 0.15)
+CATEGORY_MIX = (0.20, 0.35, 0.30, 0.15)
+LEAD_SOURCE_MIX = (0.25, 0.30, 0.20, 0.15, 0.10)
+STAGE_MIX = (0.18, 0.16, 0.14, 0.12, 0.10, 0.07, 0.10, 0.13)
+PAYMENT_MIX = (0.50, 0.20, 0.30)
+
+# Typical success probability at each stage, and median students per category
+STAGE_PROBABILITY = (10, 20, 30, 45, 60, 75, 100, 0)
+CATEGORY_STUDENTS = (900, 600, 350, 500)
+
+# Stage changes logged per lead, counted back from its current stage
+HISTORY_STEPS = 3
+
+CITIES = {
+    "Bangalore Urban": ["Bangalore", "Whitefield", "Yelahanka", "Electronic City"],
+    "Bangalore Rural & Mysore": ["Mysore", "Mandya", "Hassan", "Tumkur", "Ramanagara"],
+    "Mangalore & Coastal": ["Mangalore", "Udupi", "Manipal", "Karwar"],
+    "North Karnataka": ["Hubli", "Dharwad", "Belgaum", "Gulbarga", "Bijapur", "Bellary"],
+}
+INSTITUTION_TYPES = ["Medical College", "Dental College", "Other"]
+INSTITUTION_TYPE_MIX = (0.6, 0.3, 0.1)
+NAME_PREFIXES = [
+    "Sri", "St. John's", "Rajiv Gandhi", "Kasturba", "JSS", "Adichunchanagiri",
+    "Vydehi", "Sapthagiri", "KVG", "Shridevi", "Navodaya", "Karnataka Institute of",
+    "Yenepoya", "Father Muller", "SDM", "BLDE", "Al-Ameen", "Sambhram",
+]
+FIRST_NAMES = [
+    "Asha", "Ravi", "Kavya", "Suresh", "Meera", "Arjun", "Lakshmi", "Vikram",
+    "Divya", "Naveen", "Priya", "Manjunath", "Anitha", "Rahul", "Shwetha", "Girish",
+]
+LAST_NAMES = [
+    "Rao", "Shetty", "Gowda", "Hegde", "Kumar", "Nayak", "Patil", "Reddy",
+    "Kulkarni", "Bhat", "Iyer", "Desai", "Naik", "Murthy",
+]
+CONTACT_ROLES = ["Dean", "Principal", "Registrar", "IT Head", "Academic Director", "Trustee"]
+LEAD_OWNERS = ["Asha", "Ravi", "Kiran", "Deepa", "Sanjay", "Nisha"]
+LMS_PROVIDERS = ["None", "Moodle", "Canvas", "Blackboard", "Google Classroom", "In-house"]
+ACCREDITATIONS = ["NMC Approved", "DCI Approved", "NAAC A", "NAAC B++", "Pending"]
+MODULES = ["Student Module", "Faculty Module", "Institution Module"]
+ACTIVITY_TYPES = ["Call", "Email", "Meeting", "Demo", "Proposal", "Other"]
+NOTE_PHRASES = [
+    "Dean keen on moving assessments online",
+    "price sensitive, asked for a multi-year discount",
+    "currently evaluating moodle alongside us",
+    "wants a pilot with two departments first",
+    "IT team raised concerns about single sign-on",
+    "budget approval expected after the board meeting",
+    "liked the faculty dashboard in the demo",
+    "renewal with the current vendor is due next term",
+    "requested references from other medical colleges",
+    "needs attendance integration with biometric devices",
+    "trustee wants a presentation on student analytics",
+    "follow up after university exams",
+]
+PAIN_POINTS = [
+    "manual attendance tracking", "scattered course material", "no exam analytics",
+    "slow results processing", "poor parent communication", "expensive current licence",
+    "limited mobile access", "compliance reporting effort",
+]
+FEATURE_REQUIREMENTS = [
+    "Online assessments", "Attendance tracking", "Parent portal", "Mobile app",
+    "Timetable management", "Analytics dashboard",
+]
+TECHNICAL_REQUIREMENTS = [
+    "Single sign-on", "On-premise hosting", "Biometric integration", "API access", "Offline mode",
+]
+NEXT_STEPS = [
+    "Qualify requirements", "Schedule discovery call", "Book a demo", "Prepare proposal",
+    "Send revised quote", "Agree contract terms", "Start onboarding", "Revisit next year",
+]
+
+
+def _choose(rng, labels, mix, count):
+    """Categorical column of count values drawn with the given shares"""
+    codes = rng.choice(len(labels), size=count, p=mix)
+    return codes, np.asarray(labels, dtype=object)[codes]
+
+
+def _phrases(rng, phrases, count, most, separator):
+    """Free text of one to most distinct phrases per lead"""
+    picks = rng.permuted(np.tile(np.arange(len(phrases)), (count, 1)), axis=1)[:, :most]
+    lengths = rng.integers(1, most + 1, size=count)
+    return [separator.join(phrases[i] for i in row[:length]) for row, length in zip(picks, lengths)]
+
+
+def _days(values):
+    return pd.to_timedelta(values, unit='D')
+
+
+def generate_block(block, seed=0, today=None, count=SYNTH_BLOCK):
+    """Generate one block of typed, priced leads and their stage-change history
+
+    Leads are indexed by their position in the dataset, and the history's
+    lead_id holds that position until the leads are written and given ids.
+    """
+    rng = np.random.default_rng([seed, block])
+    today = pd.Timestamp(today or datetime.now().date()).normalize()
+    index = pd.RangeIndex(block * SYNTH_BLOCK, block * SYNTH_BLOCK + count)
+
+    territory_codes, territories = _choose(rng, lead_store.TERRITORIES, TERRITORY_MIX, count)
+    category_codes, categories = _choose(rng, lead_store.CATEGORIES, CATEGORY_MIX, count)
+    stage_codes, stages = _choose(rng, lead_store.STAGES, STAGE_MIX, count)
+    _, lead_sources = _choose(rng, lead_store.LEAD_SOURCES, LEAD_SOURCE_MIX, count)
+    _, payment_preferences = _choose(rng, lead_store.PAYMENT_PREFERENCES, PAYMENT_MIX, count)
+    _, institution_types = _choose(rng, INSTITUTION_TYPES, INSTITUTION_TYPE_MIX, count)
+    closed = stage_codes >= lead_store.STAGES.index("Closed Won")
+    # Lost deals dropped out somewhere between Contacted and Negotiation
+    reached = np.where(
+        stages == "Closed Lost", rng.integers(1, lead_store.STAGES.index("Negotiation") + 1, size=count),
+        stage_codes
+    )
+
+    # Dates: contacted within HISTORY_DAYS, with each stage taking a few weeks
+    age = (HISTORY_DAYS * rng.random(count) ** RECENCY_SKEW).astype(np.int64)
+    first_contact = today - _days(age)
+    stage_change = first_contact + _days(np.minimum(rng.integers(5, 30, size=count) * (reached + 1), age))
+    last_contact = stage_change + _days(np.minimum(rng.integers(0, 15, size=count), (today - stage_change).days))
+    expected_close = first_contact + _days(rng.integers(60, 240, size=count))
+    # Open deals whose close date has passed have slipped into the coming months
+    slipped = ~closed & (expected_close < today)
+    expected_close = expected_close.where(~slipped, today + _days(rng.integers(15, 120, size=count)))
+
+    students = np.clip(
+        np.asarray(CATEGORY_STUDENTS)[category_codes] * rng.lognormal(0, 0.5, size=count), 50, 5000
+    ).astype(np.int64)
+    monthly_prices, annual_values = pricing.deal_values(students, payment_preferences)
+    probability = np.clip(
+        np.asarray(STAGE_PROBABILITY)[stage_codes] + rng.integers(-10, 11, size=count), 0, 100
+    )
+    probability = np.where(closed, np.asarray(STAGE_PROBABILITY)[stage_codes], probability)
+
+    cities = np.array([
+        CITIES[territory][i % len(CITIES[territory])]
+        for territory, i in zip(territories, rng.integers(0, 60, size=count))
+    ], dtype=object)
+    prefixes = np.asarray(NAME_PREFIXES, dtype=object)[rng.integers(0, len(NAME_PREFIXES), size=count)]
+    first_names = np.asarray(FIRST_NAMES, dtype=object)[rng.integers(0, len(FIRST_NAMES), size=count)]
+    last_names = np.asarray(LAST_NAMES, dtype=object)[rng.integers(0, len(LAST_NAMES), size=count)]
+    module_sets = [json.dumps([m for bit, m in enumerate(MODULES) if mask & (1 << bit)]) for mask in range(1, 8)]
+    lms = np.asarray(LMS_PROVIDERS, dtype=object)[rng.integers(0, len(LMS_PROVIDERS), size=count)]
+
+    leads = pd.DataFrame({
+        'institution_name': [
+            f"{prefix} {kind} {city} {number}"
+            for prefix, kind, city, number in zip(prefixes, institution_types, cities, index)
+        ],
+        'institution_type': institution_types,
+        'ownership': np.where(
+            categories == "Government", "Government", np.where(rng.random(count) < 0.8, "Private", "Society")
+        ),
+        'establishment_year': rng.integers(1950, 2021, size=count),
+        'accreditation_status': np.asarray(ACCREDITATIONS, dtype=object)[rng.integers(0, len(ACCREDITATIONS), size=count)],
+        'primary_contact_name': first_names + " " + last_names,
+        'primary_contact_role': np.asarray(CONTACT_ROLES, dtype=object)[rng.integers(0, len(CONTACT_ROLES), size=count)],
+        'primary_contact_email': [
+            f"{first.lower()}.{last.lower()}{number}@example.edu.in"
+            for first, last, number in zip(first_names, last_names, index)
+        ],
+        'primary_contact_phone': [f"+91 9{number:09d}" for number in rng.integers(0, 10**9, size=count)],
+        'secondary_contact_name': np.where(
+            rng.random(count) < 0.5, None,
+            np.asarray(FIRST_NAMES, dtype=object)[rng.integers(0, len(FIRST_NAMES), size=count)]
+        ),
+        'secondary_contact_role': np.asarray(CONTACT_ROLES, dtype=object)[rng.integers(0, len(CONTACT_ROLES), size=count)],
+        'territory': territories,
+        'city': cities,
+        'address': [f"{number} Main Road, {city}" for number, city in zip(rng.integers(1, 500, size=count), cities)],
+        'category': categories,
+        'current_student_count': students,
+        'max_student_capacity': (students * rng.uniform(1.0, 1.5, size=count)).astype(np.int64),
+        'current_lms_provider': lms,
+        'contract_renewal_date': (today + _days(rng.integers(30, 720, size=count))).where(lms != "None"),
+        'lead_source': lead_sources,
+        'lead_owner': np.asarray(LEAD_OWNERS, dtype=object)[rng.integers(0, len(LEAD_OWNERS), size=count)],
+        'first_contact_date': first_contact,
+        'last_contact_date': last_contact,
+        'next_follow_up_date': (last_contact + _days(rng.integers(7, 22, size=count))).where(~closed),
+        'stage': stages,
+        'stage_change_date': stage_change,
+        'probability': probability,
+        'interested_modules': np.asarray(module_sets, dtype=object)[rng.integers(0, len(module_sets), size=count)],
+        'feature_requirements': _phrases(rng, FEATURE_REQUIREMENTS, count, 3, ", "),
+        'technical_requirements': np.asarray(TECHNICAL_REQUIREMENTS, dtype=object)[
+            rng.integers(0, len(TECHNICAL_REQUIREMENTS), size=count)
+        ],
+        'proposed_pricing_tier': pricing.DEFAULT_CAPACITY,
+        'student_price_monthly': monthly_prices,
+        'total_deal_value_annual': annual_values,
+        'payment_preference': payment_preferences,
+        'budget_confirmed': np.where(rng.random(count) < (reached + 1) / len(lead_store.STAGES), "Yes", "No"),
+        'demo_scheduled_date': (first_contact + _days(rng.integers(5, 40, size=count))).where(
+            reached >= lead_store.STAGES.index("Demo")
+        ),
+        'proposal_sent_date': (first_contact + _days(rng.integers(20, 60, size=count))).where(
+            reached >= lead_store.STAGES.index("Proposal")
+        ),
+        'expected_close_date': expected_close,
+        'actual_close_date': stage_change.where(closed),
+        'last_activity': np.asarray(ACTIVITY_TYPES, dtype=object)[rng.integers(0, len(ACTIVITY_TYPES), size=count)],
+        'next_steps': np.asarray(NEXT_STEPS, dtype=object)[np.minimum(reached, len(NEXT_STEPS) - 1)],
+        'decision_makers': np.asarray(CONTACT_ROLES, dtype=object)[rng.integers(0, len(CONTACT_ROLES), size=count)],
+        'competitors_involved': np.where(lms == "None", None, lms),
+        'pain_points': _phrases(rng, PAIN_POINTS, count, 2, "; "),
+        'notes': _phrases(rng, NOTE_PHRASES, count, 3, ". "),
+        'monthly_price': monthly_prices,
+    }, index=index)
+    history = _stage_history(index.to_numpy(), stage_codes, reached, first_contact, stage_change)
+    return lead_store.apply_schema(leads), history
+
+
+def _stage_history(positions, stage_codes, reached, first_contact, stage_change):
+    """Up to HISTORY_STEPS stage changes per lead, one stage at a time up to its current stage
+
+    A lost deal's last change is from the stage it reached. The changes are
+    spread evenly between the first contact and stage change dates.
+    """
+    lost = stage_codes == lead_store.STAGES.index("Closed Lost")
+    # Position in the funnel after each lead's last change
+    final = np.where(lost, reached + 1, stage_codes)
+    first = first_contact.to_numpy()
+    span = stage_change.to_numpy() - first
+
+    frames = []
+    for step in range(HISTORY_STEPS):
+        target = final - step
+        moved = target >= 1
+        last_loss = lost[moved] & (step == 0)
+        frames.append(pd.DataFrame({
+            'lead_id': positions[moved],
+            'timestamp': first[moved] + span[moved] * (1 - step / HISTORY_STEPS) + np.timedelta64(9, 'h'),
+            'activity_type': "Lead Updated",
+            'stage_from': pd.Categorical.from_codes(
+                target[moved] - 1, dtype=lead_store.LEAD_SCHEMA['stage']
+            ),
+            'stage_to': pd.Categorical.from_codes(
+                np.where(last_loss, stage_codes[moved], target[moved]), dtype=lead_store.LEAD_SCHEMA['stage']
+            ),
+        }))
+    # Oldest changes first, so ties on timestamp still read back in order
+    return pd.concat(frames[::-1], ignore_index=True)
+
+
+def write_leads(db_path, count, seed=0, today=None, activities=True):
+    """Write count generated leads, and optionally their history, to a lead database
+
+    Yields the number of leads written after each block.
+    """
+    today = pd.Timestamp(today or datetime.now().date()).normalize()
+    written = 0
+    for block in range(-(-count // SYNTH_BLOCK)):
+        leads, history = generate_block(block, seed, today, min(SYNTH_BLOCK, count - written))
+        lead_ids = lead_store.insert_leads(leads, db_path)
+        if activities:
+            history['lead_id'] = lead_ids[history['lead_id'] - leads.index[0]]
+            lead_store.insert_activities(history, db_path)
+        written += len(leads)
+        yield written
+
+
+def main(argv=None):
+    """Command-line entry point: fill a new lead database with synthetic leads"""
+    parser = argparse.ArgumentParser(description="Acolyte synthetic lead generator")
+    parser.add_argument("path", help="Lead database to create")
+    parser.add_argument("--leads", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--today", help="Date the history ends on (YYYY-MM-DD, defaults to today)")
+    parser.add_argument("--no-activities", action="store_true", help="Skip the stage-change history")
+    args = parser.parse_args(argv)
+
+    if os.path.exists(args.path):
+        parser.error(f"{args.path} already exists")
+    started = time.perf_counter()
+    for written in write_leads(args.path, args.leads, args.seed, args.today, not args.no_activities):
+        print(f"\r{written:,} of {args.leads:,} leads written", end="", flush=True)
+    print(f"\nDone in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
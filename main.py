@@ -5,116 +5,319 @@ import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 from datetime import datetime, timedelta
 import json
+import os
+
+import analytics
+import forecast
+import lead_cube
+import lead_io
+import lead_search
+import lead_store
+import pricing
 
 # Configure the page
 st.set_page_config(page_title="Acolyte Lead Management", layout="wide")
 
-# Initialize session state for data persistence
-if 'leads' not in st.session_state:
-    st.session_state.leads = pd.DataFrame({
-        # Basic Institution Information
-        'institution_name': [],
-        'institution_type': [],  # Medical College/Dental College/Other
-        'ownership': [],  # Private/Government/Society
-        'establishment_year': [],
-        'accreditation_status': [],  # NMC Approved, etc.
-        
-        # Contact Information
-        'primary_contact_name': [],
-        'primary_contact_role': [],
-        'primary_contact_email': [],
-        'primary_contact_phone': [],
-        'secondary_contact_name': [],
-        'secondary_contact_role': [],
-        
-        # Location Information
-        'territory': [],
-        'city': [],
-        'address': [],
-        
-        # Institution Details
-        'category': [],  # Premium/Mid-tier/Budget
-        'current_student_count': [],
-        'max_student_capacity': [],
-        'current_lms_provider': [],
-        'contract_renewal_date': [],
-        
-        # Lead Details
-        'lead_source': [],  # Conference/Referral/Direct/Digital
-        'lead_owner': [],   # Sales rep name
-        'first_contact_date': [],
-        'last_contact_date': [],
-        'next_follow_up_date': [],
-        'stage': [],        # New/Contacted/Qualified/Demo/Proposal/Negotiation/Closed
-        'stage_change_date': [],
-        'probability': [],  # Success probability percentage
-        
-        # Product Interest
-        'interested_modules': [],  # Student/Faculty/Institution
-        'feature_requirements': [],
-        'technical_requirements': [],
-        
-        # Financial Information
-        'proposed_pricing_tier': [],
-        'student_price_monthly': [],
-        'total_deal_value_annual': [],
-        'payment_preference': [],  # Monthly/Quarterly/Annual
-        'budget_confirmed': [],    # Yes/No
-        
-        # Timeline
-        'demo_scheduled_date': [],
-        'proposal_sent_date': [],
-        'expected_close_date': [],
-        'actual_close_date': [],
-        
-        # Notes and Activities
-        'last_activity': [],
-        'next_steps': [],
-        'decision_makers': [],
-        'competitors_involved': [],
-        'pain_points': [],
-                'notes': [],
-                #Price
-                'monthly_price': [],
-                'total_deal_value_annual': []
-    })
+# Edits this session has made that are not yet in the shared dataset
+if 'lead_overlay' not in st.session_state:
+    st.session_state.lead_overlay = {}
+
+# Activities shown per page of a lead's timeline
+ACTIVITY_PAGE_SIZE = 20
+
+# Expansion targets per territory
+TERRITORY_TARGETS = {
+    'Bangalore Urban': {'target_institutions': 15, 'potential_students': 4500},
+    'Bangalore Rural & Mysore': {'target_institutions': 8, 'potential_students': 2400},
+    'Mangalore & Coastal': {'target_institutions': 6, 'potential_students': 1800},
+    'North Karnataka': {'target_institutions': 5, 'potential_students': 1500}
+}
+
+# Columns of the dashboard's lead table, and its page sizes
+LEAD_TABLE_COLUMNS = [
+    'institution_name', 'territory', 'category', 'stage',
+    'current_student_count', 'total_deal_value_annual',
+    'probability', 'expected_close_date'
+]
+LEAD_PAGE_SIZES = [25, 50, 100]
+
+# Matches offered by the lead search
+LEAD_SEARCH_LIMIT = 20
+
+# Lead columns the edit form changes, each also naming its widget
+EDIT_FIELDS = (
+    'institution_name', 'institution_type', 'ownership', 'establishment_year',
+    'territory', 'city', 'category', 'primary_contact_name',
+    'primary_contact_role', 'primary_contact_email', 'primary_contact_phone',
+    'secondary_contact_name', 'secondary_contact_role', 'decision_makers',
+    'current_student_count', 'max_student_capacity', 'current_lms_provider',
+    'interested_modules', 'payment_preference', 'budget_confirmed',
+    'competitors_involved', 'stage', 'probability', 'demo_scheduled_date',
+    'expected_close_date', 'next_follow_up_date', 'notes', 'pain_points',
+    'next_steps',
+)
+
+# Trial counts offered by the revenue simulation
+SIMULATION_TRIALS = [5_000, 10_000, 50_000, 100_000]
+
+# Monthly rollup name of each date column the store keeps one for
+ROLLUP_MONTHS = {column: name for name, column in lead_store.ROLLUP_DATES.items()}
+
+# Months the series forecasts look ahead, and how many of them the monthly
+# trend charts draw
+FORECAST_HORIZON = 12
+TREND_PROJECTION_MONTHS = 3
+
+# Columns aggregated by the lead analytics page
+ANALYTICS_COLUMNS = (
+    'institution_name', 'territory', 'stage', 'lead_source',
+    'first_contact_date', 'total_deal_value_annual', 'probability'
+)
+
+@st.cache_resource
+def get_lead_store():
+    """Load persisted leads once per process and share them across sessions"""
+    return lead_store.LeadStore()
+
+def current_leads(columns=None):
+    """Return the shared leads with this session's unpublished edits applied"""
+    store = get_lead_store()
+    overlay = st.session_state.lead_overlay
+    if overlay and store.try_publish(overlay):
+        overlay.clear()
+    leads = store.project(columns) if columns else store.snapshot()
+    return lead_store.apply_overlay(leads, overlay)
+
+def current_lead(lead_id):
+    """Return one lead with this session's unpublished edits applied"""
+    store = get_lead_store()
+    overlay = st.session_state.lead_overlay
+    if overlay and store.try_publish(overlay):
+        overlay.clear()
+    if lead_id in overlay:
+        return lead_store.apply_overlay(store.snapshot(), {lead_id: overlay[lead_id]}).loc[lead_id]
+    return store.get(lead_id)
+
+def leads_between(column, start=None, end=None, columns=None):
+    """Return current leads whose date column falls within [start, end]"""
+    if start is None and end is None:
+        return current_leads(columns)
+    if st.session_state.lead_overlay:
+        # Unpublished edits are not in the shared date index yet
+        leads = current_leads(columns)
+        dates = leads[column]
+        mask = dates.notna()
+        if start is not None:
+            mask &= dates >= start
+        if end is not None:
+            mask &= dates <= end
+        return leads[mask]
+    return get_lead_store().between(column, start, end, columns)
+
+@st.cache_resource(max_entries=2)
+def stage_intervals(version, last_activity):
+    """Stage history of every lead, rebuilt once per dataset version
+    
+    A stage change is logged before its edit is published, and a failed
+    publish leaves the version alone, so the newest activity id is part of
+    the key too.
+    """
+    leads = get_lead_store().snapshot()
+    return analytics.stage_intervals(
+        leads.index.to_numpy(),
+        leads['first_contact_date'].to_numpy(),
+        leads['stage'],
+        lead_store.load_stage_events()
+    )
 
-def calculate_deal_metrics(student_count, category, payment_preference):
-    """Calculate deal metrics based on Acolyte's pricing structure"""
-    # Base monthly price calculation
-    if student_count >= 1000:
-        monthly_price = 300
-    elif student_count >= 500:
-        monthly_price = 450
-    else:
-        monthly_price = 750
-        
-    # Apply payment preference adjustments
-    if payment_preference == "Quarterly":
-        monthly_price *= 0.9  # 10% discount
-    elif payment_preference == "Annual":
-        monthly_price *= 0.8  # 20% discount
-        
-    annual_value = monthly_price * 12 * student_count
-    return monthly_price, annual_value
-def calculate_deal_value(student_count, payment_preference):
-    """Calculate monthly price and annual deal value based on Acolyte's pricing structure"""
-    # Base monthly price calculation
-    if student_count >= 1000:
-        monthly_price = 300
-    elif student_count >= 500:
-        monthly_price = 450
+@st.cache_resource
+def get_lead_cube():
+    """Pre-aggregated lead cube, kept in step with the store and shared by every session"""
+    return lead_cube.LeadCube()
+
+def period_cube(start=None, end=None):
+    """Cube of the current leads first contacted within [start, end]
+    
+    Filters dice this cube instead of scanning leads. With unpublished edits
+    this session's leads are counted into a cube of their own, since the
+    shared one does not include them yet.
+    """
+    if st.session_state.lead_overlay:
+        cube = lead_cube.Cube.build(leads_between('first_contact_date', start, end, lead_cube.CUBE_COLUMNS))
+        if start is None and end is None:
+            cube = cube.roll_up(lead_cube.CUBE_DIMENSIONS)
+        return cube
+    cube = get_lead_cube()
+    cube.sync(get_lead_store())
+    return cube.period(start, end)
+
+def average_deal(totals):
+    """Mean deal value of a totals dict"""
+    return totals['value'] / totals['valued'] if totals['valued'] else float('nan')
+
+@st.cache_resource
+def get_aggregate_cache():
+    """Aggregation results shared by every page and session"""
+    return analytics.AggregateCache()
+
+def cached_aggregate(key, compute):
+    """Return compute() for the current dataset version, computing it once per key
+    
+    Results are shared between pages, reruns and sessions and must not be
+    modified.
+    """
+    if st.session_state.lead_overlay:
+        # Unpublished edits are not part of any cached version
+        return compute()
+    return get_aggregate_cache().get((get_lead_store().version,) + tuple(key), compute)
+
+def pipeline_summary(by, column='first_contact_date', start=None, end=None):
+    """Summarize leads whose date column is within [start, end], grouped by column(s)
+    
+    Results are cached per dataset version, filter and grouping, so pages and
+    reruns asking for the same summary share one groupby.
+    """
+    by = (by,) if isinstance(by, str) else tuple(by)
+    
+    # Monthly trends are read from the store's rollup of the date column; a
+    # month the period covers only part of is recounted from its leads
+    month = ROLLUP_MONTHS.get(column)
+    rollup_columns = {month, *lead_store.ROLLUP_DIMENSIONS}
+    if month in by and rollup_columns.issuperset(by) and not st.session_state.lead_overlay:
+        def compute():
+            rollup = get_lead_store().rollup(month)
+            months = rollup[month]
+            keep = months.notna()
+            partial = []
+            if start is not None:
+                first = pd.Period(start, freq='M')
+                keep &= months >= first
+                if first.start_time < pd.Timestamp(start):
+                    partial.append(first)
+            if end is not None:
+                last = pd.Period(end, freq='M')
+                keep &= months <= last
+                if last.end_time > pd.Timestamp(end) and last not in partial:
+                    partial.append(last)
+            rows = [rollup[keep & ~months.isin(partial)]]
+            for period in partial:
+                leads = leads_between(
+                    column,
+                    max(period.start_time, pd.Timestamp(start)) if start is not None else period.start_time,
+                    min(period.end_time, pd.Timestamp(end)) if end is not None else period.end_time,
+                    (column,) + lead_store.ROLLUP_COLUMNS
+                )
+                rows.append(lead_store.MonthlyRollup(month, column, leads).frame())
+            return analytics.rollup_summary(pd.concat(rows, ignore_index=True), by)
     else:
-        monthly_price = 750
-        
-    # Apply payment preference adjustments
-    if payment_preference == "Quarterly":
-        monthly_price *= 0.9  # 10% discount
-    elif payment_preference == "Annual":
-        monthly_price *= 0.8  # 20% discount
-        
-    annual_value = monthly_price * 12 * student_count
-    return monthly_price, annual_value
+        def compute():
+            leads = leads_between(column, start, end, analytics.SUMMARY_COLUMNS)
+            return analytics.aggregate(leads, by)
+    
+    return cached_aggregate(((column, start, end), by, analytics.PIPELINE_SUMMARY), compute)
+
+def series_forecasts():
+    """Monthly territory x category rollups and their forecasts
+    
+    Fitted once per dataset version and month, for every page that projects
+    a trend.
+    """
+    this_month = str(pd.Period(datetime.now(), freq='M'))
+    
+    def compute():
+        store = get_lead_store()
+        rollups = {name: store.rollup(name) for name in lead_store.ROLLUP_DATES}
+        series = forecast.monthly_series(rollups, end=this_month)
+        return series, forecast.forecast_series(series, FORECAST_HORIZON)
+    
+    return cached_aggregate(('series_forecasts', this_month, FORECAST_HORIZON), compute)
+
+def measure_forecast(measure):
+    """Forecast rows of one series measure, indexed by territory and category"""
+    forecasts = series_forecasts()[1]['forecast']
+    return forecasts[forecasts.index.get_level_values('measure') == measure].droplevel('measure')
+
+def projected_trend(measure, months=TREND_PROJECTION_MONTHS):
+    """Forecast of a series measure over all territories and categories, by month name"""
+    totals = measure_forecast(measure).sum().iloc[:months]
+    return totals.set_axis(totals.index.astype(str))
+
+def lazy_tabs(labels, key):
+    """Tabs that only run the selected tab's body
+    
+    Switching tabs reruns the page, and only the selected container's .open
+    is true, so callers guard each body with it and hidden tabs cost nothing.
+    """
+    return st.tabs(labels, key=key, on_change="rerun")
+
+def histogram_figure(values, title, xaxis_title, bins=20):
+    """Histogram chart built from server-side bin counts"""
+    counts, edges = analytics.histogram(values, bins)
+    fig = go.Figure(go.Bar(
+        x=(edges[:-1] + edges[1:]) / 2,
+        y=counts,
+        width=edges[1:] - edges[:-1],
+        customdata=list(zip(edges[:-1], edges[1:])),
+        hovertemplate="%{customdata[0]:,.0f} – %{customdata[1]:,.0f}: %{y:,}<extra></extra>"
+    ))
+    fig.update_layout(title=title, xaxis_title=xaxis_title, yaxis_title="count", bargap=0)
+    return fig
+
+def box_figure(values, title, yaxis_title):
+    """Box plot built from server-side quartiles, whiskers and sampled outliers"""
+    summary = analytics.box_summary(values)
+    fig = go.Figure()
+    if summary is not None:
+        fig.add_trace(go.Box(
+            x=[yaxis_title],
+            q1=[summary['q1']],
+            median=[summary['median']],
+            q3=[summary['q3']],
+            lowerfence=[summary['lower']],
+            upperfence=[summary['upper']],
+            mean=[summary['mean']],
+            name=f"{summary['count']:,} leads"
+        ))
+        if len(summary['outliers']):
+            fig.add_trace(go.Scatter(
+                x=[yaxis_title] * len(summary['outliers']),
+                y=summary['outliers'],
+                mode='markers',
+                name=f"Outliers ({summary['outlier_count']:,})"
+            ))
+    fig.update_layout(title=title, yaxis_title=yaxis_title, showlegend=False)
+    return fig
+
+@st.cache_resource
+def get_name_index():
+    """Type-ahead index over lead names, cities and contacts, shared by every session"""
+    return lead_search.PrefixIndex(lead_search.NAME_FIELDS)
+
+def search_lead_names(query):
+    """Ids of leads matching a type-ahead query, best first"""
+    index = get_name_index()
+    index.sync(get_lead_store())
+    return index.search(query)
+
+@st.cache_resource
+def get_text_index():
+    """Full-text index over the free-text lead fields, shared by every session"""
+    return lead_search.TextIndex(lead_search.TEXT_FIELDS)
+
+def search_lead_text(query, within=None):
+    """The best leads matching a full-text query, with a snippet from each"""
+    index = get_text_index()
+    index.sync(get_lead_store())
+    lead_ids = index.search(query, LEAD_SEARCH_LIMIT, within)
+    return lead_ids, index.snippets(lead_ids, query)
+
+def stage_lead_changes(lead_id, changes):
+    """Record a saved lead change in the session overlay and try to publish it"""
+    overlay = st.session_state.lead_overlay
+    overlay.setdefault(lead_id, {}).update(lead_store.coerce_record(changes))
+    if get_lead_store().try_publish(overlay):
+        overlay.clear()
+
 def create_lead_form():
     """Create a detailed lead entry form"""
     with st.form("new_lead_form"):
@@ -218,62 +421,124 @@ def create_lead_form():
         
         if submitted:
             # Calculate pricing
-            monthly_price, annual_value = calculate_deal_value(
-            current_student_count, 
-            payment_preference
-        )
+            monthly_price, annual_value = pricing.deal_value(
+                current_student_count,
+                payment_preference
+            )
             
             # Create new lead entry
-            new_lead = pd.DataFrame({
-                'institution_name': [institution_name],
-                'institution_type': [institution_type],
-                'ownership': [ownership],
-                'establishment_year': [establishment_year],
-                'accreditation_status': [accreditation_status],
-                'primary_contact_name': [primary_contact_name],
-                'primary_contact_role': [primary_contact_role],
-                'primary_contact_email': [primary_contact_email],
-                'primary_contact_phone': [primary_contact_phone],
-                'secondary_contact_name': [secondary_contact_name],
-                'secondary_contact_role': [secondary_contact_role],
-                'territory': [territory],
-                'city': [city],
-                'category': [category],
-                'current_student_count': [current_student_count],
-                'max_student_capacity': [max_student_capacity],
-                'current_lms_provider': [current_lms],
-                'lead_source': [lead_source],
-                'lead_owner': [lead_owner],
-                'first_contact_date': [datetime.now().date()],
-                'last_contact_date': [datetime.now().date()],
-                'next_follow_up_date': [next_follow_up],
-                'stage': [stage],
-                'stage_change_date': [datetime.now().date()],
-                'probability': [probability],
-                'interested_modules': [json.dumps(interested_modules)],
-                'student_price_monthly': [monthly_price],
-                'total_deal_value_annual': [annual_value],
-                'payment_preference': [payment_preference],
-                'budget_confirmed': [budget_confirmed],
-                'demo_scheduled_date': [demo_date],
-                'expected_close_date': [expected_close],
-                'decision_makers': [decision_makers],
-                'competitors_involved': [competitors],
-                'pain_points': [pain_points],
-                'notes': [notes],
-                'next_steps': [next_steps],
-                'monthly_price': [monthly_price],
-                'total_deal_value_annual': [annual_value]
-            })
+            new_lead = {
+                'institution_name': institution_name,
+                'institution_type': institution_type,
+                'ownership': ownership,
+                'establishment_year': establishment_year,
+                'accreditation_status': accreditation_status,
+                'primary_contact_name': primary_contact_name,
+                'primary_contact_role': primary_contact_role,
+                'primary_contact_email': primary_contact_email,
+                'primary_contact_phone': primary_contact_phone,
+                'secondary_contact_name': secondary_contact_name,
+                'secondary_contact_role': secondary_contact_role,
+                'territory': territory,
+                'city': city,
+                'category': category,
+                'current_student_count': current_student_count,
+                'max_student_capacity': max_student_capacity,
+                'current_lms_provider': current_lms,
+                'lead_source': lead_source,
+                'lead_owner': lead_owner,
+                'first_contact_date': datetime.now().date(),
+                'last_contact_date': datetime.now().date(),
+                'next_follow_up_date': next_follow_up,
+                'stage': stage,
+                'stage_change_date': datetime.now().date(),
+                'probability': probability,
+                'interested_modules': json.dumps(interested_modules),
+                'student_price_monthly': monthly_price,
+                'total_deal_value_annual': annual_value,
+                'payment_preference': payment_preference,
+                'budget_confirmed': budget_confirmed,
+                'demo_scheduled_date': demo_date,
+                'expected_close_date': expected_close,
+                'decision_makers': decision_makers,
+                'competitors_involved': competitors,
+                'pain_points': pain_points,
+                'notes': notes,
+                'next_steps': next_steps,
+                'monthly_price': monthly_price
+            }
             
-            st.session_state.leads = pd.concat([st.session_state.leads, new_lead], ignore_index=True)
+            # Write the lead through to disk and append it to the shared dataset
+            lead_id = lead_store.insert_lead(new_lead)
+            stage_lead_changes(lead_id, new_lead)
             st.success("Lead added successfully!")
             
+def bulk_import_leads():
+    """Bulk import leads from a CSV or Excel file"""
+    st.subheader("Import Leads")
+    
+    st.write(
+        "Upload a CSV or Excel file whose column headers match the lead fields "
+        "(institution_name, territory, category, stage, ...). Rows are validated "
+        "and priced in batches; rows that fail validation are reported below."
+    )
+    
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        uploaded_file = st.file_uploader("Lead File", type=["csv", "xlsx"])
+    with col2:
+        chunk_size = st.number_input(
+            "Rows per Batch",
+            min_value=100,
+            value=lead_io.DEFAULT_CHUNK_SIZE,
+            step=100
+        )
+    
+    if uploaded_file is None or not st.button("Import Leads"):
+        return
+    
+    status = st.empty()
+    report = None
+    try:
+        for report in lead_io.iter_import(
+            uploaded_file, uploaded_file.name, int(chunk_size),
+            on_batch=get_lead_store().append
+        ):
+            status.info(
+                f"{report['imported']:,} imported, {report['rejected']:,} rejected "
+                f"({report['rows_per_second']:,.0f} rows/s)"
+            )
+    except (ImportError, ValueError) as e:
+        st.error(f"Import failed: {e}")
+        return
+    
+    if report is None:
+        st.warning("The file contains no rows.")
+        return
+    
+    st.success(
+        f"Imported {report['imported']:,} leads in {report['elapsed']:.1f}s "
+        f"({report['rows_per_second']:,.0f} rows/s)"
+    )
+    
+    if report['rejected']:
+        st.warning(f"{report['rejected']:,} rows were rejected")
+        rejected_rows = pd.concat(report['rejected_rows'])
+        st.dataframe(rejected_rows, use_container_width=True)
+        st.download_button(
+            "Download Rejected Rows",
+            rejected_rows.to_csv(index_label='row'),
+            file_name="rejected_leads.csv",
+            mime="text/csv"
+        )
+            
 def view_lead_dashboard():
     """Create a comprehensive lead viewing dashboard"""
     st.subheader("Lead Dashboard")
     
-    if st.session_state.leads.empty:
+    leads = current_leads()
+    
+    if leads.empty:
         st.warning("No leads in the database yet.")
         return
         
@@ -282,21 +547,21 @@ def view_lead_dashboard():
     with col1:
         territory_filter = st.multiselect(
             "Filter by Territory",
-            options=st.session_state.leads['territory'].unique()
+            options=leads['territory'].unique()
         )
     with col2:
         stage_filter = st.multiselect(
             "Filter by Stage",
-            options=st.session_state.leads['stage'].unique()
+            options=leads['stage'].unique()
         )
     with col3:
         category_filter = st.multiselect(
             "Filter by Category",
-            options=st.session_state.leads['category'].unique()
+            options=leads['category'].unique()
         )
         
     # Apply filters
-    filtered_leads = st.session_state.leads.copy()
+    filtered_leads = leads
     if territory_filter:
         filtered_leads = filtered_leads[filtered_leads['territory'].isin(territory_filter)]
     if stage_filter:
@@ -304,29 +569,33 @@ def view_lead_dashboard():
     if category_filter:
         filtered_leads = filtered_leads[filtered_leads['category'].isin(category_filter)]
         
-    # Summary metrics
+    # Summary metrics and the stage chart are diced out of the lead cube
+    filtered_cube = period_cube().dice(
+        territory=territory_filter or None,
+        stage=stage_filter or None,
+        category=category_filter or None
+    )
+    totals = filtered_cube.totals()
+    
     col1, col2, col3, col4 = st.columns(4)
     with col1:
-        st.metric("Total Leads", len(filtered_leads))
+        st.metric("Total Leads", int(totals['count']))
     with col2:
-        st.metric("Total Pipeline Value", f"₹{filtered_leads['total_deal_value_annual'].sum():,.2f}")
+        st.metric("Total Pipeline Value", f"₹{totals['value']:,.2f}")
     with col3:
         st.metric("Avg Deal Size", 
-                 f"₹{filtered_leads['total_deal_value_annual'].mean():,.2f}")
+                 f"₹{average_deal(totals):,.2f}")
     with col4:
-        weighted_pipeline = (filtered_leads['total_deal_value_annual'] * 
-                           filtered_leads['probability'] / 100).sum()
-        st.metric("Weighted Pipeline", f"₹{weighted_pipeline:,.2f}")
+        st.metric("Weighted Pipeline", f"₹{totals['weighted']:,.2f}")
         
     # Pipeline visualization
     fig = go.Figure()
-    stages = filtered_leads['stage'].unique()
-    for stage in stages:
-        stage_data = filtered_leads[filtered_leads['stage'] == stage]
+    stage_values = analytics.cube_summary(filtered_cube, 'stage')['total_value']
+    for stage, value in stage_values.items():
         fig.add_trace(go.Bar(
             name=stage,
-            y=[stage_data['total_deal_value_annual'].sum()],
-            text=[f"₹{stage_data['total_deal_value_annual'].sum():,.0f}"],
+            y=[value],
+            text=[f"₹{value:,.0f}"],
             textposition='auto',
         ))
     fig.update_layout(
@@ -336,147 +605,331 @@ def view_lead_dashboard():
     )
     st.plotly_chart(fig)
     
-    # Leads table with detailed view
+    # Export the filtered leads
+    with st.expander("Export Leads"):
+        col1, col2 = st.columns(2)
+        with col1:
+            export_period = st.selectbox(
+                "First Contact Period",
+                ["All Time", "Last 30 Days", "Last Quarter", "Last 6 Months", "Year to Date"],
+                key="export_period"
+            )
+        with col2:
+            export_format = st.radio(
+                "File Format",
+                list(lead_io.EXPORT_FORMATS),
+                horizontal=True,
+                key="export_format"
+            )
+        export_columns = st.multiselect(
+            "Columns to Export",
+            list(filtered_leads.columns),
+            default=list(filtered_leads.columns),
+            key="export_columns"
+        )
+        
+        start_date, end_date = analytics.resolve_period(export_period)
+        export_leads = lead_io.filter_leads(filtered_leads, start=start_date, end=end_date)
+        mime, extension = lead_io.EXPORT_FORMATS[export_format]
+        
+        # The file is only generated when the button is clicked; Streamlit
+        # sends it as one payload, so its chunks are joined in memory
+        st.download_button(
+            f"Download {len(export_leads):,} Leads",
+            data=lambda: b''.join(
+                lead_io.iter_export(lead_io.frame_chunks(export_leads), export_columns, export_format)
+            ),
+            file_name=f"acolyte_leads{extension}",
+            mime=mime,
+            disabled=not export_columns
+        )
+    
+    # Full-text search over notes, pain points and the other free-text fields
+    with st.expander("Search Notes"):
+        text_query = st.text_input(
+            "Search Text",
+            placeholder='moodle OR canvas, "price sensitive" budget',
+            key="text_search"
+        )
+        if text_query:
+            filtered = territory_filter or stage_filter or category_filter
+            within = filtered_leads.index.to_numpy() if filtered else None
+            with st.spinner("Searching lead notes..."):
+                matches, snippets = search_lead_text(text_query, within)
+            if not len(matches):
+                st.info("No leads mention that.")
+            for lead_id, (field, text) in zip(matches, snippets):
+                if lead_id in leads.index:
+                    name = leads.at[lead_id, 'institution_name']
+                    stage = leads.at[lead_id, 'stage']
+                    field_name = field.replace('_', ' ').title() if field else ''
+                    st.markdown(f"**{name}** (#{lead_id}) · {stage} · {field_name}: {text or ''}")
+    
+    # Leads table with detailed view, sorted and paged on the server
     st.subheader("Lead Details")
-    lead_view = filtered_leads[[
-        'institution_name', 'territory', 'category', 'stage',
-        'current_student_count', 'total_deal_value_annual',
-        'probability', 'expected_close_date'
-    ]].copy()
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        sort_column = st.selectbox("Sort By", LEAD_TABLE_COLUMNS, key="lead_table_sort")
+    with col2:
+        descending = st.toggle("Descending", key="lead_table_descending")
+    with col3:
+        page_size = st.selectbox("Rows per Page", LEAD_PAGE_SIZES, key="lead_table_page_size")
+    pages = max((len(filtered_leads) - 1) // page_size + 1, 1)
+    with col4:
+        page = st.number_input(
+            f"Page (of {pages:,})", min_value=1, max_value=pages, value=1, key="lead_table_page"
+        )
     
-    # Add view details button
-    if not lead_view.empty:
-        selected_lead = st.selectbox(
-            "Select Lead to View Details",
-            lead_view['institution_name'].tolist()
+    # The sort order is cached per filter, so paging through it is only a slice
+    filters = (tuple(territory_filter), tuple(stage_filter), tuple(category_filter))
+    order = cached_aggregate(
+        ('lead_table_order', filters, sort_column, descending),
+        lambda: lead_io.sort_positions(filtered_leads[sort_column], descending)
+    )
+    start = (int(page) - 1) * page_size
+    lead_view = filtered_leads.take(order[start:start + page_size])[LEAD_TABLE_COLUMNS]
+    st.dataframe(lead_view, use_container_width=True)
+    st.caption(f"Leads {min(start + 1, len(filtered_leads)):,}–{start + len(lead_view):,} of {len(filtered_leads):,}")
+    
+    # Leads to pick from: search matches within the filters, else this page
+    query = st.text_input(
+        "Search Leads",
+        placeholder="Institution, city or contact name",
+        key="lead_search"
+    )
+    if query:
+        matches = search_lead_names(query)
+        matches = matches[leads.index.get_indexer(matches) >= 0]
+        candidates = lead_io.filter_leads(
+            leads.loc[matches, ['territory', 'stage', 'category']],
+            territory_filter, stage_filter, category_filter
         )
+        lead_ids = candidates.index[:LEAD_SEARCH_LIMIT].tolist()
+        if not lead_ids:
+            st.info("No leads match the search.")
+    else:
+        lead_ids = lead_view.index.tolist()
+    
+    # Add view details button
+    if lead_ids:
+        lead_panels(lead_ids)
+
+@st.fragment
+def lead_panels(lead_ids):
+    """Detail and edit panels of the dashboard, rerun together as one fragment
+    
+    Picking a lead or saving either form reruns only these panels, and both
+    read the lead through current_lead, so they never disagree; dashboard
+    aggregates catch up through the data version.
+    """
+    # Leads are selected by id, so renamed or same-named institutions stay
+    # distinct; names are read on every fragment run, so a rename shows at once
+    names = current_leads(['institution_name'])['institution_name']
+    labels = {lead_id: f"{names.at[lead_id]} (#{lead_id})" for lead_id in lead_ids}
+    lead_detail_panel(lead_ids, labels.__getitem__)
+    lead_edit_panel(lead_ids, labels.__getitem__)
+
+def lead_detail_panel(lead_ids, lead_label):
+    """Details, activity timeline and activity log form of the selected lead"""
+    selected_lead = st.selectbox(
+        "Select Lead to View Details",
+        lead_ids,
+        format_func=lead_label,
+        key="detail_lead_id"
+    )
+    
+    if selected_lead is None:
+        return
+    lead_details = current_lead(selected_lead)
+    
+    with st.expander("Lead Details", expanded=True):
+        tab1, tab2, tab3 = st.tabs([
+            "Institution Information",
+            "Contact Information",
+            "Pipeline Information"
+        ])
         
-        if selected_lead:
-            lead_details = filtered_leads[
-                filtered_leads['institution_name'] == selected_lead
-            ].iloc[0]
+        with tab1:
+            col1, col2 = st.columns(2)
+            with col1:
+                st.write("Institution Type:", lead_details['institution_type'])
+                st.write("Ownership:", lead_details['ownership'])
+                st.write("Territory:", lead_details['territory'])
+                st.write("Category:", lead_details['category'])
+            with col2:
+                st.write("Current Students:", lead_details['current_student_count'])
+                st.write("Max Capacity:", lead_details['max_student_capacity'])
+                st.write("Current LMS:", lead_details['current_lms_provider'])
+                
+        with tab2:
+            col1, col2 = st.columns(2)
+            with col1:
+                st.write("Primary Contact:", lead_details['primary_contact_name'])
+                st.write("Role:", lead_details['primary_contact_role'])
+                st.write("Email:", lead_details['primary_contact_email'])
+                st.write("Phone:", lead_details['primary_contact_phone'])
+            with col2:
+                st.write("Secondary Contact:", lead_details['secondary_contact_name'])
+                st.write("Role:", lead_details['secondary_contact_role'])
+                st.write("Decision Makers:", lead_details['decision_makers'])
+                
+        with tab3:
+            col1, col2 = st.columns(2)
+            with col1:
+                st.write("Stage:", lead_details['stage'])
+                st.write("Probability:", f"{lead_details['probability']}%")
+                st.write("Monthly Price:", f"₹{lead_details['student_price_monthly']:,.2f}")
+                st.write("Annual Value:", f"₹{lead_details['total_deal_value_annual']:,.2f}")
+            with col2:
+                st.write("Demo Date:", lead_details['demo_scheduled_date'])
+                st.write("Expected Close:", lead_details['expected_close_date'])
+                st.write("Next Follow-up:", lead_details['next_follow_up_date'])
+                st.write("Payment Preference:", lead_details['payment_preference'])
+                
+        # Additional sections for notes and updates
+        with st.expander("Notes & Activities"):
+            st.write("Pain Points:", lead_details['pain_points'])
+            st.write("Competitors:", lead_details['competitors_involved'])
+            st.write("Next Steps:", lead_details['next_steps'])
+            st.write("Notes:", lead_details['notes'])
             
-            with st.expander("Lead Details", expanded=True):
-                tab1, tab2, tab3 = st.tabs([
-                    "Institution Information",
-                    "Contact Information",
-                    "Pipeline Information"
-                ])
+            show_activity_timeline(selected_lead)
+            
+            # Add new activity log
+            st.subheader("Add Activity Log")
+            with st.form(f"activity_log_{selected_lead}"):
+                field = f"activity_{selected_lead}_{{}}".format
+                st.selectbox(
+                    "Activity Type",
+                    ["Call", "Email", "Meeting", "Demo", "Proposal", "Other"],
+                    key=field("type")
+                )
+                st.date_input("Activity Date", datetime.now(), key=field("date"))
+                st.text_area("Activity Notes", key=field("notes"))
+                st.date_input("Next Follow-up Date", key=field("follow_up"))
+                st.selectbox(
+                    "Update Stage",
+                    ["No Change"] + [
+                        "New", "Contacted", "Qualified", "Demo", 
+                        "Proposal", "Negotiation", "Closed Won", "Closed Lost"
+                    ],
+                    key=field("stage")
+                )
+                st.slider(
+                    "Update Success Probability (%)", 
+                    0, 100, 
+                    int(lead_details['probability']),
+                    key=field("probability")
+                )
                 
-                with tab1:
-                    col1, col2 = st.columns(2)
-                    with col1:
-                        st.write("Institution Type:", lead_details['institution_type'])
-                        st.write("Ownership:", lead_details['ownership'])
-                        st.write("Territory:", lead_details['territory'])
-                        st.write("Category:", lead_details['category'])
-                    with col2:
-                        st.write("Current Students:", lead_details['current_student_count'])
-                        st.write("Max Capacity:", lead_details['max_student_capacity'])
-                        st.write("Current LMS:", lead_details['current_lms_provider'])
-                        
-                with tab2:
-                    col1, col2 = st.columns(2)
-                    with col1:
-                        st.write("Primary Contact:", lead_details['primary_contact_name'])
-                        st.write("Role:", lead_details['primary_contact_role'])
-                        st.write("Email:", lead_details['primary_contact_email'])
-                        st.write("Phone:", lead_details['primary_contact_phone'])
-                    with col2:
-                        st.write("Secondary Contact:", lead_details['secondary_contact_name'])
-                        st.write("Role:", lead_details['secondary_contact_role'])
-                        st.write("Decision Makers:", lead_details['decision_makers'])
-                        
-                with tab3:
-                    col1, col2 = st.columns(2)
-                    with col1:
-                        st.write("Stage:", lead_details['stage'])
-                        st.write("Probability:", f"{lead_details['probability']}%")
-                        st.write("Monthly Price:", f"₹{lead_details['student_price_monthly']:,.2f}")
-                        st.write("Annual Value:", f"₹{lead_details['total_deal_value_annual']:,.2f}")
-                    with col2:
-                        st.write("Demo Date:", lead_details['demo_scheduled_date'])
-                        st.write("Expected Close:", lead_details['expected_close_date'])
-                        st.write("Next Follow-up:", lead_details['next_follow_up_date'])
-                        st.write("Payment Preference:", lead_details['payment_preference'])
-                        
-                # Additional sections for notes and updates
-                with st.expander("Notes & Activities"):
-                    st.write("Pain Points:", lead_details['pain_points'])
-                    st.write("Competitors:", lead_details['competitors_involved'])
-                    st.write("Next Steps:", lead_details['next_steps'])
-                    st.write("Notes:", lead_details['notes'])
-                    
-                    # Add new activity log
-                    st.subheader("Add Activity Log")
-                    with st.form(f"activity_log_{selected_lead}"):
-                        activity_type = st.selectbox(
-                            "Activity Type",
-                            ["Call", "Email", "Meeting", "Demo", "Proposal", "Other"]
-                        )
-                        activity_date = st.date_input("Activity Date", datetime.now())
-                        activity_notes = st.text_area("Activity Notes")
-                        next_follow_up = st.date_input("Next Follow-up Date")
-                        new_stage = st.selectbox(
-                            "Update Stage",
-                            ["No Change"] + [
-                                "New", "Contacted", "Qualified", "Demo", 
-                                "Proposal", "Negotiation", "Closed Won", "Closed Lost"
-                            ]
-                        )
-                        new_probability = st.slider(
-                            "Update Success Probability (%)", 
-                            0, 100, 
-                            int(lead_details['probability'])
-                        )
-                        
-                        update_submitted = st.form_submit_button("Update Lead")
-                        
-                        if update_submitted:
-                            # Update lead information
-                            idx = filtered_leads[
-                                filtered_leads['institution_name'] == selected_lead
-                            ].index[0]
-                            
-                            # Update notes with new activity
-                            new_note = f"""
-                            {datetime.now().strftime('%Y-%m-%d %H:%M')}
-                            Activity: {activity_type}
-                            Notes: {activity_notes}
-                            """
-                            current_notes = st.session_state.leads.at[idx, 'notes']
-                            updated_notes = f"{new_note}\n---\n{current_notes}" if current_notes else new_note
-                            
-                            # Update lead information
-                            st.session_state.leads.at[idx, 'notes'] = updated_notes
-                            st.session_state.leads.at[idx, 'last_contact_date'] = activity_date
-                            st.session_state.leads.at[idx, 'next_follow_up_date'] = next_follow_up
-                            st.session_state.leads.at[idx, 'probability'] = new_probability
-                            
-                            if new_stage != "No Change":
-                                st.session_state.leads.at[idx, 'stage'] = new_stage
-                                st.session_state.leads.at[idx, 'stage_change_date'] = datetime.now().date()
-                            
-                            st.success("Lead updated successfully!")
-                            st.rerun()
-    if not lead_view.empty:
-        col1, col2 = st.columns([3, 1])
-        with col1:
-            selected_lead = st.selectbox(
-                "Select Lead to View Details",
-                lead_view['institution_name'].tolist()
-            )
-        with col2:
-            if st.button("Edit Selected Lead"):
-                lead_data = filtered_leads[
-                    filtered_leads['institution_name'] == selected_lead
-                ].iloc[0]
-                edit_lead_form(lead_data)
+                # Saved in the submit callback, before the panel redraws
+                st.form_submit_button(
+                    "Update Lead", on_click=save_activity, args=(selected_lead, lead_details)
+                )
+
+def save_activity(lead_id, lead_details):
+    """Submit callback of the activity log form: log the activity and update the lead"""
+    field = f"activity_{lead_id}_{{}}".format
+    activity_type = st.session_state[field("type")]
+    activity_date = st.session_state[field("date")]
+    new_stage = st.session_state[field("stage")]
+    new_probability = st.session_state[field("probability")]
+    
+    # Update lead information
+    changes = {
+        'last_activity': activity_type,
+        'last_contact_date': activity_date,
+        'next_follow_up_date': st.session_state[field("follow_up")],
+        'probability': new_probability
+    }
+    
+    if new_stage != "No Change":
+        changes['stage'] = new_stage
+        changes['stage_change_date'] = datetime.now().date()
+    
+    # Record the activity in the lead's log first, so
+    # the version bump from publishing the edit covers it
+    lead_store.log_activity({
+        'lead_id': lead_id,
+        'timestamp': datetime.combine(activity_date, datetime.now().time()),
+        'activity_type': activity_type,
+        'notes': st.session_state[field("notes")],
+        'stage_from': lead_details['stage'],
+        'stage_to': changes.get('stage', lead_details['stage']),
+        'probability_from': lead_details['probability'],
+        'probability_to': new_probability
+    })
+    lead_store.update_lead(lead_id, changes)
+    stage_lead_changes(lead_id, changes)
+    
+    st.toast("Lead updated successfully!")
+
+def lead_edit_panel(lead_ids, lead_label):
+    """Lead picker and edit form"""
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        selected_lead = st.selectbox(
+            "Select Lead to View Details",
+            lead_ids,
+            format_func=lead_label,
+            key="edit_lead_id"
+        )
+    with col2:
+        # The form stays open across the reruns its own widgets cause
+        if st.button("Edit Selected Lead"):
+            st.session_state.editing_lead = selected_lead
+    
+    # A saved form keeps showing the lead's new values
+    if selected_lead is not None and st.session_state.get('editing_lead') == selected_lead:
+        edit_lead_form(current_lead(selected_lead))
+
+def show_activity_timeline(lead_id):
+    """Show a lead's activity log one page at a time, newest first"""
+    st.subheader("Activity Timeline")
+    
+    total = lead_store.count_activities(lead_id)
+    if not total:
+        st.info("No activities logged yet.")
+        return
+    
+    pages = (total - 1) // ACTIVITY_PAGE_SIZE + 1
+    page = 1
+    if pages > 1:
+        page = st.number_input(
+            f"Page (of {pages})",
+            min_value=1,
+            max_value=pages,
+            value=1,
+            key=f"activity_page_{lead_id}"
+        )
+    
+    activities = lead_store.load_activities(
+        lead_id, ACTIVITY_PAGE_SIZE, (int(page) - 1) * ACTIVITY_PAGE_SIZE
+    )
+    stage_changed = activities['stage_from'] != activities['stage_to']
+    probability_changed = activities['probability_from'] != activities['probability_to']
+    timeline = pd.DataFrame({
+        'When': activities['timestamp'].dt.strftime('%Y-%m-%d %H:%M'),
+        'Activity': activities['activity_type'],
+        'Notes': activities['notes'],
+        'Stage': (activities['stage_from'] + " → " + activities['stage_to']).where(
+            stage_changed, activities['stage_to']
+        ),
+        'Probability': (
+            activities['probability_from'].astype(str) + "% → "
+            + activities['probability_to'].astype(str) + "%"
+        ).where(probability_changed, activities['probability_to'].astype(str) + "%")
+    })
+    st.dataframe(timeline, hide_index=True, use_container_width=True)
+    st.caption(f"{total:,} activities")
+    
 def show_lead_analytics():
     """Display detailed analytics about the lead pipeline"""
     st.subheader("Lead Analytics")
     
-    if st.session_state.leads.empty:
+    leads = current_leads(ANALYTICS_COLUMNS)
+    
+    if leads.empty:
         st.warning("No leads data available for analysis.")
         return
         
@@ -488,130 +941,112 @@ def show_lead_analytics():
             ["Last 30 Days", "Last Quarter", "Last 6 Months", "Year to Date", "All Time"]
         )
     
-    # Filter data based on time period
-    filtered_leads = st.session_state.leads.copy()
+    # Filter data based on time period; the period's figures come from the lead cube
+    start_date, end_date = analytics.resolve_period(date_range)
+    period_leads = period_cube(start_date, end_date)
     today = datetime.now().date()
     
-    if date_range == "Last 30 Days":
-        filtered_leads = filtered_leads[
-            pd.to_datetime(filtered_leads['first_contact_date']).dt.date >= 
-            (today - timedelta(days=30))
-        ]
-    elif date_range == "Last Quarter":
-        filtered_leads = filtered_leads[
-            pd.to_datetime(filtered_leads['first_contact_date']).dt.date >= 
-            (today - timedelta(days=90))
-        ]
-    elif date_range == "Last 6 Months":
-        filtered_leads = filtered_leads[
-            pd.to_datetime(filtered_leads['first_contact_date']).dt.date >= 
-            (today - timedelta(days=180))
-        ]
-    elif date_range == "Year to Date":
-        filtered_leads = filtered_leads[
-            pd.to_datetime(filtered_leads['first_contact_date']).dt.date >= 
-            datetime(today.year, 1, 1).date()
-        ]
-    
     # Summary metrics in cards
+    totals = period_leads.totals()
     col1, col2, col3, col4 = st.columns(4)
     
     with col1:
-        total_leads = len(filtered_leads)
-        new_leads = len(filtered_leads[
-            pd.to_datetime(filtered_leads['first_contact_date']).dt.date >= 
-            (today - timedelta(days=30))
-        ])
+        total_leads = int(totals['count'])
+        recent_start = pd.Timestamp(today - timedelta(days=30))
+        if start_date is not None:
+            recent_start = max(start_date, recent_start)
+        new_leads = int(period_cube(recent_start, end_date).totals()['count'])
         st.metric("Total Leads", total_leads, f"+{new_leads} new")
         
     with col2:
-        total_pipeline = filtered_leads['total_deal_value_annual'].sum()
+        total_pipeline = totals['value']
         st.metric("Total Pipeline Value", f"₹{total_pipeline:,.2f}")
         
     with col3:
-        avg_deal_size = filtered_leads['total_deal_value_annual'].mean()
+        avg_deal_size = average_deal(totals)
         st.metric("Average Deal Size", f"₹{avg_deal_size:,.2f}")
         
     with col4:
         conversion_rate = (
-            len(filtered_leads[filtered_leads['stage'] == 'Closed Won']) /
-            len(filtered_leads) * 100
-        ) if len(filtered_leads) > 0 else 0
+            totals['won'] / totals['count'] * 100
+        ) if totals['count'] > 0 else 0
         st.metric("Conversion Rate", f"{conversion_rate:.1f}%")
     
     # Pipeline by stage
     st.subheader("Pipeline Stage Analysis")
-    stage_data = filtered_leads.groupby('stage').agg({
-        'total_deal_value_annual': 'sum',
-        'institution_name': 'count'
-    }).reset_index()
+    stage_data = analytics.cube_summary(period_leads, 'stage').reset_index()
     
-    fig = px.bar(stage_data, x='stage', y='total_deal_value_annual',
+    fig = px.bar(stage_data, x='stage', y='total_value',
                 title="Pipeline Value by Stage",
-                labels={'total_deal_value_annual': 'Value (₹)', 'stage': 'Stage'})
+                labels={'total_value': 'Value (₹)', 'stage': 'Stage'})
     st.plotly_chart(fig)
     
     # Territory performance
     st.subheader("Territory Performance")
-    territory_data = filtered_leads.groupby('territory').agg({
-        'total_deal_value_annual': 'sum',
-        'institution_name': 'count'
-    }).reset_index()
+    territory_data = analytics.cube_summary(
+        period_leads, 'territory'
+    )[['total_value', 'lead_count']].reset_index()
     
     col1, col2 = st.columns(2)
     
     with col1:
-        fig = px.pie(territory_data, values='total_deal_value_annual', names='territory',
+        fig = px.pie(territory_data, values='total_value', names='territory',
                     title="Pipeline Distribution by Territory")
         st.plotly_chart(fig)
         
     with col2:
         st.dataframe(territory_data.rename(columns={
             'territory': 'Territory',
-            'total_deal_value_annual': 'Pipeline Value',
-            'institution_name': 'Number of Leads'
+            'total_value': 'Pipeline Value',
+            'lead_count': 'Number of Leads'
         }))
     
     # Lead source analysis
     st.subheader("Lead Source Analysis")
-    source_data = filtered_leads.groupby('lead_source').agg({
-        'total_deal_value_annual': 'sum',
-        'institution_name': 'count'
-    }).reset_index()
+    source_data = analytics.cube_summary(period_leads, 'lead_source').reset_index()
     
-    fig = px.bar(source_data, x='lead_source', y=['total_deal_value_annual'],
+    fig = px.bar(source_data, x='lead_source', y=['total_value'],
                 title="Pipeline Value by Lead Source",
                 labels={'value': 'Value (₹)', 'lead_source': 'Source'})
     st.plotly_chart(fig)
     
     # Monthly trending
     st.subheader("Monthly Trends")
-    filtered_leads['month'] = pd.to_datetime(
-        filtered_leads['first_contact_date']
-    ).dt.to_period('M')
-    
-    monthly_data = filtered_leads.groupby('month').agg({
-        'total_deal_value_annual': 'sum',
-        'institution_name': 'count'
-    }).reset_index()
-    
-    monthly_data['month'] = monthly_data['month'].astype(str)
+    monthly_data = pipeline_summary('month', start=start_date, end=end_date)
+    months = monthly_data.index.astype(str)
     
     fig = go.Figure()
     fig.add_trace(go.Scatter(
-        x=monthly_data['month'],
-        y=monthly_data['total_deal_value_annual'],
+        x=months,
+        y=monthly_data['total_value'],
         name='Pipeline Value',
         line=dict(color='blue')
     ))
     fig.add_trace(go.Scatter(
-        x=monthly_data['month'],
-        y=monthly_data['institution_name']*100000,  # Scale for visibility
+        x=months,
+        y=monthly_data['lead_count']*100000,  # Scale for visibility
         name='Number of Leads',
         line=dict(color='red', dash='dash'),
         yaxis='y2'
     ))
     
+    # Projections of the coming months
+    projected_value = projected_trend('pipeline')
+    projected_leads = projected_trend('leads')
+    fig.add_trace(go.Scatter(
+        x=projected_value.index,
+        y=projected_value,
+        name='Projected Pipeline Value',
+        line=dict(color='blue', dash='dot')
+    ))
+    fig.add_trace(go.Scatter(
+        x=projected_leads.index,
+        y=projected_leads*100000,
+        name='Projected Leads',
+        line=dict(color='red', dash='dot'),
+        yaxis='y2'
+    ))
+    
     fig.update_layout(
         title='Monthly Pipeline and Lead Trends',
         yaxis=dict(title='Pipeline Value (₹)'),
@@ -623,8 +1058,23 @@ def show_lead_analytics():
         )
     )
     st.plotly_chart(fig)
+def form_index(options, value):
+    """Position of a lead's value among select box options, or None to leave it unselected"""
+    if pd.isna(value) or value not in options:
+        return None
+    return options.index(value)
+
+def form_value(value):
+    """A lead's field as a widget value, with None for one the lead does not have"""
+    return None if pd.isna(value) else value
+
+def form_date(value):
+    """A lead's date as a date input value, or None to leave the input empty"""
+    return None if pd.isna(value) else value.date()
+
 def edit_lead_form(lead_data):
     """Create a form pre-filled with lead data for editing"""
+    field = f"edit_{lead_data['lead_id']}_{{}}".format
     with st.form("edit_lead_form"):
         st.subheader(f"Edit Lead: {lead_data['institution_name']}")
         
@@ -639,239 +1089,238 @@ def edit_lead_form(lead_data):
         with tab1:
             col1, col2 = st.columns(2)
             with col1:
-                institution_name = st.text_input(
+                st.text_input(
                     "Institution Name",
-                    value=lead_data['institution_name']
+                    value=form_value(lead_data['institution_name']),
+                    key=field("institution_name")
                 )
-                institution_type = st.selectbox(
+                st.selectbox(
                     "Institution Type",
                     ["Medical College", "Dental College", "Other"],
-                    index=["Medical College", "Dental College", "Other"].index(
-                        lead_data['institution_type']
-                    )
+                    index=form_index(["Medical College", "Dental College", "Other"], lead_data['institution_type']),
+                    key=field("institution_type")
                 )
-                ownership = st.selectbox(
+                st.selectbox(
                     "Ownership",
                     ["Private", "Government", "Society"],
-                    index=["Private", "Government", "Society"].index(
-                        lead_data['ownership']
-                    )
+                    index=form_index(["Private", "Government", "Society"], lead_data['ownership']),
+                    key=field("ownership")
                 )
-                establishment_year = st.number_input(
+                st.number_input(
                     "Establishment Year",
                     min_value=1900,
                     max_value=datetime.now().year,
-                    value=int(lead_data['establishment_year'])
+                    value=int(lead_data['establishment_year']) or None,
+                    key=field("establishment_year")
                 )
                 
             with col2:
-                territory = st.selectbox(
+                st.selectbox(
                     "Territory",
                     ["Bangalore Urban", "Bangalore Rural & Mysore",
                      "Mangalore & Coastal", "North Karnataka"],
-                    index=["Bangalore Urban", "Bangalore Rural & Mysore",
-                          "Mangalore & Coastal", "North Karnataka"].index(
-                        lead_data['territory']
-                    )
+                    index=form_index(["Bangalore Urban", "Bangalore Rural & Mysore",
+                          "Mangalore & Coastal", "North Karnataka"], lead_data['territory']),
+                    key=field("territory")
                 )
-                city = st.text_input("City", value=lead_data['city'])
-                category = st.selectbox(
+                st.text_input("City", value=form_value(lead_data['city']), key=field("city"))
+                st.selectbox(
                     "Category",
                     ["Premium Private", "Mid-tier Private", 
                      "Budget Private", "Government"],
-                    index=["Premium Private", "Mid-tier Private",
-                          "Budget Private", "Government"].index(
-                        lead_data['category']
-                    )
+                    index=form_index(["Premium Private", "Mid-tier Private",
+                          "Budget Private", "Government"], lead_data['category']),
+                    key=field("category")
                 )
                 
         with tab2:
             col1, col2 = st.columns(2)
             with col1:
-                primary_contact_name = st.text_input(
+                st.text_input(
                     "Primary Contact Name",
-                    value=lead_data['primary_contact_name']
+                    value=form_value(lead_data['primary_contact_name']),
+                    key=field("primary_contact_name")
                 )
-                primary_contact_role = st.text_input(
+                st.text_input(
                     "Primary Contact Role",
-                    value=lead_data['primary_contact_role']
+                    value=form_value(lead_data['primary_contact_role']),
+                    key=field("primary_contact_role")
                 )
-                primary_contact_email = st.text_input(
+                st.text_input(
                     "Primary Contact Email",
-                    value=lead_data['primary_contact_email']
+                    value=form_value(lead_data['primary_contact_email']),
+                    key=field("primary_contact_email")
                 )
-                primary_contact_phone = st.text_input(
+                st.text_input(
                     "Primary Contact Phone",
-                    value=lead_data['primary_contact_phone']
+                    value=form_value(lead_data['primary_contact_phone']),
+                    key=field("primary_contact_phone")
                 )
                 
             with col2:
-                secondary_contact_name = st.text_input(
+                st.text_input(
                     "Secondary Contact Name",
-                    value=lead_data['secondary_contact_name']
+                    value=form_value(lead_data['secondary_contact_name']),
+                    key=field("secondary_contact_name")
                 )
-                secondary_contact_role = st.text_input(
+                st.text_input(
                     "Secondary Contact Role",
-                    value=lead_data['secondary_contact_role']
+                    value=form_value(lead_data['secondary_contact_role']),
+                    key=field("secondary_contact_role")
                 )
-                decision_makers = st.text_area(
+                st.text_area(
                     "Key Decision Makers",
-                    value=lead_data['decision_makers']
+                    value=form_value(lead_data['decision_makers']),
+                    key=field("decision_makers")
                 )
                 
         with tab3:
             col1, col2 = st.columns(2)
             with col1:
-                current_student_count = st.number_input(
+                st.number_input(
                     "Current Student Count",
                     min_value=0,
-                    value=int(lead_data['current_student_count'])
+                    value=int(lead_data['current_student_count']),
+                    key=field("current_student_count")
                 )
-                max_student_capacity = st.number_input(
+                st.number_input(
                     "Maximum Student Capacity",
                     min_value=0,
-                    value=int(lead_data['max_student_capacity'])
+                    value=int(lead_data['max_student_capacity']),
+                    key=field("max_student_capacity")
                 )
-                current_lms = st.text_input(
+                st.text_input(
                     "Current LMS Provider",
-                    value=lead_data['current_lms_provider']
+                    value=form_value(lead_data['current_lms_provider']),
+                    key=field("current_lms_provider")
                 )
-                interested_modules = st.multiselect(
+                st.multiselect(
                     "Interested Modules",
                     ["Student Module", "Faculty Module", "Institution Module"],
-                    default=json.loads(lead_data['interested_modules'])
+                    default=json.loads(lead_data['interested_modules']),
+                    key=field("interested_modules")
                 )
                 
             with col2:
-                payment_preference = st.selectbox(
+                st.selectbox(
                     "Payment Preference",
                     ["Monthly", "Quarterly", "Annual"],
-                    index=["Monthly", "Quarterly", "Annual"].index(
-                        lead_data['payment_preference']
-                    )
+                    index=form_index(["Monthly", "Quarterly", "Annual"], lead_data['payment_preference']),
+                    key=field("payment_preference")
                 )
-                budget_confirmed = st.selectbox(
+                st.selectbox(
                     "Budget Confirmed",
                     ["Yes", "No"],
-                    index=["Yes", "No"].index(lead_data['budget_confirmed'])
+                    index=form_index(["Yes", "No"], lead_data['budget_confirmed']),
+                    key=field("budget_confirmed")
                 )
-                competitors = st.text_area(
+                st.text_area(
                     "Competitors Involved",
-                    value=lead_data['competitors_involved']
+                    value=form_value(lead_data['competitors_involved']),
+                    key=field("competitors_involved")
                 )
                 
         with tab4:
             col1, col2 = st.columns(2)
             with col1:
-                stage = st.selectbox(
+                st.selectbox(
                     "Stage",
                     ["New", "Contacted", "Qualified", "Demo",
                      "Proposal", "Negotiation", "Closed Won", "Closed Lost"],
-                    index=["New", "Contacted", "Qualified", "Demo",
+                    index=form_index(["New", "Contacted", "Qualified", "Demo",
                           "Proposal", "Negotiation", "Closed Won",
-                          "Closed Lost"].index(lead_data['stage'])
+                          "Closed Lost"], lead_data['stage']),
+                    key=field("stage")
                 )
-                probability = st.slider(
+                st.slider(
                     "Success Probability (%)",
                     0, 100,
-                    value=int(lead_data['probability'])
+                    value=int(lead_data['probability']),
+                    key=field("probability")
                 )
                 
             with col2:
-                demo_date = st.date_input(
+                st.date_input(
                     "Demo Scheduled Date",
-                    value=pd.to_datetime(lead_data['demo_scheduled_date']).date()
+                    value=form_date(lead_data['demo_scheduled_date']),
+                    key=field("demo_scheduled_date")
                 )
-                expected_close = st.date_input(
+                st.date_input(
                     "Expected Close Date",
-                    value=pd.to_datetime(lead_data['expected_close_date']).date()
+                    value=form_date(lead_data['expected_close_date']),
+                    key=field("expected_close_date")
                 )
-                next_follow_up = st.date_input(
+                st.date_input(
                     "Next Follow-up Date",
-                    value=pd.to_datetime(lead_data['next_follow_up_date']).date()
+                    value=form_date(lead_data['next_follow_up_date']),
+                    key=field("next_follow_up_date")
                 )
                 
-            notes = st.text_area(
+            st.text_area(
                 "Additional Notes",
-                value=lead_data['notes']
+                value=form_value(lead_data['notes']),
+                key=field("notes")
             )
-            pain_points = st.text_area(
+            st.text_area(
                 "Pain Points",
-                value=lead_data['pain_points']
+                value=form_value(lead_data['pain_points']),
+                key=field("pain_points")
             )
-            next_steps = st.text_area(
+            st.text_area(
                 "Next Steps",
-                value=lead_data['next_steps']
+                value=form_value(lead_data['next_steps']),
+                key=field("next_steps")
             )
             
-        submitted = st.form_submit_button("Update Lead")
-        
-        if submitted:
-            # Calculate updated pricing
-            monthly_price, annual_value = calculate_deal_metrics(
-                current_student_count, category, payment_preference
-            )
-            
-            # Create updated lead data
-            updated_lead = {
-                'institution_name': institution_name,
-                'institution_type': institution_type,
-                'ownership': ownership,
-                'establishment_year': establishment_year,
-                'territory': territory,
-                'city': city,
-                'category': category,
-                'primary_contact_name': primary_contact_name,
-                'primary_contact_role': primary_contact_role,
-                'primary_contact_email': primary_contact_email,
-                'primary_contact_phone': primary_contact_phone,
-                'secondary_contact_name': secondary_contact_name,
-                'secondary_contact_role': secondary_contact_role,
-                'decision_makers': decision_makers,
-                'current_student_count': current_student_count,
-                'max_student_capacity': max_student_capacity,
-                'current_lms_provider': current_lms,
-                'interested_modules': json.dumps(interested_modules),
-                'payment_preference': payment_preference,
-                'budget_confirmed': budget_confirmed,
-                'competitors_involved': competitors,
-                'stage': stage,
-                'probability': probability,
-                'demo_scheduled_date': demo_date,
-                'expected_close_date': expected_close,
-                'next_follow_up_date': next_follow_up,
-                'notes': notes,
-                'pain_points': pain_points,
-                'next_steps': next_steps,
-                'student_price_monthly': monthly_price,
-                'total_deal_value_annual': annual_value,
-                'last_contact_date': datetime.now().date()
-            }
-            
-            # Add change log entry
-            change_log = f"""
-            {datetime.now().strftime('%Y-%m-%d %H:%M')}
-            Lead Updated
-            Stage: {lead_data['stage']} → {stage}
-            Probability: {lead_data['probability']}% → {probability}%
-            """
-            updated_lead['notes'] = f"{change_log}\n---\n{notes}"
-            
-            # Update lead in database
-            idx = st.session_state.leads[
-                st.session_state.leads['institution_name'] == lead_data['institution_name']
-            ].index[0]
-            
-            for key, value in updated_lead.items():
-                st.session_state.leads.at[idx, key] = value
-                
-            st.success("Lead updated successfully!")
-            st.rerun()
+        # Saved in the submit callback, before the panels redraw
+        st.form_submit_button("Update Lead", on_click=save_lead_edit, args=(lead_data,))
+
+def save_lead_edit(lead_data):
+    """Submit callback of the edit form: log the change and update the lead"""
+    lead_id = lead_data['lead_id']
+    field = f"edit_{lead_id}_{{}}".format
+    values = {column: st.session_state[field(column)] for column in EDIT_FIELDS}
+    
+    # Calculate updated pricing
+    monthly_price, annual_value = pricing.deal_value(
+        values['current_student_count'], values['payment_preference']
+    )
+    
+    # Create updated lead data
+    updated_lead = {
+        **values,
+        'interested_modules': json.dumps(values['interested_modules']),
+        'student_price_monthly': monthly_price,
+        'total_deal_value_annual': annual_value,
+        'last_contact_date': datetime.now().date()
+    }
+    
+    if values['stage'] != lead_data['stage']:
+        updated_lead['stage_change_date'] = datetime.now().date()
+    
+    # Add change log entry
+    lead_store.log_activity({
+        'lead_id': lead_id,
+        'timestamp': datetime.now(),
+        'activity_type': "Lead Updated",
+        'stage_from': lead_data['stage'],
+        'stage_to': values['stage'],
+        'probability_from': lead_data['probability'],
+        'probability_to': values['probability']
+    })
+    
+    # Update lead in database by its id, which survives a rename
+    lead_store.update_lead(lead_id, updated_lead)
+    stage_lead_changes(lead_id, updated_lead)
+    
+    st.toast("Lead updated successfully!")
 def analyze_pipeline():
     """Comprehensive pipeline analysis dashboard for Acolyte's sales team"""
     st.title("Pipeline Analysis Dashboard")
     
-    if st.session_state.leads.empty:
+    leads = current_leads()
+    
+    if leads.empty:
         st.warning("No pipeline data available for analysis.")
         return
         
@@ -884,41 +1333,32 @@ def analyze_pipeline():
         )
     
     # Handle custom date range selection
+    custom_range = None
     if date_range == "Custom Range":
         with col2:
-            start_date, end_date = st.date_input(
+            custom_range = st.date_input(
                 "Select Date Range",
                 value=(datetime.now().date() - timedelta(days=90), datetime.now().date()),
                 max_value=datetime.now().date()
             )
-    else:
-        # Calculate date range based on selection
-        end_date = datetime.now().date()
-        if date_range == "Current Quarter":
-            start_date = datetime(end_date.year, ((end_date.month-1)//3)*3+1, 1).date()
-        elif date_range == "Last Quarter":
-            last_quarter_end = datetime(end_date.year, ((end_date.month-1)//3)*3+1, 1).date() - timedelta(days=1)
-            start_date = datetime(last_quarter_end.year, ((last_quarter_end.month-1)//3)*3+1, 1).date()
-            end_date = last_quarter_end
-        else:  # Year to Date
-            start_date = datetime(end_date.year, 1, 1).date()
+    start_date, end_date = analytics.resolve_period(
+        date_range, custom_range=custom_range, calendar_quarters=True
+    )
 
     # Filter leads based on date range
-    filtered_leads = st.session_state.leads[
-        (pd.to_datetime(st.session_state.leads['first_contact_date']).dt.date >= start_date) &
-        (pd.to_datetime(st.session_state.leads['first_contact_date']).dt.date <= end_date)
-    ].copy()
+    filtered_leads = leads_between('first_contact_date', start_date, end_date)
 
     # Key Pipeline Metrics
     st.header("Key Pipeline Metrics")
     
-    # Calculate key metrics
-    total_pipeline = filtered_leads['total_deal_value_annual'].sum()
-    weighted_pipeline = (filtered_leads['total_deal_value_annual'] * 
-                        filtered_leads['probability'] / 100).sum()
-    avg_deal_size = filtered_leads['total_deal_value_annual'].mean()
-    total_leads = len(filtered_leads)
-    conversion_rate = (len(filtered_leads[filtered_leads['stage'] == 'Closed Won']) / 
+    # Calculate key metrics from the lead cube
+    period_leads = period_cube(start_date, end_date)
+    totals = period_leads.totals()
+    total_pipeline = totals['value']
+    weighted_pipeline = totals['weighted']
+    avg_deal_size = average_deal(totals)
+    total_leads = totals['count']
+    conversion_rate = (totals['won'] / 
                       total_leads * 100) if total_leads > 0 else 0
     
     # Display metrics in columns
@@ -956,106 +1396,130 @@ def analyze_pipeline():
     st.header("Pipeline Stage Analysis")
     
     # Create tabs for different pipeline views
-    tab1, tab2 = st.tabs(["Stage Distribution", "Stage Movement"])
+    tab1, tab2 = lazy_tabs(["Stage Distribution", "Stage Movement"], "pipeline_tab")
     
     with tab1:
-        col1, col2 = st.columns([2, 1])
-        
-        with col1:
-            # Pipeline by stage visualization
-            stage_pipeline = filtered_leads.groupby('stage').agg({
-                'total_deal_value_annual': 'sum',
-                'institution_name': 'count'
-            }).reset_index()
-            
-            # Calculate probability-weighted values
-            stage_pipeline['weighted_value'] = filtered_leads.groupby('stage').apply(
-                lambda x: (x['total_deal_value_annual'] * x['probability'] / 100).sum()
-            ).values
-            
-            # Create funnel chart
-            fig = go.Figure()
+        if tab1.open:
+            col1, col2 = st.columns([2, 1])
             
-            # Add total value bars
-            fig.add_trace(go.Bar(
-                name='Total Value',
-                x=stage_pipeline['stage'],
-                y=stage_pipeline['total_deal_value_annual'],
-                marker_color='lightblue'
-            ))
-            
-            # Add weighted value bars
-            fig.add_trace(go.Bar(
-                name='Weighted Value',
-                x=stage_pipeline['stage'],
-                y=stage_pipeline['weighted_value'],
-                marker_color='darkblue'
-            ))
+            with col1:
+                # Pipeline by stage visualization, with probability-weighted values
+                stage_pipeline = analytics.cube_summary(period_leads, 'stage').reset_index()
+                
+                # Create funnel chart
+                fig = go.Figure()
+                
+                # Add total value bars
+                fig.add_trace(go.Bar(
+                    name='Total Value',
+                    x=stage_pipeline['stage'],
+                    y=stage_pipeline['total_value'],
+                    marker_color='lightblue'
+                ))
+                
+                # Add weighted value bars
+                fig.add_trace(go.Bar(
+                    name='Weighted Value',
+                    x=stage_pipeline['stage'],
+                    y=stage_pipeline['weighted_value'],
+                    marker_color='darkblue'
+                ))
+                
+                fig.update_layout(
+                    title="Pipeline Value by Stage",
+                    barmode='overlay',
+                    yaxis_title="Value (₹)",
+                    xaxis_title="Stage",
+                    legend_title="Value Type",
+                    height=400
+                )
+                
+                st.plotly_chart(fig, use_container_width=True)
+                
+            with col2:
+                # Stage metrics table
+                stage_metrics = pd.DataFrame({
+                    'Stage': stage_pipeline['stage'],
+                    'Count': stage_pipeline['lead_count'],
+                    'Value (₹)': stage_pipeline['total_value'].map('{:,.0f}'.format),
+                    'Weighted (₹)': stage_pipeline['weighted_value'].map('{:,.0f}'.format)
+                })
+                
+                st.dataframe(
+                    stage_metrics,
+                    hide_index=True,
+                    use_container_width=True
+                )
+        
+    with tab2:
+        if tab2.open:
+            # Stage movement analysis
+            st.subheader("Stage Movement Analysis")
             
-            fig.update_layout(
-                title="Pipeline Value by Stage",
-                barmode='overlay',
-                yaxis_title="Value (₹)",
-                xaxis_title="Stage",
-                legend_title="Value Type",
-                height=400
+            # Stage history comes from logged stage changes, cached per data
+            # version and newest activity
+            last_activity = lead_store.last_activity_id()
+            flow, transitions = cached_aggregate(
+                ('stage_flow', last_activity, start_date, end_date),
+                lambda: analytics.stage_flow(
+                    stage_intervals(get_lead_store().version, last_activity),
+                    filtered_leads.index.to_numpy()
+                )
             )
             
-            st.plotly_chart(fig, use_container_width=True)
-            
-        with col2:
-            # Stage metrics table
-            stage_metrics = pd.DataFrame({
-                'Stage': stage_pipeline['stage'],
-                'Count': stage_pipeline['institution_name'],
-                'Value (₹)': stage_pipeline['total_deal_value_annual'].map('{:,.0f}'.format),
-                'Weighted (₹)': stage_pipeline['weighted_value'].map('{:,.0f}'.format)
-            })
+            col1, col2 = st.columns(2)
+            with col1:
+                fig = go.Figure()
+                fig.add_trace(go.Bar(
+                    name='Mean',
+                    x=flow.index,
+                    y=flow['Mean Days in Stage'],
+                    text=flow['Mean Days in Stage'].round(1),
+                    textposition='auto',
+                ))
+                fig.add_trace(go.Bar(
+                    name='Median to Advance',
+                    x=flow.index,
+                    y=flow['Median Days to Advance'],
+                    text=flow['Median Days to Advance'].round(1),
+                    textposition='auto',
+                ))
+                
+                fig.update_layout(
+                    title="Days in Each Stage",
+                    xaxis_title="Stage",
+                    yaxis_title="Days",
+                    barmode='group',
+                    height=400
+                )
+                
+                st.plotly_chart(fig, use_container_width=True)
+                
+            with col2:
+                fig = go.Figure(go.Funnel(
+                    y=flow.index[:-1],
+                    x=flow['Leads Reached'].iloc[:-1],
+                    textinfo="value+percent initial"
+                ))
+                fig.update_layout(title="Stage Funnel", height=400)
+                st.plotly_chart(fig, use_container_width=True)
             
             st.dataframe(
-                stage_metrics,
+                flow.round(1).reset_index().rename(columns={'stage': 'Stage'}),
                 hide_index=True,
                 use_container_width=True
             )
-    
-    with tab2:
-        # Stage movement analysis
-        st.subheader("Stage Movement Analysis")
-        
-        # Calculate average days in each stage
-        filtered_leads['stage_duration'] = (
-            pd.to_datetime(filtered_leads['last_contact_date']) - 
-            pd.to_datetime(filtered_leads['stage_change_date'])
-        ).dt.days
-        
-        avg_stage_duration = filtered_leads.groupby('stage')['stage_duration'].mean()
-        
-        # Create stage duration chart
-        fig = go.Figure(go.Bar(
-            x=avg_stage_duration.index,
-            y=avg_stage_duration.values,
-            text=avg_stage_duration.values.round(1),
-            textposition='auto',
-        ))
-        
-        fig.update_layout(
-            title="Average Days in Each Stage",
-            xaxis_title="Stage",
-            yaxis_title="Days",
-            height=400
-        )
-        
-        st.plotly_chart(fig, use_container_width=True)
+            
+            with st.expander("Stage Transitions"):
+                st.dataframe(transitions, use_container_width=True)
 
     # Territory Analysis
     st.header("Territory Performance")
     
     # Calculate territory metrics
-    territory_metrics = filtered_leads.groupby('territory').agg({
-        'total_deal_value_annual': ['sum', 'mean'],
-        'institution_name': 'count',
-        'probability': 'mean'
-    }).round(2)
+    territory_metrics = pipeline_summary('territory', start=start_date, end=end_date)[
+        ['total_value', 'avg_value', 'lead_count', 'avg_probability']
+    ].round(2)
     
     territory_metrics.columns = ['Total Value', 'Avg Deal Size', 'Lead Count', 'Avg Probability']
     
@@ -1087,17 +1551,8 @@ def analyze_pipeline():
     st.header("Pipeline Trends")
     
     # Create monthly trend analysis
-    filtered_leads['month'] = pd.to_datetime(
-        filtered_leads['first_contact_date']
-    ).dt.to_period('M')
-    
-    monthly_trends = filtered_leads.groupby('month').agg({
-        'total_deal_value_annual': 'sum',
-        'institution_name': 'count',
-        'probability': 'mean'
-    }).reset_index()
-    
-    monthly_trends['month'] = monthly_trends['month'].astype(str)
+    monthly_trends = pipeline_summary('month', start=start_date, end=end_date).reset_index()
+    monthly_trends = monthly_trends.assign(month=monthly_trends['month'].astype(str))
     
     # Create trend visualization
     fig = make_subplots(specs=[[{"secondary_y": True}]])
@@ -1106,7 +1561,7 @@ def analyze_pipeline():
     fig.add_trace(
         go.Scatter(
             x=monthly_trends['month'],
-            y=monthly_trends['total_deal_value_annual'],
+            y=monthly_trends['total_value'],
             name="Pipeline Value",
             line=dict(color='blue')
         ),
@@ -1117,13 +1572,35 @@ def analyze_pipeline():
     fig.add_trace(
         go.Scatter(
             x=monthly_trends['month'],
-            y=monthly_trends['institution_name'],
+            y=monthly_trends['lead_count'],
             name="Lead Count",
             line=dict(color='red', dash='dash')
         ),
         secondary_y=True
     )
     
+    # Add projections of the coming months
+    projected_value = projected_trend('pipeline')
+    projected_leads = projected_trend('leads')
+    fig.add_trace(
+        go.Scatter(
+            x=projected_value.index,
+            y=projected_value,
+            name="Projected Pipeline Value",
+            line=dict(color='blue', dash='dot')
+        ),
+        secondary_y=False
+    )
+    fig.add_trace(
+        go.Scatter(
+            x=projected_leads.index,
+            y=projected_leads,
+            name="Projected Lead Count",
+            line=dict(color='red', dash='dot')
+        ),
+        secondary_y=True
+    )
+    
     fig.update_layout(
         title="Monthly Pipeline Trends",
         xaxis_title="Month",
@@ -1148,32 +1625,30 @@ def analyze_pipeline():
     
     with col1:
         # Deal size distribution
-        fig = px.box(
-            filtered_leads,
-            y='total_deal_value_annual',
-            title="Deal Size Distribution"
+        fig = box_figure(
+            filtered_leads['total_deal_value_annual'],
+            "Deal Size Distribution",
+            'total_deal_value_annual'
         )
         st.plotly_chart(fig, use_container_width=True)
         
     with col2:
         # Probability distribution
-        fig = px.histogram(
-            filtered_leads,
-            x='probability',
-            title="Probability Distribution",
-            nbins=20
+        fig = histogram_figure(
+            filtered_leads['probability'],
+            "Probability Distribution",
+            'probability',
+            bins=20
         )
         st.plotly_chart(fig, use_container_width=True)
         
     with col3:
         # Lead source distribution
-        lead_source_dist = filtered_leads.groupby('lead_source').agg({
-            'total_deal_value_annual': 'sum'
-        }).reset_index()
+        lead_source_dist = analytics.cube_summary(period_leads, 'lead_source').reset_index()
         
         fig = px.pie(
             lead_source_dist,
-            values='total_deal_value_annual',
+            values='total_value',
             names='lead_source',
             title="Pipeline by Lead Source"
         )
@@ -1182,35 +1657,65 @@ def analyze_pipeline():
     # Risk Analysis
     st.header("Risk Analysis")
     
-    # Calculate risk metrics
-    aging_threshold = 30  # days
-    probability_threshold = 40  # percent
-    size_threshold = avg_deal_size * 1.5  # 50% above average
+    # Risk thresholds
+    with st.expander("Risk Thresholds"):
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            aging_threshold = st.number_input(
+                "Aging After (Days Without Contact)",
+                min_value=1,
+                value=analytics.AGING_DAYS,
+                key="risk_aging_days"
+            )
+        with col2:
+            probability_threshold = st.number_input(
+                "Low Probability Below (%)",
+                min_value=0,
+                max_value=100,
+                value=analytics.MIN_PROBABILITY,
+                key="risk_min_probability"
+            )
+        with col3:
+            size_ratio = st.number_input(
+                "Large Deal Above (× Average)",
+                min_value=1.0,
+                value=analytics.LARGE_DEAL_RATIO,
+                step=0.1,
+                key="risk_large_deal_ratio"
+            )
     
-    at_risk_deals = filtered_leads[
-        ((datetime.now().date() - pd.to_datetime(filtered_leads['last_contact_date']).dt.date).dt.days > aging_threshold) |
-        (filtered_leads['probability'] < probability_threshold) |
-        (filtered_leads['total_deal_value_annual'] > size_threshold)
-    ]
+    # Calculate risk flags for every open deal at once; closed deals can no
+    # longer stall or slip
+    open_deals = filtered_leads[~filtered_leads['stage'].isin(analytics.CLOSED_STAGES)]
+    risk_flags = analytics.risk_flags(
+        open_deals,
+        aging_days=aging_threshold,
+        min_probability=probability_threshold,
+        large_deal_ratio=size_ratio,
+        average_deal=avg_deal_size
+    )
+    at_risk = risk_flags > 0
+    at_risk_deals = open_deals[at_risk]
     
     if not at_risk_deals.empty:
-        st.warning(f"Found {len(at_risk_deals)} opportunities that need attention")
+        st.warning(f"Found {len(at_risk_deals):,} opportunities that need attention")
+        
+        # Paged like the lead table, so only one page is rendered
+        col1, col2 = st.columns(2)
+        with col1:
+            page_size = st.selectbox("Rows per Page", LEAD_PAGE_SIZES, key="risk_table_page_size")
+        pages = (len(at_risk_deals) - 1) // page_size + 1
+        with col2:
+            page = st.number_input(
+                f"Page (of {pages:,})", min_value=1, max_value=pages, value=1, key="risk_table_page"
+            )
+        start = (int(page) - 1) * page_size
         
         # Create risk table
-        risk_table = at_risk_deals[[
+        risk_table = at_risk_deals.iloc[start:start + page_size][[
             'institution_name', 'territory', 'stage', 'total_deal_value_annual',
             'probability', 'last_contact_date'
-        ]].copy()
-        
-        # Add risk indicators
-        risk_table['Risk Factors'] = risk_table.apply(
-            lambda x: ' | '.join([
-                'Aging' if (datetime.now().date() - pd.to_datetime(x['last_contact_date']).dt.date).days > aging_threshold else '',
-                'Low Probability' if x['probability'] < probability_threshold else '',
-                'Large Deal' if x['total_deal_value_annual'] > size_threshold else ''
-            ]).strip(' |'),
-            axis=1
-        )
+        ]].assign(**{'Risk Factors': analytics.RISK_LABELS[risk_flags[at_risk][start:start + page_size]]})
         
         st.dataframe(
             risk_table.style.format({
@@ -1220,1183 +1725,1239 @@ def analyze_pipeline():
             hide_index=True,
             use_container_width=True
         )
+        st.caption(f"Deals {start + 1:,}–{start + len(risk_table):,} of {len(at_risk_deals):,}")
+        
+        # Where the risk sits
+        col1, col2 = st.columns(2)
+        with col1:
+            st.subheader("Risk by Territory")
+            st.dataframe(
+                analytics.risk_counts(open_deals, risk_flags, 'territory'),
+                use_container_width=True
+            )
+        with col2:
+            st.subheader("Risk by Owner")
+            st.dataframe(
+                analytics.risk_counts(open_deals, risk_flags, 'lead_owner'),
+                use_container_width=True
+            )
     else:
         st.success("No high-risk opportunities identified")
 def analyze_revenue_forecast():
     """Comprehensive revenue forecasting dashboard for Acolyte"""
     st.title("Revenue Forecasting Dashboard")
 
+    leads = current_leads()
+
     # Check if we have the necessary columns
-    if 'total_deal_value_annual' not in st.session_state.leads.columns:
+    if 'total_deal_value_annual' not in leads.columns:
         st.warning("Please add some leads first to generate revenue forecasts.")
         return
     
-    if len(st.session_state.leads) == 0:
+    if len(leads) == 0:
         st.warning("No leads available for forecasting. Please add some leads first.")
         return
 
+    # Date filters for forecasting period, shared by every tab
+    col1, col2 = st.columns(2)
+    with col1:
+        forecast_period = st.selectbox(
+            "Forecast Period",
+            ["Next Quarter", "Next 6 Months", "Next Year"]
+        )
+    
+    # Leads are selected by expected close date
+    _, forecast_end = analytics.resolve_period(forecast_period)
+
     # Create tabs for different forecasting views
-    tab1, tab2, tab3 = st.tabs([
+    tab1, tab2, tab3 = lazy_tabs([
         "Pipeline-Based Forecast", 
         "Territory-Based Projections",
         "Scenario Analysis"
-    ])
+    ], "forecast_tab")
 
     with tab1:
-        st.header("Pipeline-Based Revenue Forecast")
-        
-        # Date filters for forecasting period
-        col1, col2 = st.columns(2)
-        with col1:
-            forecast_period = st.selectbox(
-                "Forecast Period",
-                ["Next Quarter", "Next 6 Months", "Next Year"]
-            )
-        
-        # Calculate forecast dates
-        current_date = datetime.now().date()
-        if forecast_period == "Next Quarter":
-            forecast_end = current_date + timedelta(days=90)
-        elif forecast_period == "Next 6 Months":
-            forecast_end = current_date + timedelta(days=180)
-        else:
-            forecast_end = current_date + timedelta(days=365)
-
-        # Filter leads based on expected close dates
-        forecast_leads = st.session_state.leads[
-            (pd.to_datetime(st.session_state.leads['expected_close_date']).dt.date <= forecast_end)
-        ].copy()
-
-        # Calculate weighted pipeline values
-        forecast_leads['weighted_value'] = (
-            forecast_leads['total_deal_value_annual'] * 
-            forecast_leads['probability'] / 100
-        )
-
-        # Calculate forecast scenarios
-        total_pipeline = forecast_leads['total_deal_value_annual'].sum()
-        weighted_pipeline = forecast_leads['weighted_value'].sum()
-        
-        # Display forecast metrics
-        col1, col2, col3 = st.columns(3)
-        with col1:
-            st.metric(
-                "Conservative Forecast",
-                f"₹{weighted_pipeline * 0.8:,.0f}",
-                help="80% of weighted pipeline value"
-            )
-        with col2:
-            st.metric(
-                "Base Forecast",
-                f"₹{weighted_pipeline:,.0f}",
-                help="100% of weighted pipeline value"
-            )
-        with col3:
-            st.metric(
-                "Optimistic Forecast",
-                f"₹{weighted_pipeline * 1.2:,.0f}",
-                help="120% of weighted pipeline value"
-            )
-
-        # Monthly forecast breakdown
-        forecast_leads['month'] = pd.to_datetime(
-            forecast_leads['expected_close_date']
-        ).dt.to_period('M')
-
-        monthly_forecast = forecast_leads.groupby('month').agg({
-            'total_deal_value_annual': 'sum',
-            'weighted_value': 'sum'
-        }).reset_index()
-
-        monthly_forecast['month'] = monthly_forecast['month'].astype(str)
+        if tab1.open:
+            st.header("Pipeline-Based Revenue Forecast")
+            
+            # Monthly forecast breakdown; its weighted values add up to the forecast
+            monthly_forecast = pipeline_summary(
+                'close_month', 'expected_close_date', None, forecast_end
+            ).reset_index()
+            monthly_forecast = monthly_forecast.assign(month=monthly_forecast['close_month'].astype(str))
+            weighted_pipeline = monthly_forecast['weighted_value'].sum()
+            
+            # Display forecast metrics
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                st.metric(
+                    "Conservative Forecast",
+                    f"₹{weighted_pipeline * 0.8:,.0f}",
+                    help="80% of weighted pipeline value"
+                )
+            with col2:
+                st.metric(
+                    "Base Forecast",
+                    f"₹{weighted_pipeline:,.0f}",
+                    help="100% of weighted pipeline value"
+                )
+            with col3:
+                st.metric(
+                    "Optimistic Forecast",
+                    f"₹{weighted_pipeline * 1.2:,.0f}",
+                    help="120% of weighted pipeline value"
+                )
 
-        # Create monthly forecast visualization
-        fig = go.Figure()
-        
-        # Add total potential revenue
-        fig.add_trace(go.Bar(
-            name='Potential Revenue',
-            x=monthly_forecast['month'],
-            y=monthly_forecast['total_deal_value_annual'],
-            marker_color='lightblue'
-        ))
-        
-        # Add weighted forecast
-        fig.add_trace(go.Bar(
-            name='Weighted Forecast',
-            x=monthly_forecast['month'],
-            y=monthly_forecast['weighted_value'],
-            marker_color='darkblue'
-        ))
+            # Create monthly forecast visualization
+            fig = go.Figure()
+            
+            # Add total potential revenue
+            fig.add_trace(go.Bar(
+                name='Potential Revenue',
+                x=monthly_forecast['month'],
+                y=monthly_forecast['total_value'],
+                marker_color='lightblue'
+            ))
+            
+            # Add weighted forecast
+            fig.add_trace(go.Bar(
+                name='Weighted Forecast',
+                x=monthly_forecast['month'],
+                y=monthly_forecast['weighted_value'],
+                marker_color='darkblue'
+            ))
 
-        fig.update_layout(
-            title="Monthly Revenue Forecast",
-            barmode='overlay',
-            xaxis_title="Month",
-            yaxis_title="Revenue (₹)",
-            height=400
-        )
+            fig.update_layout(
+                title="Monthly Revenue Forecast",
+                barmode='overlay',
+                xaxis_title="Month",
+                yaxis_title="Revenue (₹)",
+                height=400
+            )
 
-        st.plotly_chart(fig, use_container_width=True)
+            st.plotly_chart(fig, use_container_width=True)
 
     with tab2:
-        st.header("Territory-Based Revenue Projections")
-
-        # Territory-wise forecast
-        territory_forecast = forecast_leads.groupby('territory').agg({
-            'total_deal_value_annual': 'sum',
-            'weighted_value': 'sum',
-            'institution_name': 'count'
-        }).reset_index()
-
-        # Calculate territory growth projections
-        territory_forecast['growth_projection'] = territory_forecast['weighted_value'] * 1.1
+        if tab2.open:
+            st.header("Territory-Based Revenue Projections")
+
+            # Territory-wise forecast
+            territory_forecast = pipeline_summary(
+                'territory', 'expected_close_date', None, forecast_end
+            ).reset_index()
+
+            # Bookings projected from each territory's monthly history up to the period end
+            bookings = measure_forecast('bookings')
+            bookings = bookings.loc[:, bookings.columns <= pd.Period(forecast_end, freq='M')]
+            projected = bookings.groupby(level='territory').sum().sum(axis=1)
+            territory_forecast = territory_forecast.assign(
+                projected_bookings=territory_forecast['territory'].map(projected).fillna(0.0)
+            )
 
-        # Territory forecast visualization
-        fig = go.Figure()
-        
-        for measure in ['weighted_value', 'growth_projection']:
-            fig.add_trace(go.Bar(
-                name='Current Forecast' if measure == 'weighted_value' else 'Growth Projection',
-                x=territory_forecast['territory'],
-                y=territory_forecast[measure],
-                text=territory_forecast[measure].map('₹{:,.0f}'.format),
-                textposition='auto',
-            ))
+            # Territory forecast visualization
+            fig = go.Figure()
+            
+            for measure in ['weighted_value', 'projected_bookings']:
+                fig.add_trace(go.Bar(
+                    name='Current Forecast' if measure == 'weighted_value' else 'Projected Bookings',
+                    x=territory_forecast['territory'],
+                    y=territory_forecast[measure],
+                    text=territory_forecast[measure].map('₹{:,.0f}'.format),
+                    textposition='auto',
+                ))
 
-        fig.update_layout(
-            title="Territory Revenue Projections",
-            barmode='group',
-            xaxis_title="Territory",
-            yaxis_title="Revenue (₹)",
-            height=400
-        )
+            fig.update_layout(
+                title="Territory Revenue Projections",
+                barmode='group',
+                xaxis_title="Territory",
+                yaxis_title="Revenue (₹)",
+                height=400
+            )
 
-        st.plotly_chart(fig, use_container_width=True)
+            st.plotly_chart(fig, use_container_width=True)
 
-        # Territory metrics table
-        st.dataframe(
-            territory_forecast.style.format({
-                'total_deal_value_annual': '₹{:,.0f}',
-                'weighted_value': '₹{:,.0f}',
-                'growth_projection': '₹{:,.0f}'
-            }),
-            hide_index=True
-        )
+            # Territory metrics table
+            st.dataframe(
+                territory_forecast.style.format({
+                    'total_deal_value_annual': '₹{:,.0f}',
+                    'weighted_value': '₹{:,.0f}',
+                    'projected_bookings': '₹{:,.0f}'
+                }),
+                hide_index=True
+            )
+            
+            # How each territory and category series is projected
+            with st.expander("Projection Methods"):
+                fitted = series_forecasts()[1]
+                methods = pd.DataFrame({'Method': fitted['method'], 'Backtest Error': fitted['error']})
+                methods = methods[methods.index.get_level_values('measure') == 'bookings'].droplevel('measure')
+                if methods.empty:
+                    st.info("No closed-won history to project bookings from yet.")
+                else:
+                    st.caption(
+                        f"Each series uses the method with the lowest mean absolute error over its "
+                        f"last {forecast.BACKTEST_MONTHS} complete months"
+                    )
+                    st.dataframe(methods.style.format({'Backtest Error': '₹{:,.0f}'}))
 
     with tab3:
-        st.header("Scenario Analysis")
+        if tab3.open:
+            st.header("Scenario Analysis")
 
-        # Allow user to adjust scenario parameters
-        st.subheader("Adjust Scenario Parameters")
-        
-        col1, col2 = st.columns(2)
-        with col1:
-            conversion_rate_adj = st.slider(
-                "Conversion Rate Adjustment",
-                min_value=-50,
-                max_value=50,
-                value=0,
-                help="Adjust expected conversion rates"
-            )
-        
-        with col2:
-            deal_size_adj = st.slider(
-                "Average Deal Size Adjustment",
-                min_value=-50,
-                max_value=50,
-                value=0,
-                help="Adjust expected deal sizes"
-            )
+            # Allow user to adjust scenario parameters
+            st.subheader("Adjust Scenario Parameters")
+            
+            col1, col2 = st.columns(2)
+            with col1:
+                conversion_rate_adj = st.slider(
+                    "Conversion Rate Adjustment",
+                    min_value=-50,
+                    max_value=50,
+                    value=0,
+                    help="Adjust expected conversion rates"
+                )
+            
+            with col2:
+                deal_size_adj = st.slider(
+                    "Average Deal Size Adjustment",
+                    min_value=-50,
+                    max_value=50,
+                    value=0,
+                    help="Adjust expected deal sizes"
+                )
 
-        # Calculate adjusted forecasts
-        base_conversion = len(forecast_leads[forecast_leads['stage'] == 'Closed Won']) / len(forecast_leads)
-        adjusted_conversion = base_conversion * (1 + conversion_rate_adj/100)
-        
-        base_deal_size = forecast_leads['total_deal_value_annual'].mean()
-        adjusted_deal_size = base_deal_size * (1 + deal_size_adj/100)
-
-        # Create scenario comparison
-        scenarios = pd.DataFrame({
-            'Scenario': ['Conservative', 'Base', 'Optimistic'],
-            'Conversion Rate': [
-                adjusted_conversion * 0.8,
-                adjusted_conversion,
-                adjusted_conversion * 1.2
-            ],
-            'Deal Size': [
-                adjusted_deal_size * 0.8,
-                adjusted_deal_size,
-                adjusted_deal_size * 1.2
-            ]
-        })
+            simulation_method = st.radio(
+                "Method",
+                ["Scenario Multipliers", "Monte Carlo Simulation"],
+                horizontal=True,
+                key="scenario_method",
+                help="Fixed 80%/100%/120% scenarios, or revenue sampled deal by deal"
+            )
 
-        scenarios['Forecast'] = (
-            scenarios['Conversion Rate'] * 
-            scenarios['Deal Size'] * 
-            len(forecast_leads)
-        )
+            # Filter leads based on expected close dates
+            forecast_leads = leads_between('expected_close_date', None, forecast_end)
+            if forecast_leads.empty:
+                st.info("No leads are expected to close in this period.")
+            elif simulation_method == "Monte Carlo Simulation":
+                show_revenue_simulation(forecast_leads, forecast_end, conversion_rate_adj, deal_size_adj)
+            else:
+                show_revenue_scenarios(forecast_leads, conversion_rate_adj, deal_size_adj)
 
-        # Display scenario comparison
-        st.dataframe(
-            scenarios.style.format({
-                'Conversion Rate': '{:.1%}',
-                'Deal Size': '₹{:,.0f}',
-                'Forecast': '₹{:,.0f}'
-            }),
-            hide_index=True
-        )
+def show_revenue_scenarios(forecast_leads, conversion_rate_adj, deal_size_adj):
+    """Conservative, base and optimistic forecasts from fixed multipliers"""
+    weighted_pipeline = (
+        forecast_leads['total_deal_value_annual'] * forecast_leads['probability'] / 100
+    ).sum()
 
-        # Create scenario visualization
-        fig = go.Figure()
-        
-        fig.add_trace(go.Bar(
-            x=scenarios['Scenario'],
-            y=scenarios['Forecast'],
-            text=scenarios['Forecast'].map('₹{:,.0f}'.format),
-            textposition='auto',
-        ))
+    # Calculate adjusted forecasts
+    base_conversion = len(forecast_leads[forecast_leads['stage'] == 'Closed Won']) / len(forecast_leads)
+    adjusted_conversion = base_conversion * (1 + conversion_rate_adj/100)
+    
+    base_deal_size = forecast_leads['total_deal_value_annual'].mean()
+    adjusted_deal_size = base_deal_size * (1 + deal_size_adj/100)
+
+    # Create scenario comparison
+    scenarios = pd.DataFrame({
+        'Scenario': ['Conservative', 'Base', 'Optimistic'],
+        'Conversion Rate': [
+            adjusted_conversion * 0.8,
+            adjusted_conversion,
+            adjusted_conversion * 1.2
+        ],
+        'Deal Size': [
+            adjusted_deal_size * 0.8,
+            adjusted_deal_size,
+            adjusted_deal_size * 1.2
+        ]
+    })
 
-        fig.update_layout(
-            title="Revenue Forecast Scenarios",
-            xaxis_title="Scenario",
-            yaxis_title="Revenue (₹)",
-            height=400
-        )
+    scenarios['Forecast'] = (
+        scenarios['Conversion Rate'] * 
+        scenarios['Deal Size'] * 
+        len(forecast_leads)
+    )
 
-        st.plotly_chart(fig, use_container_width=True)
+    # Display scenario comparison
+    st.dataframe(
+        scenarios.style.format({
+            'Conversion Rate': '{:.1%}',
+            'Deal Size': '₹{:,.0f}',
+            'Forecast': '₹{:,.0f}'
+        }),
+        hide_index=True
+    )
 
-        # Additional insights
-        st.subheader("Key Insights")
+    # Create scenario visualization
+    fig = go.Figure()
+    
+    fig.add_trace(go.Bar(
+        x=scenarios['Scenario'],
+        y=scenarios['Forecast'],
+        text=scenarios['Forecast'].map('₹{:,.0f}'.format),
+        textposition='auto',
+    ))
 
-        # Calculate and display key metrics
-        expected_growth = (scenarios.iloc[1]['Forecast'] / 
-                         weighted_pipeline - 1) * 100
-        
-        col1, col2 = st.columns(2)
-        with col1:
-            st.metric(
-                "Expected Growth",
-                f"{expected_growth:.1f}%",
-                help="Expected growth based on scenario adjustments"
-            )
-        
-        with col2:
-            confidence_score = min(100, 
-                                 (adjusted_conversion / base_conversion) * 100)
-            st.metric(
-                "Forecast Confidence",
-                f"{confidence_score:.1f}%",
-                help="Confidence score based on historical performance"
-            )
-def analyze_territories():
-    """Comprehensive territory analytics dashboard for Acolyte's Karnataka expansion"""
-    st.title("Territory Analytics Dashboard")
+    fig.update_layout(
+        title="Revenue Forecast Scenarios",
+        xaxis_title="Scenario",
+        yaxis_title="Revenue (₹)",
+        height=400
+    )
 
-    if 'leads' not in st.session_state or len(st.session_state.leads) == 0:
-        st.warning("No lead data available for territory analysis. Please add some leads first.")
-        return
+    st.plotly_chart(fig, use_container_width=True)
 
-    # Create tabs for different territory views
-    tab1, tab2, tab3, tab4 = st.tabs([
-        "Territory Overview",
-        "Institution Analysis",
-        "Performance Metrics",
-        "Expansion Tracking"
-    ])
+    # Additional insights
+    st.subheader("Key Insights")
 
-    with tab1:
-        st.header("Territory Overview")
+    # Calculate and display key metrics
+    if weighted_pipeline:
+        expected_growth = (scenarios.iloc[1]['Forecast'] / weighted_pipeline - 1) * 100
+    else:
+        expected_growth = 0.0
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        st.metric(
+            "Expected Growth",
+            f"{expected_growth:.1f}%",
+            help="Expected growth based on scenario adjustments"
+        )
+    
+    with col2:
+        # The adjusted-to-base conversion ratio, which stays defined with no wins yet
+        confidence_score = min(100, 100 + conversion_rate_adj)
+        st.metric(
+            "Forecast Confidence",
+            f"{confidence_score:.1f}%",
+            help="Confidence score based on historical performance"
+        )
 
-        # Time period filter for analysis
-        col1, col2 = st.columns([2, 2])
-        with col1:
-            analysis_period = st.selectbox(
-                "Analysis Period",
-                ["Last Quarter", "Last 6 Months", "Year to Date", "All Time"]
+def show_revenue_simulation(forecast_leads, forecast_end, conversion_rate_adj, deal_size_adj):
+    """P10/P50/P90 revenue by month and territory, simulated deal by deal"""
+    # Start at as many trials as run in seconds for this pipeline; more are opt-in
+    open_deals = int((~forecast_leads['stage'].isin(analytics.CLOSED_STAGES)).sum())
+    trials = st.select_slider(
+        "Trials",
+        options=SIMULATION_TRIALS,
+        value=forecast.interactive_trials(open_deals, os.cpu_count(), SIMULATION_TRIALS),
+        key="simulation_trials",
+        format_func='{:,}'.format,
+        help=f"Run time grows in proportion to trials x open deals ({open_deals:,} here)"
+    )
+    with st.spinner("Simulating deal outcomes..."):
+        simulation = cached_aggregate(
+            ('revenue_simulation', forecast_end, conversion_rate_adj, deal_size_adj, trials),
+            lambda: forecast.simulate_revenue(
+                forecast_leads,
+                trials=trials,
+                conversion_factor=1 + conversion_rate_adj / 100,
+                value_factor=1 + deal_size_adj / 100,
+                workers=os.cpu_count()
             )
-
-        # Filter data based on selected period
-        current_date = datetime.now().date()
-        if analysis_period == "Last Quarter":
-            start_date = current_date - timedelta(days=90)
-        elif analysis_period == "Last 6 Months":
-            start_date = current_date - timedelta(days=180)
-        elif analysis_period == "Year to Date":
-            start_date = datetime(current_date.year, 1, 1).date()
-        else:
-            start_date = datetime(2000, 1, 1).date()
-
-        filtered_leads = st.session_state.leads[
-            pd.to_datetime(st.session_state.leads['first_contact_date']).dt.date >= start_date
-        ].copy()
-
-        # Calculate territory metrics
-        territory_metrics = filtered_leads.groupby('territory').agg({
-            'total_deal_value_annual': ['sum', 'mean'],
-            'institution_name': 'count',
-            'probability': 'mean',
-            'monthly_price': 'mean'
-        }).round(2)
-
-        territory_metrics.columns = [
-            'Total Pipeline', 'Avg Deal Size', 
-            'Number of Leads', 'Avg Probability',
-            'Avg Monthly Price'
-        ]
-
-        # Create territory map visualization
-        st.subheader("Karnataka Territory Performance Map")
-        
-        # Calculate territory performance score (0-100)
-        territory_metrics['Performance Score'] = (
-            (territory_metrics['Total Pipeline'] / territory_metrics['Total Pipeline'].max() * 0.4) +
-            (territory_metrics['Number of Leads'] / territory_metrics['Number of Leads'].max() * 0.3) +
-            (territory_metrics['Avg Probability'] / 100 * 0.3)
-        ) * 100
-
-        # Create a treemap visualization for territory performance
-        fig = px.treemap(
-            territory_metrics.reset_index(),
-            path=['territory'],
-            values='Total Pipeline',
-            color='Performance Score',
-            color_continuous_scale='RdYlBu',
-            title="Territory Performance Overview"
         )
-        st.plotly_chart(fig, use_container_width=True)
+    if not simulation['deals']:
+        st.info("None of these leads are open deals that can still close.")
+        return
+    
+    total = simulation['total']
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("P10 Revenue", f"₹{total['P10']:,.0f}", help="9 in 10 trials did at least this well")
+    with col2:
+        st.metric("P50 Revenue", f"₹{total['P50']:,.0f}", help="Median of all trials")
+    with col3:
+        st.metric("P90 Revenue", f"₹{total['P90']:,.0f}", help="Only 1 in 10 trials did better")
+    st.caption(
+        f"{simulation['deals']:,} open deals over {simulation['trials']:,} trials; won deals "
+        f"may slip up to {len(forecast.CLOSE_SLIP) - 1} months past their expected close"
+    )
+    
+    # Monthly revenue band
+    by_month = simulation['by_month']
+    months = by_month.index.astype(str)
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(
+        x=months, y=by_month['P90'], mode='lines', line=dict(width=0), name='P90', showlegend=False
+    ))
+    fig.add_trace(go.Scatter(
+        x=months, y=by_month['P10'], mode='lines', line=dict(width=0), name='P10 – P90',
+        fill='tonexty', fillcolor='rgba(0, 0, 139, 0.2)'
+    ))
+    fig.add_trace(go.Scatter(
+        x=months, y=by_month['P50'], mode='lines+markers', name='P50', line=dict(color='darkblue')
+    ))
+    fig.update_layout(
+        title="Simulated Revenue by Month",
+        xaxis_title="Month",
+        yaxis_title="Revenue (₹)",
+        height=400
+    )
+    st.plotly_chart(fig, use_container_width=True)
+    
+    # Territory ranges
+    by_territory = simulation['by_territory'].sort_values('P50', ascending=False)
+    fig = go.Figure(go.Bar(
+        x=by_territory.index,
+        y=by_territory['P50'],
+        error_y=dict(
+            type='data',
+            symmetric=False,
+            array=by_territory['P90'] - by_territory['P50'],
+            arrayminus=by_territory['P50'] - by_territory['P10']
+        ),
+        text=by_territory['P50'].map('₹{:,.0f}'.format),
+        textposition='auto'
+    ))
+    fig.update_layout(
+        title="Simulated Revenue by Territory (P10 – P90)",
+        xaxis_title="Territory",
+        yaxis_title="Revenue (₹)",
+        height=400
+    )
+    st.plotly_chart(fig, use_container_width=True)
+    
+    st.dataframe(
+        by_territory.rename_axis('Territory').style.format('₹{:,.0f}')
+    )
 
-        # Display territory metrics table
-        st.subheader("Territory Performance Metrics")
-        st.dataframe(
-            territory_metrics.style.format({
-                'Total Pipeline': '₹{:,.0f}',
-                'Avg Deal Size': '₹{:,.0f}',
-                'Avg Probability': '{:.1f}%',
-                'Avg Monthly Price': '₹{:.0f}',
-                'Performance Score': '{:.1f}'
-            }),
-            hide_index=False
-        )
+def analyze_territories():
+    """Comprehensive territory analytics dashboard for Acolyte's Karnataka expansion"""
+    st.title("Territory Analytics Dashboard")
 
-    with tab2:
-        st.header("Institution Analysis")
+    leads = current_leads()
+
+    if len(leads) == 0:
+        st.warning("No lead data available for territory analysis. Please add some leads first.")
+        return
 
-        # Territory selection for detailed analysis
-        selected_territory = st.selectbox(
-            "Select Territory for Analysis",
-            filtered_leads['territory'].unique()
+    # Time period filter for analysis, shared by every tab
+    col1, col2 = st.columns([2, 2])
+    with col1:
+        analysis_period = st.selectbox(
+            "Analysis Period",
+            ["Last Quarter", "Last 6 Months", "Year to Date", "All Time"]
         )
+    start_date, end_date = analytics.resolve_period(analysis_period)
 
-        territory_leads = filtered_leads[
-            filtered_leads['territory'] == selected_territory
-        ]
+    # Create tabs for different territory views
+    tab1, tab2, tab3, tab4 = lazy_tabs([
+        "Territory Overview",
+        "Institution Analysis",
+        "Performance Metrics",
+        "Expansion Tracking"
+    ], "territory_tab")
 
-        # Institution category distribution
-        category_dist = territory_leads.groupby('category').agg({
-            'institution_name': 'count',
-            'total_deal_value_annual': 'sum'
-        }).reset_index()
+    with tab1:
+        if tab1.open:
+            st.header("Territory Overview")
+
+            # Calculate territory metrics
+            territory_metrics = pipeline_summary('territory', start=start_date, end=end_date)[
+                ['total_value', 'avg_value', 'lead_count', 'avg_probability', 'avg_monthly_price']
+            ].round(2)
+
+            territory_metrics.columns = [
+                'Total Pipeline', 'Avg Deal Size', 
+                'Number of Leads', 'Avg Probability',
+                'Avg Monthly Price'
+            ]
 
-        # Create category distribution visualization
-        col1, col2 = st.columns(2)
-        
-        with col1:
-            fig = px.pie(
-                category_dist,
-                values='institution_name',
-                names='category',
-                title=f"Institution Distribution in {selected_territory}"
+            # Create territory map visualization
+            st.subheader("Karnataka Territory Performance Map")
+            
+            # Calculate territory performance score (0-100)
+            territory_metrics['Performance Score'] = (
+                (territory_metrics['Total Pipeline'] / territory_metrics['Total Pipeline'].max() * 0.4) +
+                (territory_metrics['Number of Leads'] / territory_metrics['Number of Leads'].max() * 0.3) +
+                (territory_metrics['Avg Probability'] / 100 * 0.3)
+            ) * 100
+
+            # Create a treemap visualization for territory performance
+            fig = px.treemap(
+                territory_metrics.reset_index(),
+                path=['territory'],
+                values='Total Pipeline',
+                color='Performance Score',
+                color_continuous_scale='RdYlBu',
+                title="Territory Performance Overview"
             )
             st.plotly_chart(fig, use_container_width=True)
 
-        with col2:
-            fig = px.pie(
-                category_dist,
-                values='total_deal_value_annual',
-                names='category',
-                title=f"Pipeline Distribution by Category in {selected_territory}"
+            # Display territory metrics table
+            st.subheader("Territory Performance Metrics")
+            st.dataframe(
+                territory_metrics.style.format({
+                    'Total Pipeline': '₹{:,.0f}',
+                    'Avg Deal Size': '₹{:,.0f}',
+                    'Avg Probability': '{:.1f}%',
+                    'Avg Monthly Price': '₹{:.0f}',
+                    'Performance Score': '{:.1f}'
+                }),
+                hide_index=False
             )
-            st.plotly_chart(fig, use_container_width=True)
 
-        # Institution size analysis
-        st.subheader("Institution Size Analysis")
-        
-        fig = px.histogram(
-            territory_leads,
-            x='current_student_count',
-            nbins=20,
-            title=f"Institution Size Distribution in {selected_territory}"
-        )
-        st.plotly_chart(fig, use_container_width=True)
+    with tab2:
+        if tab2.open:
+            st.header("Institution Analysis")
 
-    with tab3:
-        st.header("Performance Metrics")
-
-        # Calculate key performance indicators by territory
-        territory_kpis = filtered_leads.groupby('territory').apply(
-            lambda x: pd.Series({
-                'Total Pipeline': x['total_deal_value_annual'].sum(),
-                'Lead Conversion Rate': (
-                    len(x[x['stage'] == 'Closed Won']) / len(x) * 100 
-                    if len(x) > 0 else 0
-                ),
-                'Avg Sales Cycle': (
-                    (pd.to_datetime(x[x['stage'] == 'Closed Won']['actual_close_date']) -
-                     pd.to_datetime(x[x['stage'] == 'Closed Won']['first_contact_date']))
-                    .mean().days if len(x[x['stage'] == 'Closed Won']) > 0 else 0
-                ),
-                'Active Opportunities': len(x[x['stage'].isin(['Qualified', 'Demo', 'Proposal', 'Negotiation'])]),
-                'Win Rate': (
-                    len(x[x['stage'] == 'Closed Won']) / 
-                    (len(x[x['stage'].isin(['Closed Won', 'Closed Lost'])]))
-                    * 100 if len(x[x['stage'].isin(['Closed Won', 'Closed Lost'])]) > 0 else 0
+            # Territory selection for detailed analysis
+            selected_territory = st.selectbox(
+                "Select Territory for Analysis",
+                pipeline_summary('territory', start=start_date, end=end_date).index
+            )
+
+            territory_leads = leads_between(
+                'first_contact_date', start_date, end_date, ['territory', 'current_student_count']
+            )
+            territory_leads = territory_leads[
+                territory_leads['territory'] == selected_territory
+            ]
+
+            # Institution category distribution
+            category_dist = pipeline_summary(
+                ('territory', 'category'), start=start_date, end=end_date
+            ).reset_index()
+            category_dist = category_dist[category_dist['territory'] == selected_territory]
+
+            # Create category distribution visualization
+            col1, col2 = st.columns(2)
+            
+            with col1:
+                fig = px.pie(
+                    category_dist,
+                    values='lead_count',
+                    names='category',
+                    title=f"Institution Distribution in {selected_territory}"
                 )
-            })
-        ).round(2)
+                st.plotly_chart(fig, use_container_width=True)
 
-        # Create KPI visualizations
-        col1, col2 = st.columns(2)
-        
-        with col1:
-            fig = go.Figure(data=[
-                go.Bar(
-                    x=territory_kpis.index,
-                    y=territory_kpis['Lead Conversion Rate'],
-                    name='Conversion Rate'
-                )
-            ])
-            fig.update_layout(title="Lead Conversion Rate by Territory")
-            st.plotly_chart(fig, use_container_width=True)
+            with col2:
+                fig = px.pie(
+                    category_dist,
+                    values='total_value',
+                    names='category',
+                    title=f"Pipeline Distribution by Category in {selected_territory}"
+                )
+                st.plotly_chart(fig, use_container_width=True)
 
-        with col2:
-            fig = go.Figure(data=[
-                go.Bar(
-                    x=territory_kpis.index,
-                    y=territory_kpis['Win Rate'],
-                    name='Win Rate'
-                )
-            ])
-            fig.update_layout(title="Win Rate by Territory")
+            # Institution size analysis
+            st.subheader("Institution Size Analysis")
+            
+            fig = histogram_figure(
+                territory_leads['current_student_count'],
+                f"Institution Size Distribution in {selected_territory}",
+                'current_student_count',
+                bins=20
+            )
             st.plotly_chart(fig, use_container_width=True)
 
-        # Display KPI table
-        st.subheader("Territory KPIs")
-        st.dataframe(
-            territory_kpis.style.format({
-                'Total Pipeline': '₹{:,.0f}',
-                'Lead Conversion Rate': '{:.1f}%',
-                'Avg Sales Cycle': '{:.0f} days',
-                'Win Rate': '{:.1f}%'
-            }),
-            hide_index=False
-        )
+    with tab3:
+        if tab3.open:
+            st.header("Performance Metrics")
+
+            # Calculate key performance indicators by territory
+            territory_kpis = cached_aggregate(
+                ('territory_kpis', start_date, end_date),
+                lambda: analytics.territory_kpis(
+                    leads_between('first_contact_date', start_date, end_date)
+                )
+            )[
+                ['Total Pipeline', 'Lead Conversion Rate', 'Avg Sales Cycle',
+                 'Active Opportunities', 'Win Rate']
+            ].round(2)
 
-    with tab4:
-        st.header("Expansion Tracking")
-
-        # Calculate territory penetration rates
-        territory_targets = {
-            'Bangalore Urban': {'target_institutions': 15, 'potential_students': 4500},
-            'Bangalore Rural & Mysore': {'target_institutions': 8, 'potential_students': 2400},
-            'Mangalore & Coastal': {'target_institutions': 6, 'potential_students': 1800},
-            'North Karnataka': {'target_institutions': 5, 'potential_students': 1500}
-        }
-
-        expansion_metrics = []
-        for territory in territory_targets:
-            territory_data = filtered_leads[filtered_leads['territory'] == territory]
-            
-            metrics = {
-                'Territory': territory,
-                'Current Institutions': len(territory_data['institution_name'].unique()),
-                'Target Institutions': territory_targets[territory]['target_institutions'],
-                'Current Students': territory_data['current_student_count'].sum(),
-                'Target Students': territory_targets[territory]['potential_students']
-            }
+            # Create KPI visualizations
+            col1, col2 = st.columns(2)
             
-            metrics['Institution Coverage'] = (
-                metrics['Current Institutions'] / metrics['Target Institutions'] * 100
-            )
-            metrics['Student Coverage'] = (
-                metrics['Current Students'] / metrics['Target Students'] * 100
+            with col1:
+                fig = go.Figure(data=[
+                    go.Bar(
+                        x=territory_kpis.index,
+                        y=territory_kpis['Lead Conversion Rate'],
+                        name='Conversion Rate'
+                    )
+                ])
+                fig.update_layout(title="Lead Conversion Rate by Territory")
+                st.plotly_chart(fig, use_container_width=True)
+
+            with col2:
+                fig = go.Figure(data=[
+                    go.Bar(
+                        x=territory_kpis.index,
+                        y=territory_kpis['Win Rate'],
+                        name='Win Rate'
+                    )
+                ])
+                fig.update_layout(title="Win Rate by Territory")
+                st.plotly_chart(fig, use_container_width=True)
+
+            # Display KPI table
+            st.subheader("Territory KPIs")
+            st.dataframe(
+                territory_kpis.style.format({
+                    'Total Pipeline': '₹{:,.0f}',
+                    'Lead Conversion Rate': '{:.1f}%',
+                    'Avg Sales Cycle': '{:.0f} days',
+                    'Win Rate': '{:.1f}%'
+                }),
+                hide_index=False
             )
-            
-            expansion_metrics.append(metrics)
 
-        expansion_df = pd.DataFrame(expansion_metrics)
+    with tab4:
+        if tab4.open:
+            st.header("Expansion Tracking")
+
+            # Calculate territory penetration rates
+            expansion_df = cached_aggregate(
+                ('territory_expansion', start_date, end_date),
+                lambda: analytics.territory_kpis(
+                    leads_between('first_contact_date', start_date, end_date), TERRITORY_TARGETS
+                )
+            )[
+                ['Current Institutions', 'Target Institutions', 'Current Students',
+                 'Target Students', 'Institution Coverage', 'Student Coverage']
+            ].rename_axis('Territory').reset_index()
 
-        # Create expansion progress visualization
-        fig = go.Figure()
-        
-        fig.add_trace(go.Bar(
-            name='Institution Coverage',
-            x=expansion_df['Territory'],
-            y=expansion_df['Institution Coverage'],
-            yaxis='y',
-            offsetgroup=1
-        ))
-        
-        fig.add_trace(go.Bar(
-            name='Student Coverage',
-            x=expansion_df['Territory'],
-            y=expansion_df['Student Coverage'],
-            yaxis='y2',
-            offsetgroup=2
-        ))
+            # Create expansion progress visualization
+            fig = go.Figure()
+            
+            fig.add_trace(go.Bar(
+                name='Institution Coverage',
+                x=expansion_df['Territory'],
+                y=expansion_df['Institution Coverage'],
+                yaxis='y',
+                offsetgroup=1
+            ))
+            
+            fig.add_trace(go.Bar(
+                name='Student Coverage',
+                x=expansion_df['Territory'],
+                y=expansion_df['Student Coverage'],
+                yaxis='y2',
+                offsetgroup=2
+            ))
 
-        fig.update_layout(
-            yaxis=dict(title='Institution Coverage %', side='left', range=[0, 100]),
-            yaxis2=dict(title='Student Coverage %', side='right', range=[0, 100], overlaying='y'),
-            title='Territory Expansion Progress',
-            barmode='group'
-        )
+            fig.update_layout(
+                yaxis=dict(title='Institution Coverage %', side='left', range=[0, 100]),
+                yaxis2=dict(title='Student Coverage %', side='right', range=[0, 100], overlaying='y'),
+                title='Territory Expansion Progress',
+                barmode='group'
+            )
 
-        st.plotly_chart(fig, use_container_width=True)
+            st.plotly_chart(fig, use_container_width=True)
 
-        # Display expansion metrics table
-        st.subheader("Territory Expansion Metrics")
-        st.dataframe(
-            expansion_df.style.format({
-                'Institution Coverage': '{:.1f}%',
-                'Student Coverage': '{:.1f}%',
-                'Current Students': '{:,.0f}',
-                'Target Students': '{:,.0f}'
-            }),
-            hide_index=True
-        )
+            # Display expansion metrics table
+            st.subheader("Territory Expansion Metrics")
+            st.dataframe(
+                expansion_df.style.format({
+                    'Institution Coverage': '{:.1f}%',
+                    'Student Coverage': '{:.1f}%',
+                    'Current Students': '{:,.0f}',
+                    'Target Students': '{:,.0f}'
+                }),
+                hide_index=True
+            )
 
-        # Provide expansion recommendations
-        st.subheader("Expansion Recommendations")
-        
-        for _, row in expansion_df.iterrows():
-            territory = row['Territory']
-            institution_coverage = row['Institution Coverage']
-            student_coverage = row['Student Coverage']
+            # Provide expansion recommendations
+            st.subheader("Expansion Recommendations")
             
-            st.write(f"**{territory}**")
-            
-            if institution_coverage < 30:
-                st.write("🔴 Priority: High - Need to accelerate institution acquisition")
-            elif institution_coverage < 60:
-                st.write("🟡 Priority: Medium - Continue steady expansion")
-            else:
-                st.write("🟢 Priority: Low - Focus on optimizing existing partnerships")
+            for _, row in expansion_df.iterrows():
+                territory = row['Territory']
+                institution_coverage = row['Institution Coverage']
+                student_coverage = row['Student Coverage']
                 
-            recommendations = []
-            if institution_coverage < student_coverage:
-                recommendations.append(
-                    "Focus on acquiring smaller institutions to increase institutional presence"
-                )
-            elif student_coverage < institution_coverage:
-                recommendations.append(
-                    "Target larger institutions to increase student coverage"
-                )
+                st.write(f"**{territory}**")
                 
-            if recommendations:
-                for rec in recommendations:
-                    st.write(f"- {rec}")
-            
-            st.write("")
+                if institution_coverage < 30:
+                    st.write("🔴 Priority: High - Need to accelerate institution acquisition")
+                elif institution_coverage < 60:
+                    st.write("🟡 Priority: Medium - Continue steady expansion")
+                else:
+                    st.write("🟢 Priority: Low - Focus on optimizing existing partnerships")
+                    
+                recommendations = []
+                if institution_coverage < student_coverage:
+                    recommendations.append(
+                        "Focus on acquiring smaller institutions to increase institutional presence"
+                    )
+                elif student_coverage < institution_coverage:
+                    recommendations.append(
+                        "Target larger institutions to increase student coverage"
+                    )
+                    
+                if recommendations:
+                    for rec in recommendations:
+                        st.write(f"- {rec}")
+                
+                st.write("")
 def calculate_pricing():
     """Interactive pricing calculator for Acolyte's sales team"""
     st.title("Acolyte Pricing Calculator")
 
     # Create tabs for different pricing scenarios
-    tab1, tab2, tab3 = st.tabs(["Quick Calculator", "Custom Pricing","Detailed Analysis"])
+    tab1, tab2, tab3 = lazy_tabs(
+        ["Quick Calculator", "Custom Pricing","Detailed Analysis"], "pricing_tab"
+    )
 
     with tab1:
-        st.header("Quick Pricing Calculator")
+        if tab1.open:
+            st.header("Quick Pricing Calculator")
 
-        # Basic inputs
-        col1, col2 = st.columns(2)
-        
-        with col1:
-            # Institution details
-            student_count_std = st.number_input(
-                "Number of Students",
-                min_value=1,
-                value=100,
-                help="Total number of students in the institution",
-                key="standard_tab_student_count"  # Added unique key
-            )
-            institution_category = st.selectbox(
-                "Institution Category",
-                ["Higher Capacity", "Limited Capacity"],
-                help="Select the institution's capacity category",
-                key="standard_tab_category"
-            )
+            # Basic inputs
+            col1, col2 = st.columns(2)
+            
+            with col1:
+                # Institution details
+                student_count_std = st.number_input(
+                    "Number of Students",
+                    min_value=1,
+                    value=100,
+                    help="Total number of students in the institution",
+                    key="standard_tab_student_count"  # Added unique key
+                )
+                institution_category = st.selectbox(
+                    "Institution Category",
+                    ["Higher Capacity", "Limited Capacity"],
+                    help="Select the institution's capacity category",
+                    key="standard_tab_category"
+                )
 
-        with col2:
-            # Payment preferences
-            payment_cycle_std = st.selectbox(
-                "Payment Cycle",
-                ["Monthly", "Quarterly", "Annual"],
-                help="Select the preferred payment cycle",
-                key="standard_tab_payment_cycle"
-            )
+            with col2:
+                # Payment preferences
+                payment_cycle_std = st.selectbox(
+                    "Payment Cycle",
+                    ["Monthly", "Quarterly", "Annual"],
+                    help="Select the preferred payment cycle",
+                    key="standard_tab_payment_cycle"
+                )
+                
+                commitment_years_std = st.slider(
+                    "Commitment Period (Years)",
+                    min_value=1,
+                    max_value=5,
+                    value=1,
+                    help="Select the number of years of commitment",
+                    key="standard_tab_commitment_years"
+                )
+
+            # Perform calculations
+            base_monthly_price = pricing.base_monthly_price(student_count_std, institution_category)
+            total_discount = pricing.total_discount(payment_cycle_std, commitment_years_std)
+            discounted_monthly_price = base_monthly_price * (1 - total_discount)
             
-            commitment_years_std = st.slider(
-                "Commitment Period (Years)",
-                min_value=1,
-                max_value=5,
-                value=1,
-                help="Select the number of years of commitment",
-                key="standard_tab_commitment_years"
+            # Calculate yearly prices with inflation
+            yearly_prices = pricing.yearly_prices(
+                discounted_monthly_price * 12 * student_count_std, 
+                commitment_years_std
             )
 
-        # Calculate base price per student
-        def get_base_monthly_price(student_count_std, category):
-            if category == "Higher Capacity":
-                if student_count_std >= 1000:
-                    return 300
-                elif student_count_std >= 500:
-                    return 450
-                else:
-                    return 750
-            else:  # Limited Capacity
-                if student_count_std >= 501:
-                    return 350
-                elif student_count_std >= 301:
-                    return 450
-                else:
-                    return 750
-
-        # Calculate all discounts
-        def calculate_total_discount(payment_cycle_std, commitment_years_std):
-            # Base payment cycle discount
-            if payment_cycle_std == "Annual":
-                cycle_discount = 0.20  # 20% for annual
-            elif payment_cycle_std == "Quarterly":
-                cycle_discount = 0.10  # 10% for quarterly
-            else:
-                cycle_discount = 0.00  # No discount for monthly
+            # Display pricing summary
+            st.subheader("Pricing Summary")
             
-            # Multi-year commitment discount (only for annual payment)
-            if payment_cycle_std == "Annual" and commitment_years_std > 1:
-                commitment_discount = (commitment_years_std - 1) * 0.05  # 5% per additional year
-            else:
-                commitment_discount = 0.00
+            col1, col2, col3 = st.columns(3)
             
-            # Total discount (capped at 40%)
-            total_discount = min(cycle_discount + commitment_discount, 0.40)
-            return total_discount
-
-        # Calculate with inflation for multi-year
-        def calculate_with_inflation(base_price, years):
-            inflation_rate = 0.05  # 5% annual inflation
-            yearly_prices = []
+            with col1:
+                st.metric(
+                    "Base Monthly Price per Student",
+                    f"₹{base_monthly_price:,.2f}"
+                )
+                
+            with col2:
+                st.metric(
+                    "Total Discount",
+                    f"{total_discount*100:.1f}%"
+                )
+                
+            with col3:
+                st.metric(
+                    "Final Monthly Price per Student",
+                    f"₹{discounted_monthly_price:,.2f}"
+                )
+
+            # Display yearly breakdown
+            st.subheader("Year-by-Year Breakdown")
+            
+            breakdown_data = []
+            for year, yearly_price in enumerate(yearly_prices, 1):
+                monthly_equivalent = yearly_price / 12
+                if payment_cycle_std == "Quarterly":
+                    quarterly_payment = yearly_price / 4
+                    breakdown_data.append({
+                        "Year": year,
+                        "Annual Total": f"₹{yearly_price:,.2f}",
+                        "Payment Amount": f"₹{quarterly_payment:,.2f} per quarter",
+                        "Monthly Equivalent": f"₹{monthly_equivalent:,.2f}"
+                    })
+                elif payment_cycle_std == "Annual":
+                    breakdown_data.append({
+                        "Year": year,
+                        "Annual Total": f"₹{yearly_price:,.2f}",
+                        "Payment Amount": f"₹{yearly_price:,.2f} per year",
+                        "Monthly Equivalent": f"₹{monthly_equivalent:,.2f}"
+                    })
+                else:  # Monthly
+                    breakdown_data.append({
+                        "Year": year,
+                        "Annual Total": f"₹{yearly_price:,.2f}",
+                        "Payment Amount": f"₹{monthly_equivalent:,.2f} per month",
+                        "Monthly Equivalent": f"₹{monthly_equivalent:,.2f}"
+                    })
+
+            st.table(pd.DataFrame(breakdown_data))
+    with tab2:
+        if tab2.open:
+            st.header("Custom Pricing Calculator")
             
-            for year in range(years):
-                inflated_price = base_price * (1 + inflation_rate) ** year
-                yearly_prices.append(inflated_price)
+            # Create columns for main inputs
+            col1, col2 = st.columns(2)
             
-            return yearly_prices
+            with col1:
+                pricing_mode = st.radio(
+                    "Pricing Mode",
+                    ["Use Standard Price as Reference", "Start with Custom Price"],
+                    help="Choose whether to start from standard pricing or enter a completely custom price",
+                    key="custom_tab_pricing_mode"
+                )
+                
+                student_count_custom = st.number_input(
+                    "Number of Students",
+                    min_value=1,
+                    value=100,
+                    help="Total number of students in the institution",
+                    key="custom_tab_student_count"  # Added unique key
+                )
 
-        # Perform calculations
-        base_monthly_price = get_base_monthly_price(student_count_std, institution_category)
-        total_discount = calculate_total_discount(payment_cycle_std, commitment_years_std)
-        discounted_monthly_price = base_monthly_price * (1 - total_discount)
-        
-        # Calculate yearly prices with inflation
-        yearly_prices = calculate_with_inflation(
-            discounted_monthly_price * 12 * student_count_std, 
-            commitment_years_std
-        )
+            with col2:
+                payment_cycle_custom = st.selectbox(
+                    "Payment Cycle",
+                    ["Monthly", "Quarterly", "Annual"],
+                    help="Select the preferred payment cycle",
+                    key="tab2_payment_cycle"
+                )
+                
+                commitment_years_custom = st.slider(
+                    "Commitment Period (Years)",
+                    min_value=1,
+                    max_value=5,
+                    value=1,
+                    help="Select the number of years of commitment",
+                    key="tab2_commitment_years"
+                )
 
-        # Display pricing summary
-        st.subheader("Pricing Summary")
-        
-        col1, col2, col3 = st.columns(3)
-        
-        with col1:
-            st.metric(
-                "Base Monthly Price per Student",
-                f"₹{base_monthly_price:,.2f}"
-            )
+            # Calculate standard price for reference
+            standard_price = pricing.base_monthly_price(student_count_custom)
+
+            # Custom pricing section
+            st.subheader("Custom Price Setting")
             
-        with col2:
-            st.metric(
-                "Total Discount",
-                f"{total_discount*100:.1f}%"
-            )
+            col1, col2 = st.columns(2)
             
-        with col3:
-            st.metric(
-                "Final Monthly Price per Student",
-                f"₹{discounted_monthly_price:,.2f}"
-            )
+            with col1:
+                if pricing_mode == "Use Standard Price as Reference":
+                    # Show standard price and allow percentage adjustment
+                    st.info(f"Standard Monthly Price: ₹{standard_price} per student")
+                    
+                    price_adjustment = st.slider(
+                        "Price Adjustment (%)",
+                        min_value=-50,
+                        max_value=50,
+                        value=0,
+                        help="Adjust price as a percentage of standard price",
+                        key="tab2_price_adjustment"
+                    )
+                    
+                    custom_price = standard_price * (1 + price_adjustment/100)
+                    
+                    # Show comparison metrics
+                    difference_from_standard = ((custom_price - standard_price) / 
+                                             standard_price * 100)
+                    
+                    st.metric(
+                        "Custom Monthly Price per Student",
+                        f"₹{custom_price:.2f}",
+                        f"{difference_from_standard:+.1f}% vs Standard"
+                    )
+                    
+                else:
+                    # Direct custom price input
+                    custom_price = st.number_input(
+                        "Enter Custom Monthly Price per Student",
+                        min_value=0.0,
+                        value=float(standard_price),
+                        step=50.0,
+                        help="Enter your custom price",
+                        key="custom_price_input",
+                    )
+                    
+                    # Show comparison to standard
+                    difference_from_standard = ((custom_price - standard_price) / 
+                                             standard_price * 100)
+                    
+                    st.metric(
+                        "Difference from Standard",
+                        f"{difference_from_standard:+.1f}%",
+                        help="Percentage difference from standard pricing"
+                    )
 
-        # Display yearly breakdown
-        st.subheader("Year-by-Year Breakdown")
-        
-        breakdown_data = []
-        for year, yearly_price in enumerate(yearly_prices, 1):
-            monthly_equivalent = yearly_price / 12
-            if payment_cycle_std == "Quarterly":
-                quarterly_payment = yearly_price / 4
-                breakdown_data.append({
-                    "Year": year,
-                    "Annual Total": f"₹{yearly_price:,.2f}",
-                    "Payment Amount": f"₹{quarterly_payment:,.2f} per quarter",
-                    "Monthly Equivalent": f"₹{monthly_equivalent:,.2f}"
-                })
-            elif payment_cycle_std == "Annual":
-                breakdown_data.append({
-                    "Year": year,
-                    "Annual Total": f"₹{yearly_price:,.2f}",
-                    "Payment Amount": f"₹{yearly_price:,.2f} per year",
-                    "Monthly Equivalent": f"₹{monthly_equivalent:,.2f}"
-                })
-            else:  # Monthly
-                breakdown_data.append({
-                    "Year": year,
-                    "Annual Total": f"₹{yearly_price:,.2f}",
-                    "Payment Amount": f"₹{monthly_equivalent:,.2f} per month",
-                    "Monthly Equivalent": f"₹{monthly_equivalent:,.2f}"
-                })
+            with col2:
+                # Additional negotiation terms
+                additional_terms = st.multiselect(
+                    "Additional Terms",
+                    [
+                        "Extended Payment Terms",
+                        "Free Implementation",
+                        "Premium Support Included",
+                        "Early Renewal Option",
+                        "Price Lock Guarantee"
+                    ],
+                    help="Select additional terms to include in the offer"
+                )
+                
+                special_notes = st.text_area(
+                    "Special Terms & Conditions",
+                    help="Enter any special terms or conditions for this custom price"
+                )
 
-        st.table(pd.DataFrame(breakdown_data))
-    with tab2:
-        st.header("Custom Pricing Calculator")
-        
-        # Create columns for main inputs
-        col1, col2 = st.columns(2)
-        
-        with col1:
-            pricing_mode = st.radio(
-                "Pricing Mode",
-                ["Use Standard Price as Reference", "Start with Custom Price"],
-                help="Choose whether to start from standard pricing or enter a completely custom price",
-                key="custom_tab_pricing_mode"
-            )
+            # Calculate total costs with custom pricing
+            st.subheader("Cost Analysis")
             
-            student_count_custom = st.number_input(
-                "Number of Students",
-                min_value=1,
-                value=100,
-                help="Total number of students in the institution",
-                key="custom_tab_student_count"  # Added unique key
-            )
-
-        with col2:
-            payment_cycle_custom = st.selectbox(
-                "Payment Cycle",
-                ["Monthly", "Quarterly", "Annual"],
-                help="Select the preferred payment cycle",
-                key="tab2_payment_cycle"
-            )
+            # Apply payment cycle and multi-year commitment discounts
+            total_discount = pricing.total_discount(payment_cycle_custom, commitment_years_custom)
             
-            commitment_years_custom = st.slider(
-                "Commitment Period (Years)",
-                min_value=1,
-                max_value=5,
-                value=1,
-                help="Select the number of years of commitment",
-                key="tab2_commitment_years"
+            # Calculate final price
+            final_monthly_price = custom_price * (1 - total_discount)
+            
+            # Create annual breakdown with inflation
+            yearly_breakdown = []
+            
+            custom_yearly_prices = pricing.yearly_prices(
+                final_monthly_price * 12 * student_count_custom, commitment_years_custom
             )
+            for year, yearly_price in enumerate(custom_yearly_prices):
+                if payment_cycle_custom == "Annual":
+                    payment_amount = yearly_price
+                    payment_text = "per year"
+                elif payment_cycle_custom == "Quarterly":
+                    payment_amount = yearly_price / 4
+                    payment_text = "per quarter"
+                else:
+                    payment_amount = yearly_price / 12
+                    payment_text = "per month"
+                    
+                yearly_breakdown.append({
+                    "Year": year + 1,
+                    "Total Annual Cost": f"₹{yearly_price:,.2f}",
+                    f"Payment Amount ({payment_cycle_custom})": f"₹{payment_amount:,.2f} {payment_text}",
+                    "Monthly Equivalent": f"₹{yearly_price/12:,.2f}"
+                })
 
-        # Calculate standard price for reference
-        def get_standard_price(student_count_custom):
-            if student_count_custom >= 1000:
-                return 300
-            elif student_count_custom >= 500:
-                return 450
-            else:
-                return 750
-
-        standard_price = get_standard_price(student_count_custom)
+            st.table(pd.DataFrame(yearly_breakdown))
 
-        # Custom pricing section
-        st.subheader("Custom Price Setting")
-        
-        col1, col2 = st.columns(2)
-        
-        with col1:
-            if pricing_mode == "Use Standard Price as Reference":
-                # Show standard price and allow percentage adjustment
-                st.info(f"Standard Monthly Price: ₹{standard_price} per student")
-                
-                price_adjustment = st.slider(
-                    "Price Adjustment (%)",
-                    min_value=-50,
-                    max_value=50,
-                    value=0,
-                    help="Adjust price as a percentage of standard price",
-                    key="tab2_price_adjustment"
-                )
-                
-                custom_price = standard_price * (1 + price_adjustment/100)
-                
-                # Show comparison metrics
-                difference_from_standard = ((custom_price - standard_price) / 
-                                         standard_price * 100)
-                
+            # Financial Impact Analysis
+            st.subheader("Financial Impact Analysis")
+            
+            total_standard_cost = (standard_price * (1 - total_discount) * 
+                                 12 * student_count_custom * commitment_years_custom)
+            total_custom_cost = (final_monthly_price * 12 * student_count_custom * 
+                               commitment_years_custom)
+            
+            cost_difference = total_custom_cost - total_standard_cost
+            
+            col1, col2, col3 = st.columns(3)
+            
+            with col1:
                 st.metric(
-                    "Custom Monthly Price per Student",
-                    f"₹{custom_price:.2f}",
-                    f"{difference_from_standard:+.1f}% vs Standard"
+                    "Total Contract Value",
+                    f"₹{total_custom_cost:,.2f}",
+                    f"₹{cost_difference:,.2f} vs Standard"
                 )
                 
-            else:
-                # Direct custom price input
-                custom_price = st.number_input(
-                    "Enter Custom Monthly Price per Student",
-                    min_value=0.0,
-                    value=float(standard_price),
-                    step=50.0,
-                    help="Enter your custom price",
-                    key="custom_price_input",
+            with col2:
+                monthly_difference = cost_difference / (12 * commitment_years_custom)
+                st.metric(
+                    "Monthly Impact",
+                    f"₹{monthly_difference:,.2f}",
+                    "vs Standard Pricing"
                 )
                 
-                # Show comparison to standard
-                difference_from_standard = ((custom_price - standard_price) / 
-                                         standard_price * 100)
-                
+            with col3:
+                per_student_impact = monthly_difference / student_count_custom
                 st.metric(
-                    "Difference from Standard",
-                    f"{difference_from_standard:+.1f}%",
-                    help="Percentage difference from standard pricing"
+                    "Per Student Impact",
+                    f"₹{per_student_impact:,.2f}",
+                    "Monthly per Student"
                 )
 
-        with col2:
-            # Additional negotiation terms
-            additional_terms = st.multiselect(
-                "Additional Terms",
-                [
-                    "Extended Payment Terms",
-                    "Free Implementation",
-                    "Premium Support Included",
-                    "Early Renewal Option",
-                    "Price Lock Guarantee"
-                ],
-                help="Select additional terms to include in the offer"
-            )
+            # Approval Requirements
+            st.subheader("Approval Requirements")
             
-            special_notes = st.text_area(
-                "Special Terms & Conditions",
-                help="Enter any special terms or conditions for this custom price"
-            )
+            if difference_from_standard <= -10:
+                st.warning("⚠️ Requires Director Approval - Price more than 10% below standard")
+            elif difference_from_standard <= -5:
+                st.warning("⚠️ Requires Sales Manager Approval - Price 5-10% below standard")
+            else:
+                st.success("✓ Within standard approval limits")
+
+            # Generate custom proposal
+            if st.button("Generate Custom Proposal"):
+                proposal_text = f"""
+                # Acolyte Custom Pricing Proposal
+
+                ## Institution Details
+                - Number of Students: {student_count_custom}
+                - Payment Cycle: {payment_cycle_custom}
+                - Commitment Period: {commitment_years_custom} years
+
+                ## Custom Pricing Structure
+                - Standard Monthly Price per Student: ₹{standard_price:,.2f}
+                - Custom Monthly Price per Student: ₹{custom_price:,.2f}
+                - Price Adjustment: {difference_from_standard:+.1f}%
+                - Applied Discounts: {total_discount*100:.1f}%
+                - Final Monthly Price per Student: ₹{final_monthly_price:,.2f}
+
+                ## Total Investment
+                - Total Contract Value: ₹{total_custom_cost:,.2f}
+                - Difference from Standard: ₹{cost_difference:,.2f}
+                - Monthly Impact: ₹{monthly_difference:,.2f}
+
+                ## Additional Terms
+                {chr(10).join([f"- {term}" for term in additional_terms])}
+
+                ## Special Terms & Conditions
+                {special_notes if special_notes else "Standard terms and conditions apply"}
+
+                ## Approval Requirements
+                {("Requires Director Approval" if difference_from_standard <= -10 else "Requires Sales Manager Approval" if difference_from_standard <= -5 else "Within standard approval limits")}
+                """
+                
+                st.download_button(
+                    "Download Custom Proposal",
+                    proposal_text,
+                    file_name="acolyte_custom_pricing_proposal.md",
+                    mime="text/markdown"
+                )
+    with tab3:
+        if tab3.open:
+            st.header("Detailed Pricing Analysis")
 
-        # Calculate total costs with custom pricing
-        st.subheader("Cost Analysis")
-        
-        # Apply payment cycle discounts
-        if payment_cycle_custom == "Annual":
-            cycle_discount = 0.20
-        elif payment_cycle_custom == "Quarterly":
-            cycle_discount = 0.10
-        else:
-            cycle_discount = 0.00
-
-        # Apply multi-year commitment discount
-        commitment_discount = (commitment_years_custom - 1) * 0.05 if payment_cycle_custom == "Annual" else 0
-        total_discount = min(cycle_discount + commitment_discount, 0.40)
-        
-        # Calculate final price
-        final_monthly_price = custom_price * (1 - total_discount)
-        
-        # Create annual breakdown with inflation
-        inflation_rate = 0.05  # 5% annual inflation
-        yearly_breakdown = []
-        
-        for year in range(commitment_years_custom):
-            yearly_price = (final_monthly_price * 12 * student_count_custom * 
-                          (1 + inflation_rate) ** year)
+            # Additional inputs for detailed analysis
+            col1, col2 = st.columns(2)
             
-            if payment_cycle_custom == "Annual":
-                payment_amount = yearly_price
-                payment_text = "per year"
-            elif payment_cycle_custom == "Quarterly":
-                payment_amount = yearly_price / 4
-                payment_text = "per quarter"
-            else:
-                payment_amount = yearly_price / 12
-                payment_text = "per month"
+            with col1:
+                include_implementation = st.checkbox(
+                    "Include Implementation Services",
+                    help="Add one-time implementation cost"
+                )
                 
-            yearly_breakdown.append({
-                "Year": year + 1,
-                "Total Annual Cost": f"₹{yearly_price:,.2f}",
-                f"Payment Amount ({payment_cycle_custom})": f"₹{payment_amount:,.2f} {payment_text}",
-                "Monthly Equivalent": f"₹{yearly_price/12:,.2f}"
-            })
+                custom_discount = st.number_input(
+                    "Additional Custom Discount (%)",
+                    min_value=0,
+                    max_value=20,
+                    value=0,
+                    help="Enter any additional approved discount"
+                )
+                student_count_analysis = st.number_input(
+                    "Number of Students",
+                    min_value=1,
+                    value=100,
+                    help="Total number of students in the institution",
+                    key="analysis_tab_student_count"
+                )
+                
+                hourly_value = st.number_input(
+                    "Value of Student Hour (₹)",
+                    min_value=100,
+                    value=500,
+                    key="analysis_tab_hourly_value"
+                )
+
+            with col2:
+                add_support_package = st.checkbox(
+                    "Add Premium Support Package",
+                    help="Include premium support services"
+                )
+                
+                custom_terms = st.text_area(
+                    "Custom Terms",
+                    help="Enter any special terms or conditions"
+                )
 
-        st.table(pd.DataFrame(yearly_breakdown))
+                # Quote inputs; each tab keeps its own so it can run on its own
+                institution_category = st.selectbox(
+                    "Institution Category",
+                    ["Higher Capacity", "Limited Capacity"],
+                    key="analysis_tab_category"
+                )
+                payment_cycle_analysis = st.selectbox(
+                    "Payment Cycle",
+                    ["Monthly", "Quarterly", "Annual"],
+                    key="analysis_tab_payment_cycle"
+                )
+                commitment_years_analysis = st.slider(
+                    "Commitment Period (Years)",
+                    min_value=1,
+                    max_value=5,
+                    value=1,
+                    key="analysis_tab_commitment_years"
+                )
 
-        # Financial Impact Analysis
-        st.subheader("Financial Impact Analysis")
-        
-        total_standard_cost = (standard_price * (1 - total_discount) * 
-                             12 * student_count_custom * commitment_years_custom)
-        total_custom_cost = (final_monthly_price * 12 * student_count_custom * 
-                           commitment_years_custom)
-        
-        cost_difference = total_custom_cost - total_standard_cost
-        
-        col1, col2, col3 = st.columns(3)
-        
-        with col1:
-            st.metric(
-                "Total Contract Value",
-                f"₹{total_custom_cost:,.2f}",
-                f"₹{cost_difference:,.2f} vs Standard"
+            # Price the quote
+            base_monthly_price = pricing.base_monthly_price(student_count_analysis, institution_category)
+            total_discount = pricing.total_discount(payment_cycle_analysis, commitment_years_analysis)
+            discounted_monthly_price = base_monthly_price * (1 - total_discount)
+            yearly_prices = pricing.yearly_prices(
+                discounted_monthly_price * 12 * student_count_analysis,
+                commitment_years_analysis
             )
+
+            # Calculate additional costs
+            implementation_cost = 50000 if include_implementation else 0
+            support_cost = yearly_prices[0] * 0.10 if add_support_package else 0
             
-        with col2:
-            monthly_difference = cost_difference / (12 * commitment_years_custom)
-            st.metric(
-                "Monthly Impact",
-                f"₹{monthly_difference:,.2f}",
-                "vs Standard Pricing"
-            )
+            # Apply custom discount
+            final_yearly_prices = [
+                price * (1 - custom_discount/100) 
+                for price in yearly_prices
+            ]
+
+            # Display comprehensive pricing analysis
+            st.subheader("Comprehensive Pricing Breakdown")
             
-        with col3:
-            per_student_impact = monthly_difference / student_count_custom
-            st.metric(
-                "Per Student Impact",
-                f"₹{per_student_impact:,.2f}",
-                "Monthly per Student"
-            )
+            col1, col2 = st.columns(2)
+            
+            with col1:
+                st.metric(
+                    "Total Contract Value",
+                    f"₹{sum(final_yearly_prices) + implementation_cost + support_cost:,.2f}"
+                )
+                
+            with col2:
+                avg_monthly_cost = (
+                    sum(final_yearly_prices) + implementation_cost + support_cost
+                ) / (commitment_years_analysis * 12)
+                
+                st.metric(
+                    "Average Monthly Cost",
+                    f"₹{avg_monthly_cost:,.2f}"
+                )
 
-        # Approval Requirements
-        st.subheader("Approval Requirements")
-        
-        if difference_from_standard <= -10:
-            st.warning("⚠️ Requires Director Approval - Price more than 10% below standard")
-        elif difference_from_standard <= -5:
-            st.warning("⚠️ Requires Sales Manager Approval - Price 5-10% below standard")
-        else:
-            st.success("✓ Within standard approval limits")
-
-        # Generate custom proposal
-        if st.button("Generate Custom Proposal"):
-            proposal_text = f"""
-            # Acolyte Custom Pricing Proposal
-
-            ## Institution Details
-            - Number of Students: {student_count_custom}
-            - Payment Cycle: {payment_cycle_custom}
-            - Commitment Period: {commitment_years_custom} years
-
-            ## Custom Pricing Structure
-            - Standard Monthly Price per Student: ₹{standard_price:,.2f}
-            - Custom Monthly Price per Student: ₹{custom_price:,.2f}
-            - Price Adjustment: {difference_from_standard:+.1f}%
-            - Applied Discounts: {total_discount*100:.1f}%
-            - Final Monthly Price per Student: ₹{final_monthly_price:,.2f}
-
-            ## Total Investment
-            - Total Contract Value: ₹{total_custom_cost:,.2f}
-            - Difference from Standard: ₹{cost_difference:,.2f}
-            - Monthly Impact: ₹{monthly_difference:,.2f}
-
-            ## Additional Terms
-            {chr(10).join([f"- {term}" for term in additional_terms])}
-
-            ## Special Terms & Conditions
-            {special_notes if special_notes else "Standard terms and conditions apply"}
-
-            ## Approval Requirements
-            {("Requires Director Approval" if difference_from_standard <= -10 else "Requires Sales Manager Approval" if difference_from_standard <= -5 else "Within standard approval limits")}
-            """
+            # Create detailed cost breakdown
+            st.subheader("Detailed Cost Structure")
             
-            st.download_button(
-                "Download Custom Proposal",
-                proposal_text,
-                file_name="acolyte_custom_pricing_proposal.md",
-                mime="text/markdown"
-            )
-    with tab3:
-        st.header("Detailed Pricing Analysis")
+            detailed_costs = pd.DataFrame({
+                "Component": [
+                    "Base License Cost",
+                    "Implementation Services",
+                    "Premium Support",
+                    "Custom Discount",
+                    "Total"
+                ],
+                "Cost": [
+                    f"₹{sum(yearly_prices):,.2f}",
+                    f"₹{implementation_cost:,.2f}",
+                    f"₹{support_cost:,.2f}",
+                    f"-₹{sum(yearly_prices) * (custom_discount/100):,.2f}",
+                    f"₹{sum(final_yearly_prices) + implementation_cost + support_cost:,.2f}"
+                ]
+            })
+            
+            st.table(detailed_costs)
 
-        # Additional inputs for detailed analysis
-        col1, col2 = st.columns(2)
-        
-        with col1:
-            include_implementation = st.checkbox(
-                "Include Implementation Services",
-                help="Add one-time implementation cost"
-            )
+            # ROI Calculator
+            st.subheader("ROI Calculator")
             
-            custom_discount = st.number_input(
-                "Additional Custom Discount (%)",
-                min_value=0,
-                max_value=20,
-                value=0,
-                help="Enter any additional approved discount"
-            )
-            student_count_analysis = st.number_input(
-                "Number of Students",
+            avg_student_hours_saved = st.slider(
+                "Average Hours Saved per Student per Month",
                 min_value=1,
-                value=100,
-                help="Total number of students in the institution",
-                key="analysis_tab_student_count"
+                max_value=20,
+                value=5
             )
             
             hourly_value = st.number_input(
                 "Value of Student Hour (₹)",
                 min_value=100,
                 value=500,
-                key="analysis_tab_hourly_value"
-            )
-
-        with col2:
-            add_support_package = st.checkbox(
-                "Add Premium Support Package",
-                help="Include premium support services"
+                key="hourly_value_input"
             )
             
-            custom_terms = st.text_area(
-                "Custom Terms",
-                help="Enter any special terms or conditions"
+            monthly_savings = (
+                student_count_analysis * avg_student_hours_saved * hourly_value
             )
-
-        # Calculate additional costs
-        implementation_cost = 50000 if include_implementation else 0
-        support_cost = yearly_prices[0] * 0.10 if add_support_package else 0
-        
-        # Apply custom discount
-        final_yearly_prices = [
-            price * (1 - custom_discount/100) 
-            for price in yearly_prices
-        ]
-
-        # Display comprehensive pricing analysis
-        st.subheader("Comprehensive Pricing Breakdown")
-        
-        col1, col2 = st.columns(2)
-        
-        with col1:
-            st.metric(
-                "Total Contract Value",
-                f"₹{sum(final_yearly_prices) + implementation_cost + support_cost:,.2f}"
-            )
-            
-        with col2:
-            avg_monthly_cost = (
-                sum(final_yearly_prices) + implementation_cost + support_cost
-            ) / (commitment_years_custom * 12)
             
-            st.metric(
-                "Average Monthly Cost",
-                f"₹{avg_monthly_cost:,.2f}"
-            )
-
-        # Create detailed cost breakdown
-        st.subheader("Detailed Cost Structure")
-        
-        detailed_costs = pd.DataFrame({
-            "Component": [
-                "Base License Cost",
-                "Implementation Services",
-                "Premium Support",
-                "Custom Discount",
-                "Total"
-            ],
-            "Cost": [
-                f"₹{sum(yearly_prices):,.2f}",
-                f"₹{implementation_cost:,.2f}",
-                f"₹{support_cost:,.2f}",
-                f"-₹{sum(yearly_prices) * (custom_discount/100):,.2f}",
-                f"₹{sum(final_yearly_prices) + implementation_cost + support_cost:,.2f}"
-            ]
-        })
-        
-        st.table(detailed_costs)
-
-        # ROI Calculator
-        st.subheader("ROI Calculator")
-        
-        avg_student_hours_saved = st.slider(
-            "Average Hours Saved per Student per Month",
-            min_value=1,
-            max_value=20,
-            value=5
-        )
-        
-        hourly_value = st.number_input(
-            "Value of Student Hour (₹)",
-            min_value=100,
-            value=500,
-            key="hourly_value_input"
-        )
-        
-        monthly_savings = (
-            student_count_analysis * avg_student_hours_saved * hourly_value
-        )
-        
-        annual_savings = monthly_savings * 12
-        total_investment = sum(final_yearly_prices) + implementation_cost + support_cost
-        roi = (annual_savings - total_investment) / total_investment * 100
-        payback_months = total_investment / monthly_savings
-        
-        col1, col2, col3 = st.columns(3)
-        
-        with col1:
-            st.metric(
-                "Annual Cost Savings",
-                f"₹{annual_savings:,.2f}"
-            )
+            annual_savings = monthly_savings * 12
+            total_investment = sum(final_yearly_prices) + implementation_cost + support_cost
+            roi = (annual_savings - total_investment) / total_investment * 100
+            payback_months = total_investment / monthly_savings
             
-        with col2:
-            st.metric(
-                "ROI (%)",
-                f"{roi:.1f}%"
-            )
+            col1, col2, col3 = st.columns(3)
             
-        with col3:
-            st.metric(
-                "Payback Period",
-                f"{payback_months:.1f} months"
-            )
+            with col1:
+                st.metric(
+                    "Annual Cost Savings",
+                    f"₹{annual_savings:,.2f}"
+                )
+                
+            with col2:
+                st.metric(
+                    "ROI (%)",
+                    f"{roi:.1f}%"
+                )
+                
+            with col3:
+                st.metric(
+                    "Payback Period",
+                    f"{payback_months:.1f} months"
+                )
 
-        # Generate proposal
-        if st.button("Generate Proposal"):
-            proposal_text = f"""
-            # Acolyte Pricing Proposal
-
-            ## Institution Details
-            - Number of Students: {student_count_analysis}
-            - Category: {institution_category}
-            - Payment Cycle: {payment_cycle_custom}
-            - Commitment Period: {commitment_years_custom} years
-
-            ## Pricing Structure
-            - Base Monthly Price per Student: ₹{base_monthly_price:,.2f}
-            - Applied Discounts: {total_discount*100:.1f}%
-            - Final Monthly Price per Student: ₹{discounted_monthly_price:,.2f}
-
-            ## Total Investment
-            - Total Contract Value: ₹{sum(final_yearly_prices) + implementation_cost + support_cost:,.2f}
-            - Average Monthly Cost: ₹{avg_monthly_cost:,.2f}
-
-            ## Return on Investment
-            - Annual Cost Savings: ₹{annual_savings:,.2f}
-            - ROI: {roi:.1f}%
-            - Payback Period: {payback_months:.1f} months
-
-            ## Terms and Conditions
-            {custom_terms if custom_terms else "Standard terms and conditions apply"}
-            """
-            
-            st.download_button(
-                "Download Proposal",
-                proposal_text,
-                file_name="acolyte_pricing_proposal.md",
-                mime="text/markdown"
-            )
+            # Generate proposal
+            if st.button("Generate Proposal"):
+                proposal_text = f"""
+                # Acolyte Pricing Proposal
+
+                ## Institution Details
+                - Number of Students: {student_count_analysis}
+                - Category: {institution_category}
+                - Payment Cycle: {payment_cycle_analysis}
+                - Commitment Period: {commitment_years_analysis} years
+
+                ## Pricing Structure
+                - Base Monthly Price per Student: ₹{base_monthly_price:,.2f}
+                - Applied Discounts: {total_discount*100:.1f}%
+                - Final Monthly Price per Student: ₹{discounted_monthly_price:,.2f}
+
+                ## Total Investment
+                - Total Contract Value: ₹{sum(final_yearly_prices) + implementation_cost + support_cost:,.2f}
+                - Average Monthly Cost: ₹{avg_monthly_cost:,.2f}
+
+                ## Return on Investment
+                - Annual Cost Savings: ₹{annual_savings:,.2f}
+                - ROI: {roi:.1f}%
+                - Payback Period: {payback_months:.1f} months
+
+                ## Terms and Conditions
+                {custom_terms if custom_terms else "Standard terms and conditions apply"}
+                """
+                
+                st.download_button(
+                    "Download Proposal",
+                    proposal_text,
+                    file_name="acolyte_pricing_proposal.md",
+                    mime="text/markdown"
+                )
 def main():
     st.title("Acolyte Sales Tool")
     
     menu = st.sidebar.selectbox(
         "Select Function",
-        ["Add New Lead", "View Lead Dashboard", "Pipeline Analysis", 
+        ["Add New Lead", "Import Leads", "View Lead Dashboard", "Pipeline Analysis", 
          "Revenue Forecasting", "Territory Analytics", "Pricing Calculator",
          "Lead Analytics"]
     )
     
     if menu == "Add New Lead":
         create_lead_form()
+    elif menu == "Import Leads":
+        bulk_import_leads()
     elif menu == "View Lead Dashboard":
         view_lead_dashboard()
     elif menu == "Pipeline Analysis":
@@ -0,0 +1,94 @@
+import numpy as np
+
+# Monthly price per student by institution capacity category, as
+# (minimum student count, price) tiers from the largest breakpoint down
+PRICE_TIERS = {
+    "Higher Capacity": [(1000, 300.0), (500, 450.0), (0, 750.0)],
+    "Limited Capacity": [(501, 350.0), (301, 450.0), (0, 750.0)],
+}
+
+# Capacity category used when a lead does not record one
+DEFAULT_CAPACITY = "Higher Capacity"
+
+# Discount for paying less often than monthly
+CYCLE_DISCOUNTS = {"Monthly": 0.00, "Quarterly": 0.10, "Annual": 0.20}
+
+# Extra discount per commitment year beyond the first, on annual payment only
+COMMITMENT_DISCOUNT = 0.05
+COMMITMENT_CYCLES = ["Annual"]
+
+# Ceiling on the combined cycle and commitment discount
+MAX_DISCOUNT = 0.40
+
+# Yearly price increase over a multi-year contract
+INFLATION_RATE = 0.05
+
+
+def base_monthly_prices(student_counts, capacity=DEFAULT_CAPACITY):
+    """Vectorized base_monthly_price over an array of student counts
+
+    capacity may be a single category or an array with one per count.
+    """
+    student_counts = np.asarray(student_counts, dtype=float)
+    capacity = np.asarray(capacity, dtype=object)
+    prices = np.full(np.broadcast(student_counts, capacity).shape, np.nan)
+    for category, tiers in PRICE_TIERS.items():
+        in_category = capacity == category
+        if not np.any(in_category):
+            continue
+        tier_prices = np.select(
+            [student_counts >= minimum for minimum, _ in tiers[:-1]],
+            [price for _, price in tiers[:-1]],
+            tiers[-1][1]
+        )
+        prices = np.where(in_category, tier_prices, prices)
+    return prices
+
+
+def total_discounts(payment_cycles, commitment_years=1):
+    """Vectorized total_discount over arrays of payment cycles and commitments"""
+    payment_cycles = np.asarray(payment_cycles, dtype=object)
+    commitment_years = np.asarray(commitment_years, dtype=float)
+    cycle_discounts = np.select(
+        [payment_cycles == cycle for cycle in CYCLE_DISCOUNTS],
+        list(CYCLE_DISCOUNTS.values()),
+        0.0
+    )
+    commitment_discounts = np.where(
+        np.isin(payment_cycles, COMMITMENT_CYCLES),
+        np.maximum(commitment_years - 1, 0) * COMMITMENT_DISCOUNT,
+        0.0
+    )
+    return np.minimum(cycle_discounts + commitment_discounts, MAX_DISCOUNT)
+
+
+def deal_values(student_counts, payment_cycles, capacity=DEFAULT_CAPACITY, commitment_years=1):
+    """Vectorized deal_value; reprices any number of leads in one call"""
+    student_counts = np.asarray(student_counts, dtype=float)
+    monthly_prices = base_monthly_prices(student_counts, capacity) * (
+        1 - total_discounts(payment_cycles, commitment_years)
+    )
+    return monthly_prices, monthly_prices * 12 * student_counts
+
+
+def base_monthly_price(student_count, capacity=DEFAULT_CAPACITY):
+    """Standard monthly price per student before any discount"""
+    return float(base_monthly_prices(student_count, capacity))
+
+
+def total_discount(payment_cycle, commitment_years=1):
+    """Combined payment cycle and commitment discount, capped at MAX_DISCOUNT"""
+    return float(total_discounts(payment_cycle, commitment_years))
+
+
+def deal_value(student_count, payment_cycle, capacity=DEFAULT_CAPACITY, commitment_years=1):
+    """Return the discounted monthly price per student and annual deal value"""
+    monthly_price, annual_value = deal_values(
+        student_count, payment_cycle, capacity, commitment_years
+    )
+    return float(monthly_price), float(annual_value)
+
+
+def yearly_prices(first_year_price, years, inflation_rate=INFLATION_RATE):
+    """Contract price for each year of a commitment, rising with inflation"""
+    return first_year_price * (1 + inflation_rate) ** np.arange(years)